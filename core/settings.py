@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import sys
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -13,6 +14,9 @@ SECRET_KEY = 'b&78tle_hlmz5!1()mw46)72lua)sx_wo@28r6+ve+q^1('
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# `manage.py test`
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -43,22 +47,48 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_APPS + LOCAL_APPS
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'manuals.authentication.VersionedJWTAuthentication', # JWT + revocación por Profile.token_version
         'rest_framework.authentication.SessionAuthentication', # Opcional: para el navegador/admin
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated', # Por defecto, requiere autenticación
     ),
+    # Contadores compartidos por todos los workers, en la base de datos (manuals/throttling.py)
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'manuals.throttling.AnonRateThrottle',
+        'manuals.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/day',  # 10 requests per day for unauthenticated users
-        'user': '100/day' # 100 requests per day for authenticated users
-    }
+        'user': '100/day', # 100 requests per day for authenticated users
+        'uploads': '2000/day', # Partes de subidas reanudables (/api/v1/uploads/)
+        'manual_detail': '30/hour', # Detalle de manual (anida procedimientos y archivos)
+        'files_upload': '20/hour', # Subida/edición directa de archivos (/api/v1/files/)
+    },
+    # Paginación por cursor (keyset) según el Meta.ordering de cada modelo
+    'DEFAULT_PAGINATION_CLASS': 'manuals.pagination.ModelOrderingCursorPagination',
+    'PAGE_SIZE': 25,
 }
 
+# Tamaño de página máximo que un cliente puede pedir con ?page_size=
+API_MAX_PAGE_SIZE = 100
+
+# Listados de manuales, procedimientos y archivos serializados desde .values()
+# (manuals/fast_serializers.py); False vuelve a los serializadores de DRF
+API_FAST_SERIALIZERS = True
+
+# Máximo de operaciones en POST .../batch/ y de ids en ?ids= (batch.py)
+API_BATCH_MAX_OPERATIONS = 100
+
+# Filas por bloque en los listados en streaming (?stream=, /api/v1/export/)
+API_STREAM_CHUNK_SIZE = 500
+
+# Filas por lote de bulk_create/bulk_update en import_catalogue (y por bloque en export_catalogue)
+CATALOGUE_IMPORT_BATCH_SIZE = 1000
+
+# Probabilidad de que una comprobación de throttle borre los contadores vencidos
+THROTTLE_CLEANUP_PROBABILITY = 0.001
+
 
 
 DJANGO_MIDDLEWARE = [ 
@@ -102,12 +132,142 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db2.sqlite3',
+# Se elige por entorno: DB_ENGINE=sqlite (por defecto) o postgres.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+# Segundos que se reutiliza una conexión entre peticiones (0 = una por petición)
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'manuals'),
+            'USER': os.environ.get('DB_USER', 'manuals'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Comprueba la conexión reutilizada antes de usarla (p. ej. tras reiniciar Postgres)
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': 5},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # Pool de psycopg 3 (pip install "psycopg[pool]"); no admite CONN_MAX_AGE
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': 10,
+        }
+    if os.environ.get('DB_REPLICA_HOST'):
+        # Réplica de lectura para los ViewSets del catálogo (manuals/db_routers.py)
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['DB_REPLICA_HOST'],
+            'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db2.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Al abrir cada conexión: WAL (los lectores no esperan al escritor),
+                # fsync solo en los checkpoints y lecturas por mmap (256 MB)
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+                # Espera (busy timeout, en segundos) en lugar de "database is locked"
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 20)),
+                # Las transacciones toman el bloqueo de escritura al empezar: sin
+                # errores al pasar de lectura a escritura con varios escritores
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+
+# Réplica: lecturas (GET) de los ViewSets del catálogo. Tras escribir, un
+# usuario lee del primario durante REPLICA_READ_YOUR_WRITES_SECONDS (la marca
+# es Profile.last_write_at, en el primario: vale para todos los workers).
+DATABASE_ROUTERS = ['manuals.db_routers.ReadReplicaRouter'] if 'replica' in DATABASES else []
+REPLICA_READ_YOUR_WRITES_SECONDS = int(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', 10))
+
+
+# Caché
+# El alias 'api' guarda las respuestas del catálogo, sus versiones y las de
+# los tokens (manuals/cache.py). Tiene que ser compartido por todos los
+# workers, o una escritura solo invalidaría la caché del proceso que la hizo:
+# por eso 'file' por defecto. 'locmem' (por proceso) solo con un único
+# proceso, y en los tests.
+API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'locmem' if TESTING else 'file')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'api'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    } if API_CACHE_BACKEND == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
+API_CACHE_ALIAS = 'api'
+API_CACHE_TIMEOUT = 300 # segundos
+# Versión de token (manuals/authentication.py): cuánto puede tardar otro proceso
+# en rechazar un token de acceso revocado. Los refrescos van siempre a la base de datos.
+TOKEN_VERSION_CACHE_SECONDS = 30
+
+
+# Sincronización delta (/api/v1/sync/): margen hacia atrás aplicado al token
+# para no perder escrituras confirmadas después de generarlo.
+SYNC_OVERLAP_SECONDS = 60
+# Pasado este tiempo el token caduca y el cliente debe hacer una sincronización
+# completa; las marcas de borrado más antiguas ya no hacen falta.
+SYNC_TOKEN_MAX_AGE_DAYS = 30
+
+
+# Auditoría (manuals/audit.py): los LogEntry se acumulan en memoria y se
+# guardan por lotes en segundo plano. AUDITLOG_ASYNC=0 vuelve a la escritura
+# síncrona de auditlog (una inserción por cambio dentro de la petición).
+# En los tests no hay hilo (escribiría fuera de la transacción de cada test) y
+# la auditoría es síncrona salvo que se pida AUDITLOG_ASYNC=1.
+AUDITLOG_ASYNC = os.environ.get('AUDITLOG_ASYNC', '0' if TESTING else '1') == '1'
+AUDITLOG_WRITER_THREAD = not TESTING
+AUDITLOG_BUFFER_SIZE = 10000 # entradas en memoria antes de vaciar en la propia petición
+AUDITLOG_BATCH_SIZE = 500
+AUDITLOG_FLUSH_INTERVAL = 1.0 # segundos
+AUDITLOG_RETRIES = 3 # reintentos de cada lote si falla la base de datos
+AUDITLOG_RETRY_DELAY = 0.5 # segundos antes del primer reintento (se duplica en cada uno)
+
+
+# Logins fallidos (manuals/login_failures.py): un LogEntry resumen por
+# (usuario, IP) cada LOGIN_FAILURE_WINDOW segundos. Con LOGIN_LOCKOUT_THRESHOLD
+# se rechazan los logins de ese par tras N fallos dentro de la ventana.
+LOGIN_FAILURE_WINDOW = 60 # segundos
+LOGIN_LOCKOUT_THRESHOLD = int(os.environ.get('LOGIN_LOCKOUT_THRESHOLD', 0)) or None
+
+# Avatares (manuals/avatars.py): recortes cuadrados en WebP y JPEG generados en
+# segundo plano tras subir el avatar. AVATAR_ASYNC=0 los genera al confirmar
+# la transacción, en la propia petición.
+AVATAR_ASYNC = os.environ.get('AVATAR_ASYNC', '1') == '1'
+AVATAR_SIZES = (48, 96, 256) # px
+AVATAR_MAX_PIXELS = 24_000_000 # se rechazan imágenes mayores (bombas de descompresión)
+AVATAR_WORKERS = 1
+
+AUTHENTICATION_BACKENDS = [
+    'manuals.login_failures.LockoutModelBackend', # ModelBackend + bloqueo opcional
+]
 
 
 # Password validation
@@ -146,6 +306,19 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Subidas por partes (reanudables) de archivos adjuntos.
+# Las partes se guardan en CHUNKED_UPLOAD_DIR (por defecto BASE_DIR/uploads_tmp),
+# que debe estar en el mismo disco que MEDIA_ROOT para mover el archivo sin copiarlo.
+CHUNKED_UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # 1 GB por archivo
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB por parte
+
+# Descargas de /api/v1/files/{id}/download/:
+#   'django'   -> Django envía el archivo (desarrollo, o sin proxy delante)
+#   'nginx'    -> X-Accel-Redirect hacia DOCUMENT_DOWNLOAD_ACCEL_PREFIX (location `internal` de nginx)
+#   'sendfile' -> X-Sendfile con la ruta absoluta (Apache mod_xsendfile, lighttpd)
+DOCUMENT_DOWNLOAD_BACKEND = os.environ.get('DOCUMENT_DOWNLOAD_BACKEND', 'django')
+DOCUMENT_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -176,14 +349,15 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'manuals.authentication.ClaimsUser',
     'JTI_CLAIM': 'jti',
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 
-    'TOKEN_OBTAIN_SERIALIZER': 'rest_framework_simplejwt.serializers.TokenObtainPairSerializer',
-    'TOKEN_REFRESH_SERIALIZER': 'rest_framework_simplejwt.serializers.TokenRefreshSerializer',
+    # Añaden is_staff, groups y token_version a los tokens (manuals/authentication.py)
+    'TOKEN_OBTAIN_SERIALIZER': 'manuals.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'manuals.authentication.ClaimsTokenRefreshSerializer',
     'TOKEN_VERIFY_SERIALIZER': 'rest_framework_simplejwt.serializers.TokenVerifySerializer',
     'TOKEN_BLACKLIST_SERIALIZER': 'rest_framework_simplejwt.serializers.TokenBlacklistSerializer',
     'TOKEN_SLIDING_SERIALIZER': 'rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer',
@@ -238,4 +412,9 @@ CORS_ALLOW_ALL_ORIGINS = True # NO USAR EN PRODUCCIÓN
 REQUIRED_APP_KEY = os.environ.get(
     'API_KEY', # Nombre de la variable de entorno para producción
     'XYZ123ABC456DEF789' # CLAVE REAL PARA DESARROLLO (REEMPLAZA)
-)
\ No newline at end of file
+)
+
+# Claves adicionales aceptadas, para rotar sin dejar fuera a las apps ya
+# instaladas: se añade la nueva aquí, se publica la app y luego se retira la vieja.
+# Variable de entorno: API_KEYS=clave1,clave2
+APP_KEYS = [key.strip() for key in os.environ.get('API_KEYS', '').split(',') if key.strip()]
\ No newline at end of file
@@ -4,6 +4,7 @@ from django.contrib import admin
 # manuals/admin.py
 from django.utils.html import mark_safe
 from .models import Category, Manual, Procedure, DocumentFile, Profile
+from . import avatars
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User, Group # Importa Group
 
@@ -68,7 +69,9 @@ class DocumentFileAdmin(admin.ModelAdmin):
     )
 
     def file_name(self, obj):
-        return obj.file.name.split('/')[-1] if obj.file else "No file"
+        if not obj.file:
+            return "No file"
+        return obj.original_name or obj.file.name.split('/')[-1]
     file_name.short_description = 'File Name'
 
     def previous_version_link(self, obj):
@@ -115,7 +118,7 @@ class ProfileInline(admin.StackedInline):
 
     def avatar_preview(self, obj):
         if obj.avatar:
-            return mark_safe(f'<img src="{obj.avatar.url}" width="100" height="100" />')
+            return mark_safe(f'<img src="{avatars.preview_url(obj, 100)}" width="100" height="100" />')
         return "No hay avatar"
     avatar_preview.short_description = 'Previsualización del Avatar'
 
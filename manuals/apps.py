@@ -7,4 +7,7 @@ class ManualsConfig(AppConfig):
     verbose_name = 'Manuales & Procedimientos'
 
     def ready(self):
-        import manuals.signals # Importa tus señales aquí
\ No newline at end of file
+        import manuals.signals # Importa tus señales aquí
+        from manuals import audit, login_failures
+        audit.install()
+        audit.buffer.add_collector(login_failures.recorder.collect)
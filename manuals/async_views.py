@@ -0,0 +1,136 @@
+# manuals/async_views.py
+"""
+Vistas async de solo lectura del catálogo (/api/v1/async/...).
+
+Son vistas de Django (no DRF, que no admite vistas async) pensadas para
+servirse con ASGI: mientras un cliente móvil lento recibe su respuesta, el
+worker sigue atendiendo otras peticiones en el mismo bucle de eventos. Usan
+los mismos serializadores y prefetch que los ViewSets, la autenticación por
+claims del token (sin cargar el usuario) y los mismos throttles.
+
+La paginación es por clave (`?after=<id>&page_size=`) en orden de id, porque
+el cursor de DRF necesita un QuerySet síncrono.
+
+Nota: el ORM async de Django ejecuta las consultas en un hilo por debajo; lo
+que se gana es no ocupar un hilo por conexión abierta.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .authentication import aauthenticate
+from .models import Category, Manual, Procedure
+from .serializers import CategorySerializer, ManualListSerializer, ManualSerializer, ProcedureSerializer
+from .throttling import AnonRateThrottle, UserRateThrottle
+from .views import latest_document_files_prefetch
+
+THROTTLE_CLASSES = (AnonRateThrottle, UserRateThrottle)
+
+
+def error(detail, status, **headers):
+    return JsonResponse({'detail': detail}, status=status, headers=headers)
+
+
+def json_response(data):
+    return JsonResponse(data, encoder=JSONEncoder, safe=False)
+
+
+async def prepare(request):
+    """Autentica y aplica los throttles; devuelve una respuesta de error o None."""
+    if request.method not in ('GET', 'HEAD'):
+        return error("Método no permitido.", 405, Allow='GET, HEAD')
+    try:
+        request.user = await aauthenticate(request)
+    except (AuthenticationFailed, InvalidToken) as exc:
+        return error(exc.detail, 401, **{'WWW-Authenticate': 'Bearer realm="api"'})
+
+    for throttle_class in THROTTLE_CLASSES:
+        throttle = throttle_class()
+        # El contador está en la base de datos (throttling.py)
+        if not await sync_to_async(throttle.allow_request)(request, None):
+            wait = throttle.wait()
+            headers = {'Retry-After': str(int(wait))} if wait is not None else {}
+            return error("Solicitud limitada.", 429, **headers)
+    return None
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('page_size', api_settings.PAGE_SIZE))
+    except ValueError:
+        size = api_settings.PAGE_SIZE
+    return max(1, min(size, getattr(settings, 'API_MAX_PAGE_SIZE', 100)))
+
+
+async def paginated_list(request, queryset, serializer_class, filters=()):
+    response = await prepare(request)
+    if response is not None:
+        return response
+
+    lookups = {field: request.GET[field] for field in filters if request.GET.get(field)}
+    after = request.GET.get('after')
+    if after:
+        lookups['pk__gt'] = after
+    size = page_size(request)
+    try:
+        queryset = queryset.filter(**lookups).order_by('pk')
+        # Una fila de más indica si hay página siguiente
+        rows = [row async for row in queryset[:size + 1].aiterator(chunk_size=size + 1)]
+    except (ValueError, TypeError):
+        return error("Parámetros inválidos.", 400)
+
+    next_url = None
+    if len(rows) > size:
+        rows = rows[:size]
+        query = request.GET.copy()
+        query['after'] = rows[-1].pk
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+    serializer = serializer_class(rows, many=True, context={'request': request})
+    return json_response({'next': next_url, 'results': serializer.data})
+
+
+async def detail(request, queryset, serializer_class, pk):
+    response = await prepare(request)
+    if response is not None:
+        return response
+    try:
+        instance = await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        return error("No encontrado.", 404)
+    return json_response(serializer_class(instance, context={'request': request}).data)
+
+
+async def category_list(request):
+    return await paginated_list(request, Category.objects.all(), CategorySerializer)
+
+
+async def category_detail(request, pk):
+    return await detail(request, Category.objects.all(), CategorySerializer, pk)
+
+
+async def manual_list(request):
+    queryset = Manual.objects.select_related('category')
+    return await paginated_list(request, queryset, ManualListSerializer, filters=('category',))
+
+
+async def manual_detail(request, pk):
+    queryset = Manual.objects.select_related('category').prefetch_related(
+        Prefetch('procedures', queryset=Procedure.objects.order_by('title', '-version')),
+        latest_document_files_prefetch('procedures__document_files'),
+    )
+    return await detail(request, queryset, ManualSerializer, pk)
+
+
+async def procedure_list(request):
+    queryset = Procedure.objects.prefetch_related(latest_document_files_prefetch())
+    return await paginated_list(request, queryset, ProcedureSerializer, filters=('manual',))
+
+
+async def procedure_detail(request, pk):
+    queryset = Procedure.objects.prefetch_related(latest_document_files_prefetch())
+    return await detail(request, queryset, ProcedureSerializer, pk)
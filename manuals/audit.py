@@ -0,0 +1,331 @@
+# manuals/audit.py
+"""
+Escritura diferida y por lotes del registro de auditoría (django-auditlog).
+
+Con `AUDITLOG_ASYNC` activo, los receptores de auditlog de los modelos de
+esta app se sustituyen por otros que calculan el diff dentro de la petición
+(igual que auditlog) pero, en lugar de insertar el LogEntry en el momento,
+lo dejan en un búfer acotado en memoria al confirmarse la transacción. Un
+hilo en segundo plano lo vacía con `bulk_create` cada
+`AUDITLOG_FLUSH_INTERVAL` segundos o cuando junta `AUDITLOG_BATCH_SIZE`
+entradas, y al salir el proceso se vacía lo pendiente (atexit).
+
+Si la base de datos falla, cada lote se reintenta `AUDITLOG_RETRIES` veces
+esperando cada vez el doble (desde `AUDITLOG_RETRY_DELAY`); si aun así no
+se guarda, vuelve a quedar pendiente para la siguiente vuelta. Solo se
+descartan entradas (con un error en el log) si lo pendiente supera el
+tamaño del búfer o si al salir del proceso la base de datos sigue fallando.
+Con `AUDITLOG_WRITER_THREAD = False` (tests) no hay hilo: todo se guarda al
+llamar a `flush()`, en la conexión y transacción de quien lo llama.
+
+Si el búfer se llena, quien escribe lo vacía él mismo (contrapresión en vez
+de perder entradas). Con `AUDITLOG_ASYNC = False` se usan los receptores
+originales de auditlog (escritura síncrona).
+"""
+import atexit
+import collections
+import logging
+import queue
+import threading
+import time
+
+from auditlog.cid import get_cid
+from auditlog.context import auditlog_disabled
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from auditlog.receivers import check_disable, log_create, log_delete, log_update
+from auditlog.registry import auditlog
+from auditlog.signals import post_log, pre_log
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.db.models.signals import pre_save
+from django.utils import timezone
+from django.utils.encoding import smart_str
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    """Cola acotada de LogEntry sin guardar y el hilo que la vacía."""
+
+    def __init__(self, max_size, batch_size, interval, retries=3, retry_delay=0.5, threaded=True):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.threaded = threaded
+        self._failed = collections.deque() # lotes que no se pudieron guardar
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """
+        Registra `collector(force)`, llamado por el hilo en cada vuelta: devuelve
+        LogEntry ya listos para guardar (ej. resúmenes de logins fallidos).
+        """
+        self._collectors.append(collector)
+
+    def _collect(self, force=False):
+        for collector in self._collectors:
+            try:
+                entries = collector(force)
+            except Exception:
+                logger.exception("Error al recoger entradas de auditoría")
+                continue
+            for entry in entries:
+                self.put(entry)
+
+    def put(self, entry):
+        self.start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            # Búfer lleno: se vacía en este hilo antes de seguir
+            self.flush()
+            self.queue.put(entry)
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Guarda `batch` con reintentos; si no lo consigue, lo deja pendiente y devuelve False."""
+        if not batch:
+            return True
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                LogEntry.objects.bulk_create(batch, batch_size=self.batch_size)
+                return True
+            except Exception:
+                logger.warning("Error al guardar %d entradas de auditoría (intento %d)",
+                               len(batch), attempt + 1, exc_info=True)
+            if attempt < self.retries:
+                self._sleep(delay)
+                delay *= 2
+        logger.error("No se pudieron guardar %d entradas de auditoría; quedan pendientes", len(batch))
+        self._failed.append(batch)
+        pending = sum(len(failed) for failed in self._failed)
+        while pending > self.max_size and len(self._failed) > 1:
+            dropped = self._failed.popleft()
+            pending -= len(dropped)
+            logger.error("Se descartan %d entradas de auditoría: demasiadas pendientes", len(dropped))
+        return False
+
+    def _sleep(self, seconds):
+        # El hilo deja de esperar al apagarse el proceso (shutdown reintenta lo que quede)
+        if threading.current_thread() is self._thread:
+            self._stop.wait(seconds)
+            # Su conexión puede haber quedado inservible tras el error
+            close_old_connections()
+        else:
+            time.sleep(seconds)
+
+    def _write_failed(self):
+        for _ in range(len(self._failed)):
+            try:
+                batch = self._failed.popleft()
+            except IndexError:
+                return True
+            if not self._write(batch):
+                return False
+        return True
+
+    def pending(self):
+        return self.queue.qsize() + sum(len(batch) for batch in self._failed)
+
+    def flush(self):
+        """Guarda todo lo pendiente en el hilo actual, también los lotes que fallaron antes."""
+        if not self._write_failed():
+            return False
+        batch = self._drain()
+        while batch:
+            if not self._write(batch):
+                return False
+            batch = self._drain()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._collect()
+            if self._failed and not self._write_failed():
+                # La base de datos sigue fallando: se espera a la siguiente vuelta
+                close_old_connections()
+                self._stop.wait(self.interval)
+                continue
+            try:
+                first = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            self._write(self._drain(first))
+            # El hilo tiene su propia conexión: se respeta CONN_MAX_AGE
+            close_old_connections()
+
+    def start(self):
+        if not self.threaded or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='auditlog-writer', daemon=True)
+                self._thread.start()
+
+    def shutdown(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._collect(force=True)
+        # En este hilo, con los reintentos de cada lote
+        if not self.flush():
+            logger.error("Se pierden %d entradas de auditoría al salir", self.pending())
+
+
+buffer = AuditBuffer(
+    max_size=getattr(settings, 'AUDITLOG_BUFFER_SIZE', 10000),
+    batch_size=getattr(settings, 'AUDITLOG_BATCH_SIZE', 500),
+    interval=getattr(settings, 'AUDITLOG_FLUSH_INTERVAL', 1.0),
+    retries=getattr(settings, 'AUDITLOG_RETRIES', 3),
+    retry_delay=getattr(settings, 'AUDITLOG_RETRY_DELAY', 0.5),
+    threaded=getattr(settings, 'AUDITLOG_WRITER_THREAD', True),
+)
+
+
+def build_entry(instance, action, changes):
+    """
+    LogEntry sin guardar con los mismos campos que rellena
+    `LogEntry.objects.log_create`.
+    """
+    pk = LogEntry.objects._get_pk_value(instance)
+    try:
+        object_repr = smart_str(instance)
+    except Exception:
+        object_repr = ''
+    entry = LogEntry(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_pk=pk,
+        object_id=pk if isinstance(pk, int) else None,
+        object_repr=object_repr,
+        serialized_data=LogEntry.objects._get_serialized_data_or_none(instance),
+        action=action,
+        changes=changes,
+        cid=get_cid(),
+        timestamp=timezone.now(),
+    )
+    get_additional_data = getattr(instance, 'get_additional_data', None)
+    if callable(get_additional_data):
+        entry.additional_data = get_additional_data()
+    # bulk_create no emite pre_save: se emite aquí para que `set_actor`
+    # (middleware de auditlog) asigne el actor y la IP de esta petición.
+    pre_save.send(sender=LogEntry, instance=entry, raw=False, using=None, update_fields=None)
+    return entry
+
+
+def log_bulk(action, pairs):
+    """
+    Audita escrituras hechas con bulk_create/bulk_update, que no emiten
+    señales. `pairs`: (antes, después) de cada objeto (None al crear).
+    """
+    if auditlog_disabled.get():
+        return
+    entries = []
+    for old, new in pairs:
+        changes = model_instance_diff(old, new)
+        if changes:
+            entries.append(build_entry(new if new is not None else old, action, changes))
+    if not entries:
+        return
+    if not getattr(settings, 'AUDITLOG_ASYNC', False):
+        LogEntry.objects.bulk_create(entries)
+        return
+
+    def enqueue():
+        for entry in entries:
+            buffer.put(entry)
+    transaction.on_commit(enqueue)
+
+
+def _enqueue(sender, instance, action, diff_old, diff_new, fields_to_check=None):
+    pre_log_results = pre_log.send(sender, instance=instance, action=action)
+    if any(result is False for _, result in pre_log_results):
+        return
+    changes = model_instance_diff(diff_old, diff_new, fields_to_check=fields_to_check)
+    if not changes:
+        return
+    entry = build_entry(instance, action, changes)
+    post_log.send(
+        sender, instance=instance, instance_old=diff_old, action=action, error=None,
+        pre_log_results=pre_log_results, changes=changes, log_entry=entry, log_created=True,
+    )
+    # Solo se audita lo que llega a confirmarse
+    transaction.on_commit(lambda: buffer.put(entry))
+
+
+@check_disable
+def buffered_log_create(sender, instance, created, **kwargs):
+    if created:
+        _enqueue(sender, instance, LogEntry.Action.CREATE, None, instance)
+
+
+@check_disable
+def buffered_log_update(sender, instance, **kwargs):
+    if not instance._state.adding and instance.pk is not None:
+        old = sender._default_manager.filter(pk=instance.pk).first()
+        _enqueue(
+            sender, instance, LogEntry.Action.UPDATE, old, instance,
+            fields_to_check=kwargs.get('update_fields'),
+        )
+
+
+@check_disable
+def buffered_log_delete(sender, instance, **kwargs):
+    if instance.pk is not None:
+        _enqueue(sender, instance, LogEntry.Action.DELETE, instance, None)
+
+
+BUFFERED_RECEIVERS = {
+    log_create: buffered_log_create,
+    log_update: buffered_log_update,
+    log_delete: buffered_log_delete,
+}
+
+
+def use_buffered_receivers(app_label='manuals', enabled=True):
+    """
+    Cambia los receptores de auditlog por los diferidos (o al revés, con
+    `enabled=False`) para los modelos de `app_label`. Los modelos siguen en el
+    registro global de auditlog, que es de donde el diff lee los campos
+    incluidos/excluidos.
+    """
+    for model in auditlog.get_models():
+        if model._meta.app_label != app_label:
+            continue
+        for signal, receiver in auditlog._signals.items():
+            buffered = BUFFERED_RECEIVERS.get(receiver)
+            if buffered is None:
+                continue
+            original_uid = auditlog._dispatch_uid(signal, receiver)
+            buffered_uid = ('manuals.audit', id(signal), model._meta.label)
+            if enabled:
+                signal.disconnect(sender=model, dispatch_uid=original_uid)
+                signal.connect(buffered, sender=model, dispatch_uid=buffered_uid)
+            else:
+                signal.disconnect(sender=model, dispatch_uid=buffered_uid)
+                signal.connect(receiver, sender=model, dispatch_uid=original_uid)
+
+
+def install(app_label='manuals'):
+    # El búfer también recibe los resúmenes de logins fallidos, así que se
+    # vacía al salir aunque la auditoría de modelos sea síncrona.
+    atexit.register(buffer.shutdown)
+    if getattr(settings, 'AUDITLOG_ASYNC', False):
+        use_buffered_receivers(app_label)
@@ -0,0 +1,191 @@
+# manuals/authentication.py
+"""
+Autenticación JWT con claims de rol y revocación por versión de token.
+
+Los tokens llevan `is_staff`, `groups` y `token_version` (Profile). Con
+`StatelessReadJWTAuthentication`, las lecturas (GET/HEAD/OPTIONS) del
+catálogo confían en esos claims firmados y no cargan el usuario de la base
+de datos; las escrituras sí lo cargan.
+
+Para revocar todos los tokens de un usuario basta con `revoke_tokens(user)`:
+sube `Profile.token_version` y los tokens anteriores dejan de valer. En cada
+petición la versión vigente se lee de la caché, como mucho
+`TOKEN_VERSION_CACHE_SECONDS`: con una caché por proceso (memoria local), los
+demás procesos pueden aceptar un token de acceso revocado durante ese
+tiempo. Al emitir y al refrescar tokens la versión se lee siempre de la base
+de datos, así que un token de refresco revocado no sirve en ningún proceso.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import get_cache
+from .models import Profile
+from .roles import REQUEST_ATTR, get_group_names
+
+ROLE_CLAIMS = ('is_staff', 'groups')
+
+
+def _version_key(user_pk):
+    return f'auth:token_version:{user_pk}'
+
+
+def _token_versions(user_pk):
+    return Profile.objects.filter(user_id=user_pk).values_list('token_version', flat=True)
+
+
+def _version_timeout():
+    return getattr(settings, 'TOKEN_VERSION_CACHE_SECONDS', 30)
+
+
+def current_token_version(user_pk, fresh=False):
+    """Versión vigente; con `fresh` se lee de la base de datos (y se renueva la caché)."""
+    cache = get_cache()
+    key = _version_key(user_pk)
+    version = None if fresh else cache.get(key)
+    if version is None:
+        version = _token_versions(user_pk).first() or 0
+        cache.set(key, version, _version_timeout())
+    return version
+
+
+async def acurrent_token_version(user_pk):
+    cache = get_cache()
+    key = _version_key(user_pk)
+    version = await cache.aget(key)
+    if version is None:
+        version = await _token_versions(user_pk).afirst() or 0
+        await cache.aset(key, version, _version_timeout())
+    return version
+
+
+def forget_token_version(user_pk):
+    get_cache().delete(_version_key(user_pk))
+
+
+def revoke_tokens(user):
+    """Invalida todos los tokens (de acceso y de refresco) emitidos para `user`."""
+    Profile.objects.filter(user=user).update(token_version=F('token_version') + 1)
+    forget_token_version(user.pk)
+    transaction.on_commit(lambda: forget_token_version(user.pk))
+
+
+def add_claims(token, user):
+    token['username'] = user.get_username()
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token['groups'] = sorted(get_group_names(user))
+    token['token_version'] = current_token_version(user.pk, fresh=True)
+    return token
+
+
+def check_token_version(token, fresh=False):
+    if token.get('token_version', 0) != current_token_version(token[api_settings.USER_ID_CLAIM], fresh):
+        raise AuthenticationFailed(_("El token fue revocado."), code='token_revoked')
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Comprueba la versión del token de refresco y vuelve a leer los roles del
+    usuario, para que el nuevo token de acceso no arrastre claims viejos.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        # Siempre contra la base de datos: otro proceso pudo revocarlo
+        check_token_version(refresh, fresh=True)
+        data = super().validate(attrs)
+        user = get_user_model().objects.get(
+            **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+        )
+        access = AccessToken(data['access'])
+        data['access'] = str(add_claims(access, user))
+        return data
+
+
+class ClaimsUser(TokenUser):
+    """Usuario sin fila de base de datos, construido con los claims del token."""
+
+    def __init__(self, token):
+        super().__init__(token)
+        # roles.get_group_names() toma los grupos de aquí, sin consultas
+        setattr(self, REQUEST_ATTR, frozenset(token.get('groups', ())))
+
+
+class VersionedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication que además rechaza los tokens revocados."""
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_token_version(validated_token)
+        return user
+
+
+class StatelessReadJWTAuthentication(VersionedJWTAuthentication):
+    """
+    En métodos seguros devuelve un `ClaimsUser` en lugar de cargar el
+    usuario. Los tokens emitidos antes de existir los claims de rol siguen el
+    camino normal.
+    """
+
+    def authenticate(self, request):
+        self._safe_method = request.method in permissions.SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if not self._safe_method or not all(claim in validated_token for claim in ROLE_CLAIMS):
+            return super().get_user(validated_token)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        check_token_version(validated_token)
+        return ClaimsUser(validated_token)
+
+
+async def aauthenticate(request):
+    """
+    Equivalente async de `StatelessReadJWTAuthentication` para las vistas
+    async de solo lectura (async_views.py). Devuelve el usuario, o
+    AnonymousUser si no se envía token.
+    """
+    authenticator = StatelessReadJWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return AnonymousUser()
+
+    token = authenticator.get_validated_token(raw_token)
+    if api_settings.USER_ID_CLAIM not in token:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+    user_id = token[api_settings.USER_ID_CLAIM]
+    if token.get('token_version', 0) != await acurrent_token_version(user_id):
+        raise AuthenticationFailed(_("El token fue revocado."), code='token_revoked')
+    if all(claim in token for claim in ROLE_CLAIMS):
+        return ClaimsUser(token)
+
+    # Token sin claims de rol (emitido antes): se carga el usuario
+    user = await get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+        raise AuthenticationFailed(_("User not found"), code='user_not_found')
+    return user
+
+
+# Para las vistas de solo lectura del catálogo
+STATELESS_READ_AUTHENTICATION_CLASSES = [StatelessReadJWTAuthentication, SessionAuthentication]
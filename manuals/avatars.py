@@ -0,0 +1,185 @@
+# manuals/avatars.py
+"""
+Versiones reducidas (renditions) de los avatares.
+
+La app muestra el avatar en un círculo de 48 px, pero el original puede ser
+una foto de 4 MB. Tras guardar un avatar nuevo se generan, fuera del hilo de
+la petición, recortes cuadrados en `AVATAR_SIZES` y en WebP y JPEG, junto al
+original (`avatars/foto.jpg` -> `avatars/foto.48.webp`, `avatars/foto.48.jpg`).
+`Profile.avatar_renditions` guarda los nombres y UserProfileSerializer
+devuelve sus URLs en `avatar_renditions`.
+
+La decodificación tiene la memoria acotada: se rechazan las imágenes de más
+de `AVATAR_MAX_PIXELS` leyendo solo la cabecera, y los JPEG se decodifican en
+modo draft (escalado DCT) al tamaño más cercano al mayor recorte.
+"""
+import atexit
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpeg': ('JPEG', {'quality': 82, 'optimize': True})}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+
+class AvatarError(Exception):
+    pass
+
+
+# Imagen ilegible, demasiado grande o error de almacenamiento
+ERRORS = (AvatarError, OSError, Image.DecompressionBombError)
+
+
+def sizes():
+    return sorted(getattr(settings, 'AVATAR_SIZES', (48, 96, 256)), reverse=True)
+
+
+def max_pixels():
+    return getattr(settings, 'AVATAR_MAX_PIXELS', 24_000_000)
+
+
+def check_dimensions(width, height):
+    if width * height > max_pixels():
+        raise AvatarError(f"La imagen tiene demasiados píxeles ({width}x{height}).")
+
+
+def rendition_name(source, size, fmt):
+    root, _ = os.path.splitext(source)
+    return f'{root}.{size}.{EXTENSIONS[fmt]}'
+
+
+def load(file, largest):
+    """Abre la imagen con la memoria acotada y la deja en RGB/RGBA, ya orientada."""
+    with Image.open(file) as image:
+        # Solo se ha leído la cabecera: se comprueba antes de decodificar
+        check_dimensions(*image.size)
+        if image.format == 'JPEG':
+            image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def encode(image, fmt):
+    name, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode == 'RGBA':
+        # JPEG no tiene transparencia: fondo blanco
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, name, **options)
+    return buffer.getvalue()
+
+
+def delete_renditions(storage, renditions):
+    for formats in renditions.get('sizes', {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def build_renditions(profile_id, source, previous=None):
+    """
+    Genera las versiones de `source` y las guarda en el perfil, salvo que el
+    avatar haya vuelto a cambiar mientras tanto.
+    """
+    from .models import Profile
+
+    profile = Profile.objects.filter(pk=profile_id, avatar=source).first()
+    if profile is None:
+        return None
+    storage = profile.avatar.storage
+    if previous:
+        delete_renditions(storage, previous)
+
+    requested = sizes()
+    with storage.open(source, 'rb') as file:
+        image = load(file, requested[0])
+
+    renditions = {'source': source, 'sizes': {}}
+    for size in requested:
+        # Recorte cuadrado centrado; de mayor a menor, cada uno desde el anterior
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        formats = renditions['sizes'][str(size)] = {}
+        for fmt in FORMATS:
+            name = rendition_name(source, size, fmt)
+            storage.delete(name)
+            formats[fmt] = storage.save(name, ContentFile(encode(image, fmt)))
+
+    # update(): sin señales ni una nueva entrada de auditoría
+    if not Profile.objects.filter(pk=profile_id, avatar=source).update(avatar_renditions=renditions):
+        delete_renditions(storage, renditions)
+        return None
+    return renditions
+
+
+def _run(profile_id, source, previous):
+    try:
+        build_renditions(profile_id, source, previous)
+    except ERRORS:
+        # Se sigue sirviendo el original
+        logger.warning("No se pudieron generar las versiones del avatar %s", source, exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'AVATAR_WORKERS', 1),
+                                       thread_name_prefix='avatars')
+        atexit.register(_executor.shutdown)
+    return _executor
+
+
+def schedule(profile):
+    """Programa (tras el commit) la generación de las versiones del avatar actual."""
+    source = profile.avatar.name if profile.avatar else ''
+    previous = profile.avatar_renditions or {}
+    if previous.get('source', '') == source:
+        return
+    if not source:
+        # Avatar eliminado: fuera también sus versiones
+        storage = profile._meta.get_field('avatar').storage
+        type(profile).objects.filter(pk=profile.pk).update(avatar_renditions={})
+        profile.avatar_renditions = {}
+        transaction.on_commit(lambda: delete_renditions(storage, previous))
+        return
+
+    def submit():
+        if getattr(settings, 'AVATAR_ASYNC', True):
+            _get_executor().submit(_run, profile.pk, source, previous)
+        else:
+            _run(profile.pk, source, previous)
+    transaction.on_commit(submit)
+
+
+def rendition_urls(profile, request=None):
+    """{'48': {'webp': url, 'jpeg': url}, ...} o {} si aún no se han generado."""
+    renditions = profile.avatar_renditions or {}
+    if not profile.avatar or renditions.get('source') != profile.avatar.name:
+        return {}
+    storage = profile.avatar.storage
+    urls = {}
+    for size, formats in renditions['sizes'].items():
+        urls[size] = {}
+        for fmt, name in formats.items():
+            url = storage.url(name)
+            urls[size][fmt] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def preview_url(profile, width):
+    """URL de la versión JPEG más pequeña que cubra `width` px, o la del original."""
+    urls = rendition_urls(profile)
+    fitting = sorted((int(size) for size in urls if int(size) >= width)) or sorted(map(int, urls))[-1:]
+    return urls[str(fitting[0])]['jpeg'] if fitting else profile.avatar.url
@@ -0,0 +1,303 @@
+# manuals/batch.py
+"""
+Lecturas y escrituras en lote para la app (sincronización de cambios hechos
+sin conexión).
+
+- `GET <listado>/?ids=1,2,3`: esos objetos, sin paginar, en una consulta
+  (más los prefetch del listado).
+- `POST <listado>/batch/` con
+  `{"create": [{...}], "update": [{"id": 1, ...}], "delete": [2, 3]}`:
+  hasta `API_BATCH_MAX_OPERATIONS` operaciones en una transacción. Primero
+  se valida todo (con el serializador de la vista, las actualizaciones son
+  parciales) y, si algo falla, se devuelve 400 con los errores de cada
+  operación y no se guarda nada. Después se hace una consulta por tipo de
+  operación: bulk_create, bulk_update y un delete.
+
+La validación tampoco consulta la base de datos por operación: los objetos
+relacionados (PrimaryKeyRelatedField) se cargan con una consulta por
+relación para todo el lote, y unique_together se comprueba en memoria con
+una sola consulta de las claves existentes (ver `preload_related` y
+`unique_together_errors`).
+
+bulk_create/bulk_update no emiten señales: la auditoría (audit.log_bulk) y
+la invalidación de la caché se hacen aquí. Los borrados sí pasan por las
+señales (marcas de borrado, blobs, auditoría).
+"""
+import copy
+import operator
+from functools import reduce
+
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+
+from . import audit
+from .cache import bump_version
+from .sparse import query_list
+
+
+def max_operations():
+    return getattr(settings, 'API_BATCH_MAX_OPERATIONS', 100)
+
+
+def _as_list(data, name):
+    value = data.get(name, [])
+    if not isinstance(value, list):
+        raise ValidationError({name: "Debe ser una lista."})
+    return value
+
+
+def _ids(values, name):
+    try:
+        ids = [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValidationError({name: "Los ids deben ser números enteros."})
+    if len(set(ids)) != len(ids):
+        raise ValidationError({name: "Hay ids repetidos."})
+    return ids
+
+
+class _Preloaded:
+    """Hace de queryset de un PrimaryKeyRelatedField con los objetos ya cargados."""
+
+    def __init__(self, model, objects):
+        self.model = model
+        self.objects = objects
+
+    def get(self, pk):
+        try:
+            pk = self.model._meta.pk.to_python(pk)
+        except DjangoValidationError:
+            raise ValueError(pk) # El campo responde 'incorrect_type'
+        try:
+            return self.objects[pk]
+        except (KeyError, TypeError):
+            raise self.model.DoesNotExist
+
+
+def preload_related(serializers, items):
+    """
+    Una consulta por relación para todo el lote, en lugar de una por
+    operación en PrimaryKeyRelatedField.to_internal_value.
+    """
+    fields = {}
+    for serializer in serializers:
+        for name, field in serializer.fields.items():
+            if isinstance(field, PrimaryKeyRelatedField) and not field.read_only:
+                fields.setdefault(name, []).append(field)
+    for name, group in fields.items():
+        queryset = group[0].get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = set()
+        for item in items:
+            value = item.get(name)
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                pks.add(pk_field.to_python(value))
+            except (DjangoValidationError, TypeError):
+                pass # Ya lo rechazará el campo
+        objects = queryset.in_bulk(pks) if pks else {}
+        for field in group:
+            field.queryset = _Preloaded(queryset.model, objects)
+
+
+def pop_unique_together(serializers):
+    """Quita los UniqueTogetherValidator (una consulta por operación) y los devuelve."""
+    validators = []
+    for serializer in serializers:
+        unique = [v for v in serializer.validators if isinstance(v, UniqueTogetherValidator)]
+        serializer.validators = [v for v in serializer.validators if v not in unique]
+        validators = validators or unique
+    return validators
+
+
+def _key_value(value):
+    return getattr(value, 'pk', value)
+
+
+def _current_value(instance, source):
+    # El id de las relaciones, sin cargar el objeto relacionado
+    return getattr(instance, instance._meta.get_field(source).attname)
+
+
+def unique_together_errors(validators, fields, entries):
+    """
+    Lo que haría cada UniqueTogetherValidator, para todo el lote a la vez.
+
+    `entries`: [(instancia o None, validated_data)]. Compara contra las filas
+    existentes (una consulta por validador) y entre las operaciones del lote.
+    Devuelve {índice: mensaje} de las operaciones en conflicto.
+    """
+    errors = {}
+    updated_pks = [instance.pk for instance, _ in entries if instance is not None]
+    for validator in validators:
+        sources = [fields[name].source for name in validator.fields]
+        keys, checked = [], []
+        for index, (instance, attrs) in enumerate(entries):
+            key = tuple(
+                _key_value(attrs[source]) if source in attrs
+                else _current_value(instance, source) if instance is not None else None
+                for source in sources
+            )
+            keys.append(key)
+            unchanged = instance is not None and all(
+                value == _current_value(instance, source) for source, value in zip(sources, key)
+            )
+            if None not in key and not unchanged:
+                checked.append(index)
+        if not checked:
+            continue
+
+        conditions = [Q(**dict(zip(sources, keys[index]))) for index in checked]
+        existing = set(
+            validator.queryset.filter(reduce(operator.or_, conditions))
+            .exclude(pk__in=updated_pks).values_list(*sources)
+        )
+        # Las actualizadas cuentan con su clave final, aunque no cambie
+        taken = [key for key in keys if None not in key]
+        message = validator.message.format(field_names=', '.join(validator.fields))
+        for index in checked:
+            if keys[index] in existing or taken.count(keys[index]) > 1:
+                errors.setdefault(index, message)
+    return errors
+
+
+class BatchMixin:
+    """ViewSets: `?ids=` en el listado y la acción `batch`."""
+    ids_param = 'ids'
+
+    def get_batch_ids(self):
+        """Ids de `?ids=` en el listado, o None si no se pide."""
+        if self.action != 'list' or self.ids_param not in self.request.query_params:
+            return None
+        ids = _ids(query_list(self.request, self.ids_param), self.ids_param)
+        if len(ids) > max_operations():
+            raise ValidationError({self.ids_param: f"Máximo {max_operations()} ids por petición."})
+        return ids
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ids = self.get_batch_ids()
+        # Aquí y no en list(): el ETag y la caché también ven el filtro
+        return queryset if ids is None else queryset.filter(pk__in=ids)
+
+    def paginate_queryset(self, queryset):
+        if self.get_batch_ids() is not None:
+            return None
+        return super().paginate_queryset(queryset)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        if not isinstance(request.data, dict):
+            raise ValidationError("Se esperaba un objeto con 'create', 'update' y/o 'delete'.")
+        create = _as_list(request.data, 'create')
+        update = _as_list(request.data, 'update')
+        if not all(isinstance(item, dict) for item in create + update):
+            raise ValidationError("Cada operación de 'create' y 'update' debe ser un objeto.")
+        update_ids = _ids([item.get('id') for item in update], 'update')
+        delete_ids = _ids(_as_list(request.data, 'delete'), 'delete')
+        total = len(create) + len(update) + len(delete_ids)
+        if not total:
+            raise ValidationError("No hay operaciones.")
+        if total > max_operations():
+            raise ValidationError(f"Máximo {max_operations()} operaciones por petición.")
+        if set(update_ids) & set(delete_ids):
+            raise ValidationError("Un mismo objeto no se puede actualizar y borrar en el mismo lote.")
+
+        # Todos los objetos afectados en una consulta
+        current = self.get_queryset().prefetch_related(None).in_bulk(update_ids + delete_ids)
+        missing = [pk for pk in update_ids + delete_ids if pk not in current]
+        if missing:
+            raise ValidationError({'detail': "No encontrados.", 'ids': missing})
+        for instance in current.values():
+            self.check_object_permissions(request, instance)
+
+        errors = {}
+        creator = self.get_serializer(data=create, many=True)
+        updaters = [
+            self.get_serializer(current[pk], data={k: v for k, v in item.items() if k != 'id'}, partial=True)
+            for pk, item in zip(update_ids, update)
+        ]
+        serializers = [creator.child, *updaters]
+        preload_related(serializers, create + update)
+        unique_validators = pop_unique_together(serializers)
+        if create and not creator.is_valid():
+            errors['create'] = creator.errors
+        if not all([updater.is_valid() for updater in updaters]):
+            errors['update'] = [updater.errors for updater in updaters]
+        if errors:
+            raise ValidationError(errors)
+
+        entries = [(None, data) for data in (creator.validated_data if create else [])]
+        entries += [(updater.instance, updater.validated_data) for updater in updaters]
+        conflicts = unique_together_errors(unique_validators, creator.child.fields, entries)
+        if conflicts:
+            item_errors = [
+                {api_settings.NON_FIELD_ERRORS_KEY: [conflicts[index]]} if index in conflicts else {}
+                for index in range(len(entries))
+            ]
+            if create:
+                errors['create'] = item_errors[:len(create)]
+            if updaters:
+                errors['update'] = item_errors[len(create):]
+            raise ValidationError({key: value for key, value in errors.items() if any(value)})
+
+        model = self.queryset.model
+        created = [model(**data) for data in creator.validated_data] if create else []
+        changes, fields = [], set()
+        now = timezone.now()
+        for updater in updaters:
+            instance = updater.instance
+            old = copy.copy(instance)
+            for name, value in updater.validated_data.items():
+                setattr(instance, name, value)
+                fields.add(name)
+            instance.updated_at = now
+            changes.append((old, instance))
+
+        try:
+            with transaction.atomic():
+                if created:
+                    self.perform_batch_create(created)
+                if changes:
+                    self.perform_batch_update([instance for _, instance in changes], [*fields, 'updated_at'])
+                if delete_ids:
+                    self.perform_batch_delete(self.get_queryset().prefetch_related(None).filter(pk__in=delete_ids))
+                audit.log_bulk(LogEntry.Action.CREATE, [(None, instance) for instance in created])
+                audit.log_bulk(LogEntry.Action.UPDATE, changes)
+                if created or changes:
+                    # Lo que hace invalidate_catalogue_cache con cada save()
+                    bump_version(model)
+                    transaction.on_commit(lambda: bump_version(model))
+        except IntegrityError:
+            raise ValidationError("El lote entra en conflicto con datos existentes (ej. un duplicado).")
+
+        # Respuesta con el serializador de la vista: creados y actualizados en una consulta
+        saved = self.get_queryset().in_bulk([instance.pk for instance in created] + update_ids)
+
+        def serialize(pks):
+            return self.get_serializer([saved[pk] for pk in pks], many=True).data
+        return Response({
+            'created': serialize([instance.pk for instance in created]),
+            'updated': serialize(update_ids),
+            'deleted': delete_ids,
+        })
+
+    def perform_batch_create(self, instances):
+        self.queryset.model.objects.bulk_create(instances)
+
+    def perform_batch_update(self, instances, fields):
+        self.queryset.model.objects.bulk_update(instances, fields)
+
+    def perform_batch_delete(self, queryset):
+        queryset.delete()
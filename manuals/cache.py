@@ -0,0 +1,157 @@
+# manuals/cache.py
+"""
+Caché de respuestas para los listados y detalles del catálogo.
+
+Las claves incluyen una versión por modelo; cada post_save/post_delete de
+Category, Manual, Procedure o DocumentFile cambia la versión del modelo
+(ver signals.py), con lo que las respuestas que dependen de él dejan de
+encontrarse sin tener que borrarlas una a una.
+
+Usa el alias `API_CACHE_ALIAS` de CACHES, que tiene que ser compartido por
+todos los workers (archivos por defecto; memoria local solo con un proceso).
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+# Validadores que se guardan junto a la respuesta cacheada
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def _version_key(model):
+    return f'api:version:{model._meta.label_lower}'
+
+
+def _changed_key(model):
+    return f'api:changed:{model._meta.label_lower}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def bump_version(model):
+    """Invalida todas las respuestas que dependen de `model`."""
+    cache = get_cache()
+    # Un valor nuevo en lugar de incr(): en FileBasedCache incr() no es
+    # atómico y dos workers podrían acabar con la misma versión.
+    cache.set(_version_key(model), _new_version(), None)
+    cache.set(_changed_key(model), time.time(), None)
+
+
+def get_versions(models):
+    cache = get_cache()
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        versions.update(cache.get_many(list(missing)))
+    return [str(versions.get(key, 0)) for key in keys]
+
+
+def get_last_modified(models):
+    """
+    Hora del último cambio en cualquiera de `models` (para Last-Modified).
+    Si se perdió el dato se toma la hora actual, que nunca es anterior al cambio real.
+    """
+    cache = get_cache()
+    keys = [_changed_key(model) for model in models]
+    changed = cache.get_many(keys)
+    for key in keys:
+        if key not in changed:
+            cache.add(key, time.time(), None)
+            changed[key] = cache.get(key, time.time())
+    return max(changed.values(), default=None)
+
+
+def permission_tier(request):
+    # Las lecturas del catálogo solo cambian según si el usuario es staff
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
+        return 'anon'
+    return 'staff' if user.is_staff else 'user'
+
+
+def record(view_name, outcome):
+    """Contadores de aciertos/fallos por vista (ver `get_stats`)."""
+    cache = get_cache()
+    key = f'api:metrics:{view_name}:{outcome}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats(view_names):
+    cache = get_cache()
+    keys = {
+        (name, outcome): f'api:metrics:{name}:{outcome}'
+        for name in view_names for outcome in ('hit', 'miss')
+    }
+    values = cache.get_many(list(keys.values()))
+    stats = {}
+    for (name, outcome), key in keys.items():
+        stats.setdefault(name, {'hit': 0, 'miss': 0})[outcome] = values.get(key, 0)
+    return stats
+
+
+class CachedResponseMixin:
+    """
+    Cachea las respuestas de `list` y `retrieve` de un ViewSet.
+
+    `cache_dependencies` enumera los modelos cuyos cambios invalidan las
+    respuestas de la vista (ej. el detalle de un manual incluye sus
+    procedimientos y archivos).
+    """
+    cache_dependencies = ()
+
+    def get_cache_key(self, request):
+        versions = ':'.join(get_versions(self.cache_dependencies))
+        # El host forma parte de la clave porque las URLs de la respuesta son absolutas
+        raw = f'{request.get_host()}|{request.path}|{sorted(request.query_params.lists())}'
+        digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+        return f'api:response:{self.basename}:{permission_tier(request)}:{versions}:{digest}'
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            record(self.basename, 'hit')
+            data, headers = cached
+            # Con los validadores guardados, un 304 no toca la base de datos
+            not_modified = get_conditional_response(
+                request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+            )
+            response = not_modified if not_modified is not None else Response(data, headers=headers)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record(self.basename, 'miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'data'):
+            headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+            cache.set(key, (response.data, headers), getattr(settings, 'API_CACHE_TIMEOUT', 300))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,69 @@
+# manuals/conditional.py
+"""
+Peticiones condicionales (ETag / Last-Modified / 304 / 412) para los ViewSets.
+
+Los validadores salen de las versiones por modelo de cache.py (las mismas
+que invalidan la caché de respuestas), no de la base de datos: cualquier
+post_save/post_delete de un modelo del que depende la vista cambia el ETag,
+también los que no tocan `updated_at` (ej. borrar una categoría deja sus
+manuales con category=NULL). Un 304 o un 412 se responde sin ninguna
+consulta, sea cual sea el tamaño del listado.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_last_modified, get_versions, permission_tier
+
+
+class ConditionalGetMixin:
+    """
+    `cache_dependencies`: modelos cuyos cambios modifican las respuestas de la
+    vista (el mismo atributo que usa CachedResponseMixin).
+
+    En PUT/PATCH/DELETE sobre un objeto se respeta `If-Match` con el ETag de
+    su detalle: si alguien lo cambió entretanto, 412 Precondition Failed.
+    """
+    cache_dependencies = ()
+
+    def get_validators(self, request):
+        """Devuelve (etag, last_modified) de la URL pedida."""
+        versions = get_versions(self.cache_dependencies)
+        # Mismo criterio que la clave de caché: la respuesta depende de la
+        # URL (filtros, ?fields=, ?expand=) y de si el usuario es staff
+        raw = '|'.join([request.get_full_path(), permission_tier(request)] + versions)
+        etag = quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+        return etag, get_last_modified(self.cache_dependencies)
+
+    def _conditional_response(self, request, handler, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def _check_preconditions(self, request, handler, *args, **kwargs):
+        if 'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META:
+            etag, last_modified = self.get_validators(request)
+            failed = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if failed is not None:
+                return failed
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_response(request, super().retrieve, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        return self._check_preconditions(request, super().update, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        return self._check_preconditions(request, super().destroy, *args, **kwargs)
@@ -0,0 +1,79 @@
+# manuals/db_routers.py
+"""
+Lecturas del catálogo desde una réplica (alias 'replica' de DATABASES).
+
+`ReplicaReadMixin` marca las peticiones GET/HEAD de los ViewSets del
+catálogo; solo durante esas peticiones `ReadReplicaRouter` manda las
+lecturas a la réplica. Todo lo demás (escrituras, throttling, auditoría,
+autenticación) sigue en 'default'.
+
+Leer lo que uno acaba de escribir: cada escritura con éxito a través de
+esos ViewSets guarda la hora en `Profile.last_write_at` (en el primario, así
+la ven todos los procesos), y durante `REPLICA_READ_YOUR_WRITES_SECONDS` ese
+usuario lee del primario, aunque la réplica vaya con retraso. Cuesta una
+consulta por clave primaria en cada lectura autenticada, solo con réplica.
+"""
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA_ALIAS = 'replica'
+
+_read_alias = ContextVar('manuals_read_alias', default=None)
+
+
+def replica_enabled():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def mark_write(user):
+    from .models import Profile
+    if user is not None and user.is_authenticated:
+        Profile.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user.pk).update(last_write_at=timezone.now())
+
+
+def wrote_recently(user):
+    from .models import Profile
+    if user is None or not user.is_authenticated:
+        return False
+    since = timezone.now() - timedelta(seconds=getattr(settings, 'REPLICA_READ_YOUR_WRITES_SECONDS', 10))
+    return Profile.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user.pk, last_write_at__gte=since).exists()
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # También para objetos leídos de la réplica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Son la misma base de datos
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_ALIAS} or None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaReadMixin:
+    """ViewSets: GET/HEAD desde la réplica, salvo si el usuario acaba de escribir."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Tras autenticar, permisos y throttling (que leen y escriben en 'default')
+        if replica_enabled() and request.method in SAFE_METHODS and not wrote_recently(request.user):
+            self._read_alias_token = _read_alias.set(REPLICA_ALIAS)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._read_alias_token = None
+        elif request.method not in SAFE_METHODS and response.status_code < 400 and replica_enabled():
+            mark_write(getattr(request, 'user', None))
+        return super().finalize_response(request, response, *args, **kwargs)
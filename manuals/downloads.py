@@ -0,0 +1,129 @@
+# manuals/downloads.py
+"""
+Entrega de archivos adjuntos para /api/v1/files/{id}/download/.
+
+Según `DOCUMENT_DOWNLOAD_BACKEND` los bytes los envía:
+- 'nginx':    el proxy, vía `X-Accel-Redirect` a DOCUMENT_DOWNLOAD_ACCEL_PREFIX.
+- 'sendfile': el servidor (Apache mod_xsendfile, lighttpd...), vía `X-Sendfile`.
+- 'django':   Django, con FileResponse (sendfile del servidor WSGI si está
+              disponible) o en bloques para peticiones con Range.
+En todos los casos se responden ETag / If-None-Match (hash del contenido).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Interpreta un encabezado `Range` de un solo rango y devuelve (inicio, fin)
+    inclusivos, o None si debe ignorarse (sintaxis desconocida o varios
+    rangos: se sirve el archivo completo, como permite la RFC 9110).
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N -> los últimos N bytes
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def document_etag(document):
+    if document.content_hash:
+        return f'"{document.content_hash}"'
+    return f'"{document.pk}-{int(document.uploaded_at.timestamp())}"'
+
+
+def _read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def _django_response(request, document, etag, content_type):
+    size = document.file.size
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if 'Range' in request.headers and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = document.file.storage.open(document.file.name, 'rb')
+    if byte_range is None:
+        # Archivo completo: el servidor WSGI puede usar sendfile (sin copias)
+        return FileResponse(file, content_type=content_type)
+
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        _read_range(file, start, end - start + 1), status=206, content_type=content_type
+    )
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve_document(request, document, as_attachment=True):
+    etag = document_etag(document)
+    last_modified = http_date(document.uploaded_at.timestamp())
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or '*' in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    filename = document.original_name or os.path.basename(document.file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    backend = getattr(settings, 'DOCUMENT_DOWNLOAD_BACKEND', 'django')
+    if backend == 'nginx':
+        prefix = getattr(settings, 'DOCUMENT_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(document.file.name)
+    elif backend == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = document.file.path
+    else:
+        response = _django_response(request, document, etag, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private'
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
@@ -0,0 +1,220 @@
+# manuals/fast_serializers.py
+"""
+Serialización rápida de los listados más consultados.
+
+ModelSerializer recorre sus campos y llama al `to_representation` de cada uno
+por cada fila; en un listado de procedimientos con sus archivos anidados eso
+(más un `build_absolute_uri` por archivo) es casi todo el tiempo de CPU de la
+petición. Las clases de este módulo devuelven exactamente lo mismo que
+`ProcedureSerializer`, `ManualListSerializer`, `DocumentFileSerializer` y
+`CategorySerializer`, pero a partir de filas de `.values()`:
+
+- el plan de cada clase (columna y conversión de cada campo) se calcula una
+  sola vez, a partir de los campos del serializador original;
+- las URL absolutas (media y descarga) se calculan una vez por petición;
+- solo se convierten los valores que lo necesitan (fechas, UUID);
+- si una relación intermedia es NULL (ej. `category.name` de un manual sin
+  categoría) el campo se omite o vale lo mismo que en DRF (ver `missing_value`).
+
+`FastListMixin` las usa en el `list` de los ViewSets cuando no se piden
+`?fields=` ni `?expand=`. Comparativa: `python manage.py benchmark_serializers`.
+"""
+from collections import defaultdict
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from .models import DocumentFile
+from .serializers import (CategorySerializer, DocumentFileSerializer, ManualListSerializer,
+                          ProcedureSerializer, UserSerializerForDocument)
+from .sparse import query_list
+
+# Campos cuya representación es el valor tal cual sale de la base de datos
+PLAIN_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                serializers.PrimaryKeyRelatedField)
+MEDIA = object()
+SKIP = object()
+
+
+def missing_value(field):
+    """Lo que hace Field.get_attribute de DRF cuando la fuente pasa por un None."""
+    if field.default is not empty:
+        return field.get_default()
+    if field.allow_null:
+        return None
+    return SKIP # SkipField: la clave no aparece
+
+
+class FastSerializer:
+    """
+    `serializer_class`: serializador cuya salida se reproduce. Los campos que
+    no salen de una columna (anidados, SerializerMethodField) se resuelven con
+    un método `represent_<campo>(row)`, con las columnas que necesite en
+    `extra_columns`.
+    """
+    serializer_class = None
+    extra_columns = ()
+    skip_fields = ()
+
+    def __init__(self, request=None):
+        self.request = request
+        plan, self.columns = self.compile()
+        self.plan = [(name, column, self.bind(column, convert), guards, field)
+                     for name, column, convert, guards, field in plan]
+
+    @classmethod
+    def compile(cls):
+        if '_compiled' not in cls.__dict__:
+            plan, columns = [], ['pk', *cls.extra_columns]
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only or name in cls.skip_fields:
+                    continue
+                if hasattr(cls, f'represent_{name}'):
+                    plan.append((name, None, f'represent_{name}', (), None))
+                    continue
+                if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)) \
+                        or field.source == '*':
+                    raise ImproperlyConfigured(f"{cls.__name__} necesita represent_{name}().")
+                column = '__'.join(field.source_attrs)
+                # Relaciones intermedias de una fuente con puntos (el id de `category`
+                # para `category.name`): si son NULL, DRF no llega a leer el campo
+                guards = tuple('__'.join(field.source_attrs[:i]) for i in range(1, len(field.source_attrs)))
+                columns.extend((*guards, column))
+                if isinstance(field, serializers.FileField):
+                    convert = MEDIA
+                elif isinstance(field, PLAIN_FIELDS):
+                    convert = None
+                else:
+                    convert = field.to_representation
+                plan.append((name, column, convert, guards, field))
+            cls._compiled = plan, list(dict.fromkeys(columns))
+        return cls._compiled
+
+    def bind(self, column, convert):
+        if convert is MEDIA:
+            model = self.serializer_class.Meta.model
+            return self.media_url(model._meta.get_field(column).storage)
+        if isinstance(convert, str):
+            return getattr(self, convert)
+        return convert
+
+    def absolute(self, url):
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def media_url(self, storage):
+        if isinstance(storage, FileSystemStorage):
+            # Lo mismo que FileSystemStorage.url(), con la base absoluta calculada una vez
+            base = self.absolute(storage.base_url)
+            return lambda name: urljoin(base, filepath_to_uri(name).lstrip('/')) if name else None
+        return lambda name: self.absolute(storage.url(name)) if name else None
+
+    def values(self, queryset):
+        """El queryset como filas de `.values()`, con las columnas del orden (para el cursor)."""
+        ordering = [field.lstrip('-') for field in (*queryset.query.order_by, *queryset.model._meta.ordering)
+                    if isinstance(field, str)]
+        return queryset.prefetch_related(None).values(*dict.fromkeys(self.columns + ordering))
+
+    def prefetch(self, rows):
+        """Carga lo que los `represent_*` necesitan para todas las filas a la vez."""
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, convert, guards, field in self.plan:
+            if column is None:
+                data[name] = convert(row)
+            elif guards and any(row[guard] is None for guard in guards):
+                value = missing_value(field)
+                if value is not SKIP:
+                    data[name] = value
+            else:
+                value = row[column]
+                data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prefetch(rows)
+        return [self.to_representation(row) for row in rows]
+
+
+class DocumentFileFastSerializer(FastSerializer):
+    serializer_class = DocumentFileSerializer
+    user_fields = UserSerializerForDocument.Meta.fields
+    extra_columns = ('file', *(f'uploaded_by__{name}' for name in user_fields))
+
+    def represent_uploaded_by(self, row):
+        if row['uploaded_by__id'] is None:
+            return None
+        return {name: row[f'uploaded_by__{name}'] for name in self.user_fields}
+
+    def represent_file(self, row):
+        # DocumentDownloadField: la descarga protegida, no /media/
+        return self.represent_file_url(row)
+
+    def represent_file_url(self, row):
+        if not row['file']:
+            return None
+        if not hasattr(self, '_download_url'):
+            url = reverse('documentfile-download', kwargs={'pk': 0}, request=self.request)
+            self._download_url = url.rpartition('/0/')
+        head, _, tail = self._download_url
+        return f"{head}/{row['pk']}/{tail}"
+
+
+class ProcedureFastSerializer(FastSerializer):
+    serializer_class = ProcedureSerializer
+    # Procedure no tiene atributo `files`: ProcedureSerializer también lo omite
+    skip_fields = ('files',)
+
+    def prefetch(self, rows):
+        # Archivos vigentes de toda la página en una consulta (como latest_document_files_prefetch)
+        files = DocumentFileFastSerializer(self.request)
+        queryset = DocumentFile.objects.filter(is_latest=True, procedure__in=[row['pk'] for row in rows])
+        self.document_files = defaultdict(list)
+        for row in files.values(queryset):
+            self.document_files[row['procedure']].append(files.to_representation(row))
+
+    def represent_document_files(self, row):
+        return self.document_files.get(row['pk'], [])
+
+
+class ManualListFastSerializer(FastSerializer):
+    serializer_class = ManualListSerializer
+
+
+class CategoryFastSerializer(FastSerializer):
+    serializer_class = CategorySerializer
+
+
+class FastListMixin:
+    """
+    ViewSets: `list` con `fast_serializer_class` cuando la respuesta es la
+    estándar. `API_FAST_SERIALIZERS = False` vuelve a los serializadores de DRF.
+    """
+    fast_serializer_class = None
+
+    def use_fast_serializer(self):
+        return (
+            getattr(settings, 'API_FAST_SERIALIZERS', True)
+            and self.fast_serializer_class is not None
+            and self.get_serializer_class() is self.fast_serializer_class.serializer_class
+            and not query_list(self.request, 'fields')
+            and not query_list(self.request, 'expand')
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serializer():
+            return super().list(request, *args, **kwargs)
+        serializer = self.fast_serializer_class(request)
+        queryset = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(queryset))
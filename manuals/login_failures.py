@@ -0,0 +1,141 @@
+# manuals/login_failures.py
+"""
+Registro agregado de logins fallidos.
+
+Cada intento fallido solo incrementa un contador en memoria por
+(usuario, IP). Al cerrarse la ventana de `LOGIN_FAILURE_WINDOW` segundos se
+genera un único LogEntry resumen (número de intentos, primero y último),
+que el hilo de auditoría (manuals/audit.py) guarda por lotes junto al resto.
+La petición fallida no toca la base de datos.
+
+Si `LOGIN_LOCKOUT_THRESHOLD` está definido, `LockoutModelBackend` rechaza
+los logins de un (usuario, IP) que alcanzó ese número de fallos dentro de la
+ventana actual. Los contadores son por proceso: con varios workers el
+umbral efectivo puede ser mayor.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import PermissionDenied
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') if request is not None else None
+
+
+class FailedLoginRecorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (username, remote_addr) -> [intentos, primer intento, último intento]
+        self._windows = {}
+        # Ventanas vencidas pendientes de escribir
+        self._closed = []
+        self.counters = {'attempts': 0, 'windows_logged': 0, 'locked_out': 0}
+
+    @property
+    def window(self):
+        return getattr(settings, 'LOGIN_FAILURE_WINDOW', 60)
+
+    def record(self, username, remote_addr):
+        now = time.time()
+        key = (username, remote_addr)
+        with self._lock:
+            self.counters['attempts'] += 1
+            current = self._windows.get(key)
+            if current is not None and now - current[1] >= self.window:
+                self._closed.append((key, current))
+                current = None
+            if current is None:
+                self._windows[key] = [1, now, now]
+            else:
+                current[0] += 1
+                current[2] = now
+
+    def attempts(self, username, remote_addr):
+        """Intentos fallidos de (usuario, IP) en la ventana abierta."""
+        current = self._windows.get((username, remote_addr))
+        if current is None or time.time() - current[1] >= self.window:
+            return 0
+        return current[0]
+
+    def is_locked(self, username, remote_addr):
+        threshold = getattr(settings, 'LOGIN_LOCKOUT_THRESHOLD', None)
+        if not threshold or self.attempts(username, remote_addr) < threshold:
+            return False
+        with self._lock:
+            self.counters['locked_out'] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, open_windows=len(self._windows))
+
+    def collect(self, force=False):
+        """
+        Cierra las ventanas vencidas (o todas con `force`) y devuelve un
+        LogEntry resumen por cada una. Lo llama el hilo de auditoría.
+        """
+        now = time.time()
+        with self._lock:
+            expired = self._closed + [
+                (key, value) for key, value in self._windows.items()
+                if force or now - value[1] >= self.window
+            ]
+            self._closed = []
+            for key, _ in expired:
+                self._windows.pop(key, None)
+            self.counters['windows_logged'] += len(expired)
+        if not expired:
+            return []
+
+        User = get_user_model()
+        # Una sola consulta por lote para enlazar los usuarios existentes
+        user_ids = dict(
+            User.objects.filter(username__in={username for (username, _), _ in expired})
+            .values_list('username', 'pk')
+        )
+        content_type = ContentType.objects.get_for_model(User)
+        entries = []
+        for (username, remote_addr), (count, first, last) in expired:
+            pk = user_ids.get(username)
+            entries.append(LogEntry(
+                content_type=content_type,
+                object_pk=str(pk) if pk else '',
+                object_id=pk,
+                object_repr=username,
+                action=LogEntry.Action.ACCESS,
+                changes={
+                    'details': 'Incorrect username or password',
+                    'attempts': count,
+                    'first_attempt': datetime.fromtimestamp(first, timezone.utc).isoformat(),
+                    'last_attempt': datetime.fromtimestamp(last, timezone.utc).isoformat(),
+                },
+                remote_addr=remote_addr,
+                timestamp=datetime.fromtimestamp(last, timezone.utc),
+            ))
+        return entries
+
+
+recorder = FailedLoginRecorder()
+
+
+class LockoutModelBackend(ModelBackend):
+    """
+    ModelBackend que rechaza el login mientras (usuario, IP) supere
+    `LOGIN_LOCKOUT_THRESHOLD` fallos en la ventana actual.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+        if username is not None and recorder.is_locked(username, client_ip(request)):
+            # PermissionDenied corta la cadena de backends (y cuenta como fallo)
+            raise PermissionDenied
+        return super().authenticate(request, username=username, password=password, **kwargs)
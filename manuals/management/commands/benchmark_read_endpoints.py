@@ -0,0 +1,70 @@
+# manuals/management/commands/benchmark_read_endpoints.py
+
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de las lecturas del catálogo contra servidores ya "
+        "levantados, para comparar WSGI y ASGI. Ejemplo:\n"
+        "  gunicorn core.wsgi -w 1 --threads 4 -b 127.0.0.1:8000\n"
+        "  uvicorn core.asgi:application --workers 1 --port 8001\n"
+        "  python manage.py benchmark_read_endpoints --token <jwt> "
+        "--target wsgi=http://127.0.0.1:8000/api/v1/manuals/ "
+        "--target asgi=http://127.0.0.1:8001/api/v1/async/manuals/\n"
+        "Los throttles (DEFAULT_THROTTLE_RATES) deben permitir el volumen de la prueba."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help="nombre=url; se puede repetir.")
+        parser.add_argument('--requests', type=int, default=500, help="Peticiones por objetivo.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Clientes simultáneos.")
+        parser.add_argument('--token', help="JWT de acceso (Authorization: Bearer).")
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'X-App-Key': settings.REQUIRED_APP_KEY}
+        if options['token']:
+            headers['Authorization'] = f"Bearer {options['token']}"
+
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f"Objetivo inválido (se esperaba nombre=url): {target}")
+            self.run(name, url, headers, options)
+
+    def run(self, name, url, headers, options):
+        def fetch(_):
+            start = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers), timeout=options['timeout']) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as exc:
+                status = exc.code
+            except (URLError, OSError):
+                status = 'error'
+            return status, time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        statuses = Counter(status for status, _ in results)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f"{name}: {len(results) / elapsed:.1f} req/s | "
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms | p95 {p95 * 1000:.1f} ms | "
+            f"estados {dict(statuses)}"
+        )
@@ -0,0 +1,91 @@
+# manuals/management/commands/benchmark_serializers.py
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from manuals.fast_serializers import DocumentFileFastSerializer, ManualListFastSerializer, ProcedureFastSerializer
+from manuals.models import Category, DocumentFile, Manual, Procedure
+from manuals.views import latest_document_files_prefetch
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la serialización de los listados con los serializadores de DRF "
+        "y con los de fast_serializers.py (consulta incluida). Con --seed N se "
+        "crean N procedimientos de prueba dentro de una transacción que se "
+        "deshace al terminar. Ejemplo:\n"
+        "  python manage.py benchmark_serializers --seed 2000 --rows 1000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Filas por listado.")
+        parser.add_argument('--repeat', type=int, default=5, help="Repeticiones (se toma la mejor).")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Procedimientos de prueba a crear (no se guardan).")
+        parser.add_argument('--files-per-procedure', type=int, default=2)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'], options['files_per_procedure'])
+            # Mismo tipo de request que reciben los serializadores en la API
+            request = Request(APIRequestFactory().get('/api/v1/procedures/', SERVER_NAME='localhost'))
+            rows = options['rows']
+            cases = [
+                ('procedures', ProcedureFastSerializer,
+                 Procedure.objects.select_related('manual').prefetch_related(latest_document_files_prefetch())),
+                ('manuals', ManualListFastSerializer, Manual.objects.select_related('category')),
+                ('files', DocumentFileFastSerializer,
+                 DocumentFile.objects.filter(is_latest=True).select_related('uploaded_by')),
+            ]
+            for name, fast_class, queryset in cases:
+                self.compare(name, fast_class, queryset[:rows], request, options['repeat'])
+            transaction.set_rollback(True)
+
+    def compare(self, name, fast_class, queryset, request, repeat):
+        def drf():
+            return fast_class.serializer_class(queryset.all(), many=True, context={'request': request}).data
+
+        def fast():
+            serializer = fast_class(request)
+            return serializer.serialize(serializer.values(queryset.all()))
+
+        expected, result = drf(), fast()
+        drf_time, fast_time = self.best(drf, repeat), self.best(fast, repeat)
+        self.stdout.write(
+            f"{name}: {len(result)} filas | DRF {drf_time * 1000:.1f} ms | "
+            f"rápido {fast_time * 1000:.1f} ms | x{drf_time / fast_time:.1f} | "
+            f"salida idéntica: {'sí' if result == expected else 'NO'}"
+        )
+
+    @staticmethod
+    def best(function, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def seed(self, count, files_per_procedure):
+        user = User.objects.order_by('pk').first()
+        category = Category.objects.create(name='Benchmark de serializadores')
+        manuals = Manual.objects.bulk_create(
+            Manual(title=f'Manual {i:04d}', category=category) for i in range(max(1, count // 20))
+        )
+        procedures = Procedure.objects.bulk_create(
+            Procedure(manual=manuals[i % len(manuals)], manual_title=manuals[i % len(manuals)].title,
+                      title=f'Procedimiento {i:05d}', content='Paso. ' * 300)
+            for i in range(count)
+        )
+        # bulk_create no escribe archivos: solo el nombre en la columna
+        DocumentFile.objects.bulk_create(
+            DocumentFile(procedure=procedure, title=f'Anexo {n}', uploaded_by=user,
+                         file=f'document_files/benchmark/{procedure.pk}-{n}.pdf')
+            for procedure in procedures for n in range(files_per_procedure)
+        )
@@ -0,0 +1,33 @@
+# manuals/management/commands/build_avatar_renditions.py
+
+from django.core.management.base import BaseCommand
+
+from manuals import avatars
+from manuals.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las versiones reducidas de los avatares que aún no las tienen "
+        "(ej. los subidos antes de existir avatars.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenera también las existentes.")
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(avatar='').exclude(avatar__isnull=True).only(
+            'id', 'avatar', 'avatar_renditions',
+        )
+        built = failed = 0
+        for profile in profiles.iterator(chunk_size=200):
+            if not options['force'] and profile.avatar_renditions.get('source') == profile.avatar.name:
+                continue
+            try:
+                renditions = avatars.build_renditions(profile.pk, profile.avatar.name, profile.avatar_renditions)
+            except avatars.ERRORS as exc:
+                failed += 1
+                self.stderr.write(f"Perfil {profile.pk} ({profile.avatar.name}): {exc}")
+                continue
+            built += renditions is not None
+        self.stdout.write(f"Avatares procesados: {built}; con errores: {failed}.")
@@ -0,0 +1,53 @@
+# manuals/management/commands/dedupe_document_files.py
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from manuals.models import DocumentFile
+from manuals.storage import document_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Migra los archivos adjuntos guardados antes del almacenamiento "
+        "direccionado por contenido: calcula su SHA-256, los mueve a su blob "
+        "y elimina las copias duplicadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Solo informa cuántos archivos se migrarían.")
+
+    def handle(self, *args, **options):
+        pending = DocumentFile.objects.filter(content_hash='').exclude(file='').only('id', 'file')
+        migrated = missing = 0
+        freed = 0
+        for document in pending.iterator(chunk_size=500):
+            old_name = document.file.name
+            if not document_storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f"Archivo no encontrado para DocumentFile {document.pk}: {old_name}")
+                continue
+            if options['dry_run']:
+                migrated += 1
+                continue
+
+            size = document_storage.size(old_name)
+            with document_storage.open(old_name) as content:
+                new_name = document_storage.save(old_name, content)
+            DocumentFile.objects.filter(pk=document.pk).update(
+                file=new_name,
+                content_hash=document_storage.hash_from_name(new_name),
+                original_name=os.path.basename(old_name),
+            )
+            # La copia antigua solo se borra si ninguna otra fila la usa
+            if not DocumentFile.objects.filter(file=old_name).exists():
+                document_storage.delete(old_name)
+                freed += size
+            migrated += 1
+
+        action = "se migrarían" if options['dry_run'] else "migrados"
+        self.stdout.write(self.style.SUCCESS(
+            f"{migrated} archivos {action}, {missing} no encontrados, {freed} bytes liberados."
+        ))
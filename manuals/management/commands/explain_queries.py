@@ -0,0 +1,97 @@
+# manuals/management/commands/explain_queries.py
+
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from manuals.views import CategoryViewSet, DocumentFileViewSet, ManualViewSet, ProcedureViewSet
+
+VIEWSETS = {
+    'categories': CategoryViewSet,
+    'manuals': ManualViewSet,
+    'procedures': ProcedureViewSet,
+    'files': DocumentFileViewSet,
+}
+
+# Líneas del plan que indican que se recorre la tabla entera u ordena en memoria
+PROBLEMS = {
+    'sqlite': [
+        (re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)'), 'recorrido completo'),
+        (re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'), 'ordenación sin índice'),
+    ],
+    'postgresql': [
+        (re.compile(r'Seq Scan on (\w+)'), 'recorrido completo'),
+        (re.compile(r'^\s*(?:->\s*)?Sort\b', re.MULTILINE), 'ordenación sin índice'),
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta EXPLAIN sobre la primera página de cada listado de la API con "
+        "cada filtro (`filterset_fields`) y cada orden (`ordering_fields`), tal "
+        "como lo construyen los ViewSets y la paginación por cursor, e informa "
+        "de los recorridos completos y las ordenaciones sin índice. En tablas "
+        "casi vacías el planificador puede preferir un recorrido: conviene "
+        "ejecutarlo con datos reales (o tras ANALYZE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewset', action='append', choices=sorted(VIEWSETS),
+                            help="Solo estos listados (se puede repetir).")
+        parser.add_argument('--verbose-plan', action='store_true', help="Muestra el plan completo.")
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help="Termina con error si algún plan tiene problemas (para CI).")
+
+    def handle(self, *args, **options):
+        patterns = PROBLEMS.get(connection.vendor)
+        if patterns is None:
+            raise CommandError(f"Motor no soportado: {connection.vendor}.")
+
+        problems = 0
+        for name in options['viewset'] or VIEWSETS:
+            viewset = VIEWSETS[name]
+            for params in self.combinations(viewset):
+                plan = self.plan(viewset, params)
+                found = sorted({label for pattern, label in patterns if pattern.search(plan)})
+                query = '&'.join(f'{key}={value}' for key, value in params.items())
+                status = self.style.WARNING(', '.join(found)) if found else self.style.SUCCESS('OK')
+                self.stdout.write(f"{name}/?{query}: {status}")
+                if options['verbose_plan'] or found:
+                    for line in plan.splitlines():
+                        self.stdout.write(f"    {line}")
+                problems += bool(found)
+
+        self.stdout.write(f"Planes con problemas: {problems}")
+        if problems and options['fail_on_scan']:
+            raise CommandError("Hay consultas sin índice.")
+
+    def combinations(self, viewset):
+        model = viewset.queryset.model
+        filters = [{}]
+        for field in getattr(viewset, 'filterset_fields', ()):
+            # Un valor real si hay filas; si no, uno cualquiera del tipo correcto
+            value = model.objects.values_list(field, flat=True).exclude(**{f'{field}__isnull': True}).first()
+            filters.append({field: value if value is not None else 1})
+        orderings = [None] + [
+            prefix + field for field in getattr(viewset, 'ordering_fields', ()) for prefix in ('', '-')
+        ]
+        for lookup in filters:
+            for ordering in orderings:
+                yield {**lookup, **({'ordering': ordering} if ordering else {})}
+
+    def plan(self, viewset, params):
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = AnonymousUser()
+        view = viewset(request=request, args=(), kwargs={}, format_kwarg=None, action='list')
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = view.paginator
+        if paginator is not None:
+            # Igual que la primera página de la paginación por cursor
+            ordering = paginator.get_ordering(request, queryset, view)
+            queryset = queryset.order_by(*ordering)[:paginator.get_page_size(request) + 1]
+        return queryset.explain()
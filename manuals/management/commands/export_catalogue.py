@@ -0,0 +1,41 @@
+# manuals/management/commands/export_catalogue.py
+
+import os
+from functools import partial
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from manuals.bulk_io import FORMATS, TABLES, export_catalogue
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta categorías, manuales, procedimientos o metadatos de archivos "
+        "adjuntos en CSV, JSON o NDJSON, con claves naturales en lugar de ids "
+        "(el formato que lee import_catalogue). Ejemplo:\n"
+        "  python manage.py export_catalogue manuals --output manuales.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(TABLES))
+        parser.add_argument('--output', default='-', help="Archivo de salida ('-' para la salida estándar).")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Formato (por defecto, según la extensión; NDJSON en la salida estándar).")
+        parser.add_argument('--chunk-size', type=int,
+                            default=getattr(settings, 'CATALOGUE_IMPORT_BATCH_SIZE', 1000))
+
+    def handle(self, *args, **options):
+        path = options['output']
+        fmt = options['format'] or (os.path.splitext(path)[1].lstrip('.').lower() if path != '-' else 'ndjson')
+        if fmt not in FORMATS:
+            raise CommandError(f"Indica --format ({', '.join(FORMATS)}).")
+        if path == '-':
+            # Sin el salto de línea que añade OutputWrapper a cada write()
+            output = SimpleNamespace(write=partial(self.stdout.write, ending=''))
+            export_catalogue(options['kind'], output, fmt, options['chunk_size'])
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            export_catalogue(options['kind'], file, fmt, options['chunk_size'])
+        self.stderr.write(f"{options['kind']} exportados en {path}.")
@@ -0,0 +1,54 @@
+# manuals/management/commands/import_catalogue.py
+
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from manuals.bulk_io import FORMATS, TABLES, CatalogueError, import_catalogue, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa categorías, manuales, procedimientos o metadatos de archivos "
+        "adjuntos desde CSV, JSON o NDJSON, creando o actualizando por clave "
+        "natural (nombre de la categoría, título del manual, manual + título + "
+        "versión del procedimiento). Todo en una transacción: si una fila falla "
+        "no se importa nada. Ejemplo:\n"
+        "  python manage.py import_catalogue procedures procedimientos.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(TABLES))
+        parser.add_argument('path', help="Archivo a importar ('-' para la entrada estándar).")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Formato del archivo (por defecto, según su extensión).")
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'CATALOGUE_IMPORT_BATCH_SIZE', 1000))
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Valida e informa sin guardar nada.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Indica --format ({', '.join(FORMATS)}).")
+        try:
+            if path == '-':
+                stats = self.run(sys.stdin, fmt, options)
+            else:
+                with open(path, newline='', encoding='utf-8-sig') as file:
+                    stats = self.run(file, fmt, options)
+        except (CatalogueError, OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        prefix = "(simulación) " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{options['kind']}: {stats['created']} creados, {stats['updated']} actualizados, "
+            f"{stats['unchanged']} sin cambios."
+        ))
+
+    def run(self, file, fmt, options):
+        return import_catalogue(options['kind'], read_rows(file, fmt),
+                                batch_size=options['batch_size'], dry_run=options['dry_run'])
@@ -0,0 +1,17 @@
+# manuals/management/commands/prune_deleted_records.py
+
+from django.core.management.base import BaseCommand
+
+from manuals import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina las marcas de borrado de la sincronización delta más antiguas "
+        "que SYNC_TOKEN_MAX_AGE_DAYS (ningún token válido las puede pedir). "
+        "Pensado para ejecutarse a diario (cron)."
+    )
+
+    def handle(self, *args, **options):
+        deleted = sync.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} marcas de borrado eliminadas."))
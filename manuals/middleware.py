@@ -1,66 +1,96 @@
 # manuals_api/manuals_api/middleware.py
 
+import hmac
+import logging
+import re # Necesario para expresiones regulares, para eximir rutas
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.http import JsonResponse
-import re # Necesario para expresiones regulares, para eximir rutas
+
+logger = logging.getLogger(__name__)
+
+# Rutas que no requieren la App Key.
+# Es crucial eximir los endpoints de autenticación y registro.
+# También el admin de Django, archivos estáticos y de medios.
+DEFAULT_EXEMPT_PATHS = [
+    # '/api/v1/token/',       # Endpoint para obtener tokens (login)
+    # '/api/v1/register/',    # Endpoint de registro de usuarios
+    '/admin/',           # Panel de administración de Django
+    '/static/',          # Servidor de archivos estáticos (para desarrollo)
+    '/media/',           # Servidor de archivos de medios (para desarrollo)
+    '/api/schema/',      # Si tienes documentación OpenAPI/Swagger
+]
+
 
 class AppKeyMiddleware:
     """
     Middleware personalizado para validar una 'App Key' en los encabezados de la solicitud.
     Asegura que solo las aplicaciones autorizadas puedan acceder a la API REST.
+
+    Acepta cualquiera de las claves activas (REQUIRED_APP_KEY y APP_KEYS), lo
+    que permite rotarlas sin cortar el acceso a las versiones anteriores de la
+    app. Funciona igual bajo WSGI y ASGI (sin pasar por un hilo en ASGI).
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        
-        # Obtener la clave requerida de las configuraciones de Django
-        self.required_app_key = getattr(settings, 'REQUIRED_APP_KEY', None)
-
-        # Rutas que no requieren la App Key.
-        # Es crucial eximir los endpoints de autenticación y registro.
-        # También el admin de Django, archivos estáticos y de medios.
-        self.exempt_paths = [
-            # re.compile(r'^/api/v1/token/'),       # Endpoint para obtener tokens (login)
-            # re.compile(r'^/api/v1/register/'),    # Endpoint de registro de usuarios
-            re.compile(r'^/admin/'),           # Panel de administración de Django
-            re.compile(r'^/static/'),          # Servidor de archivos estáticos (para desarrollo)
-            re.compile(r'^/media/'),           # Servidor de archivos de medios (para desarrollo)
-            re.compile(r'^/api/schema/'),      # Si tienes documentación OpenAPI/Swagger
-        ]
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+        # Claves activas, ya codificadas para compararlas en tiempo constante
+        keys = [getattr(settings, 'REQUIRED_APP_KEY', None), *getattr(settings, 'APP_KEYS', ())]
+        self.app_keys = tuple(dict.fromkeys(key.encode() for key in keys if key))
+
+        # Una sola expresión para rutas exentas y rutas /api/. Las exentas van
+        # primero porque algunas (ej. /api/schema/) también empiezan por /api/.
+        exempt = getattr(settings, 'APP_KEY_EXEMPT_PATHS', DEFAULT_EXEMPT_PATHS)
+        self.path_re = re.compile(
+            '^(?:(?P<exempt>{})|(?P<api>/api/))'.format('|'.join(map(re.escape, exempt)) or '(?!)')
+        )
+
+    def check(self, request):
+        """Devuelve la respuesta de error, o None si la solicitud puede seguir."""
         # 1. Manejar solicitudes OPTIONS (preflight de CORS)
         # Las solicitudes OPTIONS no suelen llevar el encabezado de autenticación
         # y deben ser respondidas sin validación de App Key para que CORS funcione.
         if request.method == 'OPTIONS':
-            return self.get_response(request)
-
-        # 2. Excluir rutas exentas de la verificación de App Key
-        for pattern in self.exempt_paths:
-            if pattern.match(request.path):
-                return self.get_response(request)
-
-        # 3. Aplicar la verificación de App Key solo a las rutas /api/ (no exentas)
-        # Esto previene que el middleware intente validar la clave para rutas no API.
-        if request.path.startswith('/api/'):
-            provided_app_key = request.headers.get('X-App-Key') # El encabezado que tu APK enviará
-
-            # Comprobar si la clave requerida está configurada en settings.py
-            if not self.required_app_key:
-                # Esto es un error de configuración.
-                # En producción, esto debería ser un error fatal o un log muy visible.
-                print("ADVERTENCIA: REQUIRED_APP_KEY no está definida en settings.py. El middleware de App Key es ineficaz.")
-                return JsonResponse(
-                    {"detail": "Error de configuración del servidor: clave de aplicación no definida."},
-                    status=500
-                )
-
-            # Validar si la clave proporcionada coincide con la clave requerida
-            if not provided_app_key or provided_app_key != self.required_app_key:
-                return JsonResponse(
-                    {"detail": "Acceso no autorizado. Clave de aplicación inválida o faltante."},
-                    status=401 # 401 Unauthorized es una respuesta estándar para credenciales faltantes/inválidas
-                )
-        
+            return None
+
+        # 2. Solo se validan las rutas /api/ no exentas
+        match = self.path_re.match(request.path)
+        if match is None or match.lastgroup == 'exempt':
+            return None
+
+        # Comprobar si hay alguna clave configurada en settings.py
+        if not self.app_keys:
+            # Esto es un error de configuración.
+            logger.error("REQUIRED_APP_KEY/APP_KEYS no están definidas. El middleware de App Key es ineficaz.")
+            return JsonResponse(
+                {"detail": "Error de configuración del servidor: clave de aplicación no definida."},
+                status=500
+            )
+
+        # 3. Validar la clave (El encabezado que tu APK enviará). Se compara con
+        # todas las claves, sin cortar en la primera, para no filtrar por tiempos.
+        provided_app_key = request.headers.get('X-App-Key', '').encode()
+        valid = False
+        for key in self.app_keys:
+            valid |= hmac.compare_digest(provided_app_key, key)
+        if not provided_app_key or not valid:
+            return JsonResponse(
+                {"detail": "Acceso no autorizado. Clave de aplicación inválida o faltante."},
+                status=401 # 401 Unauthorized es una respuesta estándar para credenciales faltantes/inválidas
+            )
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         # Si la clave es válida o la ruta está exenta, pasar la solicitud al siguiente middleware/vista
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        return self.check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.check(request) or await self.get_response(request)
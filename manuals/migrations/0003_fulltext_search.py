@@ -0,0 +1,74 @@
+# Índices de búsqueda de texto completo para manuales y procedimientos.
+#
+# - SQLite: tablas virtuales FTS5 de contenido externo, sincronizadas con
+#   triggers sobre `manuales` y `procedimientos`.
+# - PostgreSQL: columna generada `search_vector` (tsvector, diccionario
+#   'spanish') con índice GIN.
+# - Otros motores: no se crea nada; la búsqueda usa el fallback icontains.
+
+from django.db import migrations
+
+# (tabla, columna del título, columna del cuerpo)
+INDEXED_TABLES = [
+    ('manuales', 'title', 'description'),
+    ('procedimientos', 'title', 'content'),
+]
+
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, {title}, {body}) VALUES (new.id, new.{title}, new.{body});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, {title}, {body}) VALUES ('delete', old.id, old.{title}, old.{body});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {title}, {body} ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, {title}, {body}) VALUES ('delete', old.id, old.{title}, old.{body});
+        INSERT INTO {table}_fts(rowid, {title}, {body}) VALUES (new.id, new.{title}, new.{body});
+    END""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, title, body in INDEXED_TABLES:
+        if vendor == 'sqlite':
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                f"{title}, {body}, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            for trigger in SQLITE_TRIGGERS:
+                schema_editor.execute(trigger.format(table=table, title=title, body=body))
+            schema_editor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+        elif vendor == 'postgresql':
+            schema_editor.execute(
+                f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+                f"setweight(to_tsvector('spanish', coalesce({title}, '')), 'A') || "
+                f"setweight(to_tsvector('spanish', coalesce({body}, '')), 'B')) STORED"
+            )
+            schema_editor.execute(
+                f"CREATE INDEX {table}_search_gin ON {table} USING GIN (search_vector)"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, title, body in INDEXED_TABLES:
+        if vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+        elif vendor == 'postgresql':
+            schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_gin")
+            schema_editor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0002_alter_category_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,51 @@
+import uuid
+
+from django.db import migrations, models
+
+
+def populate_series_id(apps, schema_editor):
+    """
+    Asigna a cada cadena de versiones existente (enlazada por previous_version)
+    un mismo series_id, partiendo de la versión raíz.
+    """
+    DocumentFile = apps.get_model('manuals', 'DocumentFile')
+    previous_of = dict(DocumentFile.objects.values_list('id', 'previous_version_id'))
+
+    series_of = {}
+    for pk in previous_of:
+        chain = []
+        current = pk
+        while current is not None and current not in series_of:
+            chain.append(current)
+            current = previous_of.get(current)
+        series_id = series_of[current] if current is not None else uuid.uuid4()
+        for member in chain:
+            series_of[member] = series_id
+
+    for pk, series_id in series_of.items():
+        DocumentFile.objects.filter(pk=pk).update(series_id=series_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0003_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentfile',
+            name='series_id',
+            field=models.UUIDField(editable=False, null=True, help_text='Identificador compartido por todas las versiones de un mismo documento'),
+        ),
+        migrations.RunPython(populate_series_id, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='documentfile',
+            name='series_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, help_text='Identificador compartido por todas las versiones de un mismo documento'),
+        ),
+        migrations.AddIndex(
+            model_name='documentfile',
+            index=models.Index(fields=['series_id', '-version_number'], name='bytefiles_series_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:44
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0004_documentfile_series_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('description', models.CharField(blank=True, max_length=255, null=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('total_size', models.PositiveBigIntegerField()),
+                ('received_bytes', models.PositiveBigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, help_text='Suma SHA-256 del archivo completo', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(blank=True, help_text='Versión vigente que se reemplaza', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='manuals.documentfile')),
+                ('procedure', models.ForeignKey(blank=True, help_text='Procedimiento del nuevo documento', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='manuals.procedure')),
+                ('result', models.ForeignKey(blank=True, help_text='Documento creado al completar la subida', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='manuals.documentfile')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sesión de Subida',
+                'verbose_name_plural': 'Sesiones de Subida',
+                'db_table': 'upload_sessions',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:46
+
+import manuals.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0005_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='SHA-256 del contenido (clave del blob en disco)', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentfile',
+            name='original_name',
+            field=models.CharField(blank=True, editable=False, help_text='Nombre con el que se subió el archivo', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='documentfile',
+            name='file',
+            field=models.FileField(storage=manuals.storage.ContentAddressedStorage(), upload_to='document_files/'),
+        ),
+    ]
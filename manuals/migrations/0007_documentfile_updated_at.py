@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0006_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentfile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
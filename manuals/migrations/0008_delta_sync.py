@@ -0,0 +1,46 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0007_documentfile_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text="Nombre del modelo, ej. 'procedure'", max_length=50)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Registro Eliminado',
+                'verbose_name_plural': 'Registros Eliminados',
+                'db_table': 'registros_eliminados',
+                'ordering': ['deleted_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['updated_at'], name='categorias_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentfile',
+            index=models.Index(fields=['updated_at'], name='bytefiles_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manual',
+            index=models.Index(fields=['updated_at'], name='manuales_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='procedure',
+            index=models.Index(fields=['updated_at'], name='procedimientos_updated_idx'),
+        ),
+    ]
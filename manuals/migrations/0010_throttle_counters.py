@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0009_profile_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleCounter',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.BigIntegerField(db_index=True)),
+            ],
+            options={
+                'db_table': 'throttle_counters',
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.2 on 2026-10-18 20:17
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+fulltext = import_module('manuals.migrations.0003_fulltext_search')
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # En SQLite, añadir o quitar la columna rehace la tabla `procedimientos` y
+    # se pierden sus triggers FTS (0003_fulltext_search); el índice FTS sigue
+    # siendo válido porque los ids se conservan.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, title, body in fulltext.INDEXED_TABLES:
+        for trigger in fulltext.SQLITE_TRIGGERS:
+            schema_editor.execute(trigger.format(table=table, title=title, body=body))
+
+
+def fill_manual_title(apps, schema_editor):
+    Manual = apps.get_model('manuals', 'Manual')
+    Procedure = apps.get_model('manuals', 'Procedure')
+    Procedure.objects.update(
+        manual_title=Subquery(Manual.objects.filter(pk=OuterRef('manual_id')).values('title')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0011_profile_avatar_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='procedure',
+            options={'ordering': ['manual_title', 'title', '-version'], 'verbose_name': 'Procedimiento', 'verbose_name_plural': 'Procedimientos'},
+        ),
+        # Al deshacer, RemoveField también rehace la tabla: los triggers se restauran después
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='procedure',
+            name='manual_title',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(fill_manual_title, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['created_at'], name='categorias_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentfile',
+            index=models.Index(condition=models.Q(('is_latest', True)), fields=['procedure', '-version_number', '-uploaded_at'], name='bytefiles_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentfile',
+            index=models.Index(condition=models.Q(('is_latest', True)), fields=['-version_number', '-uploaded_at', '-id'], name='bytefiles_latest_orden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentfile',
+            index=models.Index(condition=models.Q(('is_latest', True)), fields=['uploaded_at'], name='bytefiles_latest_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manual',
+            index=models.Index(fields=['title', '-created_at', 'id'], name='manuales_orden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manual',
+            index=models.Index(fields=['category', 'title'], name='manuales_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manual',
+            index=models.Index(fields=['created_at'], name='manuales_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='procedure',
+            index=models.Index(fields=['manual_title', 'title', '-version', 'id'], name='procedimientos_orden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='procedure',
+            index=models.Index(fields=['last_reviewed'], name='procedimientos_reviewed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='procedure',
+            index=models.Index(fields=['created_at'], name='procedimientos_created_idx'),
+        ),
+    ]
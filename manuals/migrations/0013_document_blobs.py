@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0012_procedure_manual_title_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'Blob de Archivo',
+                'verbose_name_plural': 'Blobs de Archivos',
+                'db_table': 'bytefiles_blobs',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manuals', '0013_document_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='last_write_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,9 +1,13 @@
+import os
+import uuid
+
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from auditlog.registry import auditlog
+from .storage import document_storage
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Nombre de la Categoría")
@@ -16,6 +20,10 @@ class Category(models.Model):
         verbose_name_plural = "Categorías"
         ordering = ['name']
         db_table = 'categorias' 
+        indexes = [
+            models.Index(fields=['updated_at'], name='categorias_updated_idx'),
+            models.Index(fields=['created_at'], name='categorias_created_idx'),
+        ]
     def __str__(self):
         return self.name
 auditlog.register(Category)
@@ -32,6 +40,14 @@ class Manual(models.Model):
         verbose_name_plural = "Manuales"
         ordering = ['title', '-created_at']
         db_table = 'manuales' 
+        indexes = [
+            models.Index(fields=['updated_at'], name='manuales_updated_idx'),
+            # Orden por defecto (con el id que añade la paginación como desempate)
+            models.Index(fields=['title', '-created_at', 'id'], name='manuales_orden_idx'),
+            # ?category= con el orden por defecto
+            models.Index(fields=['category', 'title'], name='manuales_categoria_idx'),
+            models.Index(fields=['created_at'], name='manuales_created_idx'),
+        ]
 
     def __str__(self):
         return self.title    
@@ -45,15 +61,32 @@ class Procedure(models.Model):
     last_reviewed = models.DateField(default=timezone.now, verbose_name="Última Revisión")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Copia de manual.title para ordenar sin JOIN (la actualiza la señal de Manual)
+    manual_title = models.CharField(max_length=200, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Procedimiento"
         verbose_name_plural = "Procedimientos"
+        # También es el índice (manual_id, title, version) de ?manual=
         unique_together = ('manual', 'title', 'version') 
-        ordering = ['manual__title', 'title', '-version']
+        ordering = ['manual_title', 'title', '-version']
         db_table = 'procedimientos' 
+        indexes = [
+            models.Index(fields=['updated_at'], name='procedimientos_updated_idx'),
+            # Orden por defecto (con el id que añade la paginación como desempate)
+            models.Index(fields=['manual_title', 'title', '-version', 'id'], name='procedimientos_orden_idx'),
+            models.Index(fields=['last_reviewed'], name='procedimientos_reviewed_idx'),
+            models.Index(fields=['created_at'], name='procedimientos_created_idx'),
+        ]
     def __str__(self):
         return f"{self.title} (v{self.version}) - {self.manual.title}"
+
+    def save(self, *args, **kwargs):
+        self.manual_title = self.manual.title
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'manual' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'manual_title'}
+        super().save(*args, **kwargs)
 auditlog.register(Procedure)
 
 
@@ -61,32 +94,200 @@ class DocumentFile(models.Model):
 
     procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE, related_name='document_files')
     title = models.CharField(max_length=255, help_text="Título del documento (constante a través de versiones)")
-    file = models.FileField(upload_to='document_files/')
+    file = models.FileField(upload_to='document_files/', storage=document_storage)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False,
+                                    help_text="SHA-256 del contenido (clave del blob en disco)")
+    original_name = models.CharField(max_length=255, blank=True, editable=False,
+                                     help_text="Nombre con el que se subió el archivo")
     description = models.CharField(max_length=255, blank=True, null=True, 
                                    help_text="Descripción de esta versión específica")
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploaded_document_files')
     version_number = models.PositiveIntegerField(default=1)
     is_latest = models.BooleanField(default=True)
     previous_version = models.OneToOneField('self', on_delete=models.SET_NULL, null=True, blank=True, 
                                             related_name='next_version', help_text="Versión anterior en el historial")
+    series_id = models.UUIDField(default=uuid.uuid4, editable=False,
+                                 help_text="Identificador compartido por todas las versiones de un mismo documento")
     class Meta:
         ordering = ['-version_number', '-uploaded_at'] 
         verbose_name = "Archivo Adjunto"
         verbose_name_plural = "Archivos Adjuntos"
         db_table = 'bytefiles'     
+        indexes = [
+            # Historial completo de un documento en una sola consulta indexada
+            models.Index(fields=['series_id', '-version_number'], name='bytefiles_series_idx'),
+            models.Index(fields=['updated_at'], name='bytefiles_updated_idx'),
+            # Los listados y el prefetch solo leen la versión vigente (is_latest=True)
+            models.Index(fields=['procedure', '-version_number', '-uploaded_at'],
+                         condition=models.Q(is_latest=True), name='bytefiles_latest_idx'),
+            models.Index(fields=['-version_number', '-uploaded_at', '-id'],
+                         condition=models.Q(is_latest=True), name='bytefiles_latest_orden_idx'),
+            models.Index(fields=['uploaded_at'], condition=models.Q(is_latest=True),
+                         name='bytefiles_latest_uploaded_idx'),
+        ]
     def __str__(self):
         return f"{self.procedure.title} - {self.title} (v{self.version_number})"
+
+    def save(self, *args, **kwargs):
+        if not self.file or self.file._committed:
+            return super().save(*args, **kwargs)
+        content = self.file.file
+        content.sha256 = getattr(content, 'sha256', None) or document_storage.content_hash(content)
+        with transaction.atomic():
+            # Hasta el commit nadie puede borrar el blob que se va a reutilizar
+            # (ver release_document_blob).
+            DocumentBlob.lock(content.sha256)
+            # Se guarda el blob antes que la fila para conocer su hash:
+            # si el contenido ya existe en disco no se vuelve a escribir.
+            self.original_name = os.path.basename(self.file.name)
+            self.file.save(self.file.name, content, save=False)
+            self.content_hash = document_storage.hash_from_name(self.file.name)
+            super().save(*args, **kwargs)
+
+    def create_new_version(self, file, uploaded_by, title=None, description=None):
+        """
+        Crea la siguiente versión de este documento con `file` y la marca como
+        la más reciente. Título y descripción se heredan si no se indican.
+        """
+        with transaction.atomic():
+            # 1. Marcar la versión actual como NO la más reciente
+            self.is_latest = False
+            # updated_at también: la sincronización delta tiene que enviar el cambio
+            self.save(update_fields=['is_latest', 'updated_at'])
+
+            # 2. Crear una NUEVA instancia de DocumentFile para la nueva versión
+            return DocumentFile.objects.create(
+                procedure=self.procedure,
+                title=title if title is not None else self.title,
+                description=description if description is not None else self.description,
+                file=file,
+                uploaded_by=uploaded_by,
+                version_number=self.version_number + 1, # Incrementa la versión
+                is_latest=True, # Esta es la nueva última versión
+                previous_version=self, # Enlaza a la versión anterior (la que era "latest")
+                series_id=self.series_id # Misma serie que el resto del historial
+            )
 auditlog.register(DocumentFile)
 
 
+class DocumentBlob(models.Model):
+    """
+    Fila por blob del almacenamiento, usada como cerrojo: reutilizar un blob
+    al guardar un DocumentFile y borrarlo al quedarse sin referencias se
+    serializan con select_for_update sobre ella (en SQLite las transacciones
+    ya son IMMEDIATE y se serializan igual).
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)
+
+    class Meta:
+        verbose_name = "Blob de Archivo"
+        verbose_name_plural = "Blobs de Archivos"
+        db_table = 'bytefiles_blobs'
+
+    def __str__(self):
+        return self.content_hash
+
+    @classmethod
+    def lock(cls, content_hash):
+        """Bloquea la fila de `content_hash` (creándola si no existe) hasta el final de la transacción."""
+        cls.objects.get_or_create(content_hash=content_hash)
+        return cls.objects.select_for_update().get(content_hash=content_hash)
+
+
+@receiver(post_delete, sender=DocumentFile)
+def release_document_blob(sender, instance, **kwargs):
+    """
+    Borra el blob del disco cuando ya ningún DocumentFile lo referencia
+    (tras el commit, para no perder el archivo si la transacción se revierte).
+    """
+    name = instance.file.name
+    if not name:
+        return
+
+    def release():
+        with transaction.atomic():
+            # Con el cerrojo, una subida que reutiliza este blob o ya está
+            # confirmada (y se ve aquí) o espera a que termine el borrado.
+            if instance.content_hash:
+                DocumentBlob.lock(instance.content_hash)
+            if DocumentFile.objects.filter(content_hash=instance.content_hash, file=name).exists():
+                return
+            instance.file.storage.delete(name)
+            DocumentBlob.objects.filter(content_hash=instance.content_hash).delete()
+    transaction.on_commit(release)
+
+
+class DeletedRecord(models.Model):
+    """
+    Marca de borrado (tombstone) de un objeto del catálogo, para que la
+    sincronización delta (/api/v1/sync/) pueda informar de los borrados.
+    """
+    model = models.CharField(max_length=50, help_text="Nombre del modelo, ej. 'procedure'")
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['deleted_at']
+        verbose_name = "Registro Eliminado"
+        verbose_name_plural = "Registros Eliminados"
+        db_table = 'registros_eliminados'
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} ({self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class UploadSession(models.Model):
+    """
+    Subida por partes (reanudable) de un archivo adjunto. Las partes se
+    escriben directamente en un archivo parcial en disco; al completarse se
+    crea el DocumentFile (primera versión, o nueva versión de `document`).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='upload_sessions', help_text="Procedimiento del nuevo documento")
+    document = models.ForeignKey(DocumentFile, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='upload_sessions', help_text="Versión vigente que se reemplaza")
+    title = models.CharField(max_length=255, blank=True)
+    description = models.CharField(max_length=255, blank=True, null=True)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Suma SHA-256 del archivo completo")
+    result = models.ForeignKey(DocumentFile, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='+', help_text="Documento creado al completar la subida")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Sesión de Subida"
+        verbose_name_plural = "Sesiones de Subida"
+        db_table = 'upload_sessions'
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def is_complete(self):
+        return self.result_id is not None
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Versiones reducidas del avatar (ver avatars.py): {'source': ..., 'sizes': {'48': {'webp': ..., 'jpeg': ...}}}
+    avatar_renditions = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(max_length=500, blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     address = models.CharField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Se incrementa para revocar todos los JWT del usuario (ver authentication.py)
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+    # Última escritura del usuario en el catálogo: lee del primario un rato (ver db_routers.py)
+    last_write_at = models.DateTimeField(null=True, blank=True, editable=False)
     class Meta:
         ordering = ['-uploaded_at'] 
         verbose_name = "Perfil del Usuario"
@@ -103,4 +304,17 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
-auditlog.register(Profile)
\ No newline at end of file
+auditlog.register(Profile)
+
+class ThrottleCounter(models.Model):
+    """
+    Contador de peticiones por ventana fija, compartido por todos los
+    workers (ver throttling.py). `key` incluye el scope, el usuario o IP y
+    el número de ventana.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    count = models.PositiveIntegerField(default=0)
+    expires_at = models.BigIntegerField(db_index=True) # epoch en segundos
+
+    class Meta:
+        db_table = 'throttle_counters'
@@ -0,0 +1,123 @@
+# manuals/pagination.py
+
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class ModelOrderingCursorPagination(CursorPagination):
+    """
+    Paginación por cursor (keyset) basada en el `Meta.ordering` de cada modelo.
+
+    En lugar de OFFSET, cada página filtra a partir de la posición del último
+    registro entregado, por lo que el coste de una página no crece con el
+    tamaño del catálogo. El tamaño de página lo puede pedir el cliente con
+    `?page_size=`, pero nunca por encima de `API_MAX_PAGE_SIZE`.
+
+    A diferencia de CursorPagination de DRF (que solo guarda el primer campo
+    del orden y resuelve los empates con un offset), el cursor guarda el
+    valor de todos los campos del orden, pk incluido, y la página siguiente
+    se filtra con la comparación completa: (a, b, pk) > (x, y, z). Los campos
+    del orden no deben admitir NULL.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    ordering = None
+
+    def get_ordering(self, request, queryset, view):
+        # Si la vista no define un orden explícito, se usa el del modelo
+        # (ej. ['title', '-created_at'] para Manual).
+        if self.ordering is None:
+            self.ordering = tuple(queryset.model._meta.ordering) or ('-pk',)
+        ordering = super().get_ordering(request, queryset, view)
+
+        # La clave primaria como desempate garantiza un orden total y estable
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering += ('-pk',) if ordering[0].startswith('-') else ('pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+        position = self.decode_position(self.cursor.position) if self.cursor else None
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+        self.position = position
+        return self.page
+
+    @staticmethod
+    def after(ordering, position):
+        """
+        Filas posteriores a `position` según `ordering`: el primer campo como
+        rango (aprovecha el índice) y el resto como desempate.
+        """
+        condition, equal = Q(), Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        first = ordering[0]
+        return Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]}) & condition
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position) if position is not None else None
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if values is not None and (not isinstance(values, list) or len(values) != len(self.ordering)):
+            # Cursor de otro orden (ej. cambió ?ordering=)
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def position_of(self, instance):
+        return json.dumps([self._get_position_from_instance(instance, [field]) for field in self.ordering])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.position_of(self.page[-1]) if self.page else json.dumps(self.position)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.position_of(self.page[0]) if self.page else json.dumps(self.position)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        # Soporta órdenes sobre relaciones, ej. 'manual__title' en Procedure.
+        field_name = ordering[0].lstrip('-')
+        if isinstance(instance, dict):
+            # Filas de .values() (FastListMixin): la pk puede venir como 'pk' o 'id'
+            if field_name in ('pk', 'id'):
+                return str(instance['pk'] if 'pk' in instance else instance['id'])
+            return str(instance[field_name])
+        attr = instance
+        for part in field_name.split('__'):
+            attr = getattr(attr, part) if attr is not None else None
+        return str(attr)
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .roles import has_group
+
 class IsAdminOrReadOnly(permissions.BasePermission):
     """
     Permite acceso de solo lectura a usuarios no autenticados,
@@ -17,7 +19,7 @@ class IsEditor(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user or not request.user.is_authenticated:
             return False
-        return request.user.groups.filter(name='Editores').exists()
+        return has_group(request.user, 'Editores')
 
 class IsViewer(permissions.BasePermission):
     """
@@ -27,5 +29,5 @@ class IsViewer(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
         if request.method in permissions.SAFE_METHODS: # GET, HEAD, OPTIONS
-            return request.user.groups.filter(name='Visualizadores').exists()
+            return has_group(request.user, 'Visualizadores')
         return False 
\ No newline at end of file
@@ -0,0 +1,29 @@
+# manuals/roles.py
+"""
+Resolución de los grupos (roles) de un usuario sin consultar la base de
+datos en cada comprobación de permisos.
+
+Los nombres de grupo se cargan una vez por petición y quedan guardados en el
+objeto usuario. No se cachean entre peticiones: con una caché por proceso,
+invalidarla solo limpiaría el worker que hizo el cambio. Las lecturas con JWT
+ni siquiera consultan: los grupos vienen en los claims del token (ver
+authentication.py).
+"""
+
+# Atributo del usuario donde se guardan los grupos durante la petición
+REQUEST_ATTR = '_manuals_group_names'
+
+
+def get_group_names(user):
+    """frozenset con los nombres de los grupos de `user`."""
+    if not user or not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, REQUEST_ATTR, None)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        setattr(user, REQUEST_ATTR, names)
+    return names
+
+
+def has_group(user, name):
+    return name in get_group_names(user)
@@ -0,0 +1,168 @@
+# manuals/search.py
+"""
+Búsqueda de texto completo sobre manuales y procedimientos.
+
+Usa el índice creado por la migración 0003_fulltext_search:
+FTS5 en SQLite y `search_vector` (tsvector 'spanish' + GIN) en PostgreSQL.
+Para otros motores se recurre a `icontains`, sin ranking ni resaltado.
+
+El fragmento (`snippet`) es HTML: el texto va escapado y solo las marcas de
+resaltado son etiquetas.
+"""
+import re
+from html import escape
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Manual, Procedure
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+# El motor marca las coincidencias con estos caracteres de uso privado; se
+# cambian por las etiquetas después de escapar el texto.
+_START, _STOP = '\ue000', '\ue001'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@dataclass(frozen=True)
+class IndexedModel:
+    model: type
+    title: str
+    body: str
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+
+# Clave = valor de `?type=` en /api/v1/search/
+INDEXED_MODELS = {
+    'manual': IndexedModel(Manual, 'title', 'description'),
+    'procedure': IndexedModel(Procedure, 'title', 'content'),
+}
+
+
+def get_terms(query):
+    """Palabras de la búsqueda, sin operadores ni signos de puntuación."""
+    return WORD_RE.findall(query or '')
+
+
+def highlight(snippet):
+    """Fragmento del motor (con marcas) -> HTML escapado con <mark>."""
+    return escape(snippet or '').replace(_START, HIGHLIGHT_START).replace(_STOP, HIGHLIGHT_STOP)
+
+
+def _sqlite_match(terms):
+    # Cada término entre comillas (sin sintaxis FTS5 del usuario) y el último
+    # como prefijo, para poder buscar mientras se escribe.
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _postgres_tsquery(terms):
+    return ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+
+
+def matching_ids_sql(indexed, terms):
+    """
+    Subconsulta (sql, params) con los ids que coinciden con `terms`,
+    o None si el motor no tiene índice de texto completo.
+    """
+    if connection.vendor == 'sqlite':
+        return f'SELECT rowid FROM {indexed.table}_fts WHERE {indexed.table}_fts MATCH %s', [_sqlite_match(terms)]
+    if connection.vendor == 'postgresql':
+        return (f"SELECT id FROM {indexed.table} WHERE search_vector @@ to_tsquery('spanish', %s)",
+                [_postgres_tsquery(terms)])
+    return None
+
+
+def _search_sqlite(kind, indexed, terms, limit):
+    table = indexed.table
+    sql = (
+        f"SELECT t.id, t.{indexed.title}, "
+        f"snippet({table}_fts, 1, %s, %s, '…', 16), "
+        f"bm25({table}_fts, 10.0, 1.0) AS rank "
+        f"FROM {table}_fts JOIN {table} t ON t.id = {table}_fts.rowid "
+        f"WHERE {table}_fts MATCH %s ORDER BY rank LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_START, _STOP, _sqlite_match(terms), limit])
+        # bm25 es menor cuanto más relevante; se invierte para ordenar igual que Postgres
+        return [
+            {'type': kind, 'id': pk, 'title': title, 'snippet': highlight(snippet), 'rank': -rank}
+            for pk, title, snippet, rank in cursor.fetchall()
+        ]
+
+
+def _search_postgres(kind, indexed, terms, limit):
+    table = indexed.table
+    options = f'StartSel={_START}, StopSel={_STOP}, MaxWords=30, MinWords=10'
+    sql = (
+        f"SELECT t.id, t.{indexed.title}, "
+        f"ts_headline('spanish', coalesce(t.{indexed.body}, ''), q, %s), "
+        f"ts_rank_cd(t.search_vector, q) AS rank "
+        f"FROM {table} t, to_tsquery('spanish', %s) q "
+        f"WHERE t.search_vector @@ q ORDER BY rank DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [options, _postgres_tsquery(terms), limit])
+        return [
+            {'type': kind, 'id': pk, 'title': title, 'snippet': highlight(snippet), 'rank': rank}
+            for pk, title, snippet, rank in cursor.fetchall()
+        ]
+
+
+def _search_fallback(kind, indexed, terms, limit):
+    condition = Q()
+    for term in terms:
+        condition &= Q(**{f'{indexed.title}__icontains': term}) | Q(**{f'{indexed.body}__icontains': term})
+    rows = indexed.model.objects.filter(condition).values_list('id', indexed.title, indexed.body)[:limit]
+    return [
+        {'type': kind, 'id': pk, 'title': title, 'snippet': highlight((body or '')[:200]), 'rank': 0.0}
+        for pk, title, body in rows
+    ]
+
+
+def search(query, kinds=None, limit=20):
+    """
+    Busca `query` en los modelos indicados (`kinds`, por defecto todos) y
+    devuelve hasta `limit` resultados ordenados por relevancia, cada uno con
+    un fragmento del texto con las coincidencias resaltadas.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return []
+    backend = {
+        'sqlite': _search_sqlite,
+        'postgresql': _search_postgres,
+    }.get(connection.vendor, _search_fallback)
+
+    results = []
+    for kind in kinds or INDEXED_MODELS:
+        results.extend(backend(kind, INDEXED_MODELS[kind], terms, limit))
+    results.sort(key=lambda hit: hit['rank'], reverse=True)
+    return results[:limit]
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Igual que `SearchFilter` (`?search=`), pero resuelve la búsqueda contra
+    el índice de texto completo en lugar de `LIKE '%term%'`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        indexed = next(
+            (indexed for indexed in INDEXED_MODELS.values() if indexed.model is queryset.model),
+            None,
+        )
+        terms = get_terms(request.query_params.get(self.search_param, ''))
+        subquery = matching_ids_sql(indexed, terms) if indexed and terms else None
+        if subquery is None:
+            return super().filter_queryset(request, queryset, view)
+        return queryset.filter(pk__in=RawSQL(*subquery))
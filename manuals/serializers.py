@@ -1,8 +1,13 @@
 from django.contrib.auth.models import User, Group
 from rest_framework import serializers
-from .models import Category, Manual, Procedure, DocumentFile, Profile
-
-class CategorySerializer(serializers.ModelSerializer):
+from rest_framework.reverse import reverse
+from django.conf import settings
+from .models import Category, Manual, Procedure, DocumentFile, Profile, UploadSession
+from .roles import get_group_names
+from . import avatars
+from .sparse import SparseFieldsMixin
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
@@ -14,9 +19,28 @@ class UserSerializerForDocument(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name']
 
 
-class DocumentFileSerializer(serializers.ModelSerializer):
+def download_url(document_pk, request):
+    return reverse('documentfile-download', kwargs={'pk': document_pk}, request=request)
+
+
+class DocumentDownloadField(serializers.FileField):
+    """
+    Acepta el archivo subido como cualquier FileField, pero al leer devuelve
+    la descarga protegida (/files/{id}/download/: App Key, permisos, Range) y
+    nunca la URL directa de /media/.
+    """
+    def to_representation(self, value):
+        if not value:
+            return None
+        return download_url(value.instance.pk, self.context.get('request'))
+
+
+class DocumentFileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     uploaded_by = UserSerializerForDocument(read_only=True)
+    file = DocumentDownloadField()
     file_url = serializers.SerializerMethodField()
+    expandable_fields = {'procedure': ('manuals.serializers.ProcedureListSerializer', {})}
+    sparse_sources = {'file_url': ['file']}
     class Meta:
         model = DocumentFile
         fields = '__all__'
@@ -26,43 +50,39 @@ class DocumentFileSerializer(serializers.ModelSerializer):
         #     'is_latest', 'previous_version'
         # ]
         read_only_fields = ['uploaded_at', 'uploaded_by', 'version_number', 'is_latest', 'previous_version']
-        extra_kwargs = {
-            'file': {'required': True}
-        }
-    def get_file_url(self, obj):
-       
-        if obj.file:
-            request = self.context.get('request')
-            if request is not None:
-                return request.build_absolute_uri(obj.file.url)
-            return obj.file.url
-        return None
     def get_file_url(self, obj):
-            if obj.file:
-                return self.context['request'].build_absolute_uri(obj.file.url)
-            return None
+        # Igual que `file`; se mantiene para los clientes que ya lo usan
+        return download_url(obj.pk, self.context.get('request')) if obj.file else None
 
 
 
-class DocumentFileHistorySerializer(serializers.ModelSerializer):
+class DocumentFileHistorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     uploaded_by = UserSerializerForDocument(read_only=True)
+    file = DocumentDownloadField(read_only=True)
 
     class Meta:
         model = DocumentFile
         fields = '__all__'
-        read_only_fields = fields 
+        read_only_fields = [field.name for field in DocumentFile._meta.fields]
 
 
-class ProcedureSerializer(serializers.ModelSerializer):
+class ProcedureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     files = DocumentFileSerializer(many=True, read_only=True)
     document_files = DocumentFileSerializer(many=True, read_only=True) 
+    expandable_fields = {'manual': ('manuals.serializers.ManualListSerializer', {})}
 
     class Meta:
         model = Procedure
-        fields = '__all__'
+        exclude = ['manual_title'] # Clave de orden interna
         read_only_fields = ['created_at', 'updated_at']
 
-class ManualSerializer(serializers.ModelSerializer):
+class ProcedureListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Sin archivos anidados (ej. sincronización, donde los archivos van aparte)
+    class Meta:
+        model = Procedure
+        exclude = ['manual_title']
+
+class ManualSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     procedures = ProcedureSerializer(many=True, read_only=True) # Para incluir procedimientos en el manual
     category = CategorySerializer(read_only=True)# Para mostrar el nombre de la categoría
    
@@ -71,8 +91,40 @@ class ManualSerializer(serializers.ModelSerializer):
         model = Manual
         fields = '__all__'
         read_only_fields = ['created_at', 'updated_at']
-class ManualListSerializer(serializers.ModelSerializer):
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'procedure', 'document', 'title', 'description', 'filename',
+            'total_size', 'received_bytes', 'sha256', 'result', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['received_bytes', 'sha256', 'result', 'created_at', 'updated_at']
+
+    def validate_total_size(self, value):
+        max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024)
+        if value > max_size:
+            raise serializers.ValidationError(f"El archivo no puede superar los {max_size} bytes.")
+        return value
+
+    def validate(self, data):
+        procedure, document = data.get('procedure'), data.get('document')
+        if bool(procedure) == bool(document):
+            raise serializers.ValidationError(
+                "Indique 'procedure' (documento nuevo) o 'document' (nueva versión), pero no ambos."
+            )
+        if document and not document.is_latest:
+            raise serializers.ValidationError({"document": "Solo se puede versionar la versión más reciente."})
+        if procedure and not data.get('title'):
+            raise serializers.ValidationError({"title": "El título es obligatorio para un documento nuevo."})
+        return data
+
+class ManualListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
+    # ?expand=category,procedures
+    expandable_fields = {
+        'category': (CategorySerializer, {}),
+        'procedures': (ProcedureListSerializer, {'many': True}),
+    }
     class Meta:
         model = Manual
         fields = '__all__'
@@ -161,7 +213,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         # 'read_only_fields' se gestiona mejor campo por campo para flexibilidad
 
     def get_groups(self, obj):
-        return [group.name for group in obj.groups.all()]
+        return sorted(get_group_names(obj))
 
 
     def to_representation(self, instance):
@@ -169,9 +221,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
         profile_fields = ['avatar', 'bio', 'phone_number', 'address']
         for field in profile_fields:
             if hasattr(instance, 'profile') and hasattr(instance.profile, field):
-                if field == 'avatar' and instance.profile.avatar:
+                if field == 'avatar':
                     request = self.context.get('request')
-                    if request is not None:
+                    if not instance.profile.avatar:
+                        representation[field] = None
+                    elif request is not None:
                         representation[field] = request.build_absolute_uri(instance.profile.avatar.url)
                     else:
                         representation[field] = instance.profile.avatar.url
@@ -180,6 +234,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
             else:
                 representation[field] = None # O un valor por defecto si no existe
 
+        # URLs de las versiones reducidas ({} mientras se generan: usar `avatar`)
+        profile = getattr(instance, 'profile', None)
+        representation['avatar_renditions'] = (
+            avatars.rendition_urls(profile, self.context.get('request')) if profile else {}
+        )
         return representation
     avatar = serializers.ImageField(required=False, allow_null=True)
 
@@ -193,11 +252,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
             if not value.content_type in ['image/jpeg', 'image/png']:
                 raise serializers.ValidationError("Solo se permiten imágenes JPG o PNG.")
 
-            # Opcional: validar dimensiones (requiere PIL/Pillow y abrir la imagen)
-            # from PIL import Image
-            # img = Image.open(value)
-            # if img.width > 500 or img.height > 500:
-            #     raise serializers.ValidationError("La imagen no debe exceder 500x500 píxeles.")
+            # Dimensiones leídas de la cabecera (ImageField ya abrió la imagen)
+            image = getattr(value, 'image', None)
+            if image is not None:
+                try:
+                    avatars.check_dimensions(*image.size)
+                except avatars.AvatarError as exc:
+                    raise serializers.ValidationError(str(exc))
         return value
     # Sobreescribimos el método 'update' para manejar los campos de User y Profile
     def update(self, instance, validated_data):
@@ -218,6 +279,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
             for attr, value in profile_data.items():
                 setattr(profile, attr, value)
             profile.save() # Guarda el perfil
+            instance.profile = profile # La respuesta se genera con el perfil actualizado
         return instance
 
    
\ No newline at end of file
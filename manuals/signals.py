@@ -2,39 +2,94 @@
 
 from django.contrib.auth.signals import user_login_failed
 from django.dispatch import receiver
-from auditlog.models import LogEntry # Para poder registrarlo como una entrada de log si lo deseas
-from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
 from django.contrib.auth.models import User
-import json # Para guardar detalles del error
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.utils import timezone
+from .models import Category, Manual, Procedure, DocumentFile, DeletedRecord, Profile
+from .cache import bump_version
+from .audit import buffer as audit_buffer
+from .authentication import forget_token_version
+from .login_failures import client_ip, recorder
+from . import avatars, roles
 
 @receiver(user_login_failed)
-def log_user_login_failed(sender, credentials, **kwargs):
-    """
-    Registra un intento de login fallido en LogEntry.
-    """
-    username = credentials.get('username', 'N/A')
-    
-    # Intenta encontrar el usuario, si existe
-    user = None
-    try:
-        user = User.objects.get(username=username)
-    except User.DoesNotExist:
-        pass 
-    action = LogEntry.Action.ACCESS 
-    message = f"Failed login attempt for username: '{username}'"
-    
-    # Detalle adicional si lo quieres más específico
-    change_json = json.dumps({'details': 'Incorrect username or password'})
-
-    LogEntry.objects.create(
-        content_type=ContentType.objects.get_for_model(User),
-        object_pk=str(user.pk) if user else None, 
-        object_repr=str(user) if user else username, 
-        action=action,
-        timestamp=kwargs.get('timestamp'),
-        actor=None, 
-        changes=change_json,
-        remote_addr=kwargs.get('request').META.get('REMOTE_ADDR') if 'request' in kwargs and kwargs.get('request') else None,
+def log_user_login_failed(sender, credentials, request=None, **kwargs):
+    """
+    Cuenta el intento fallido en memoria; el LogEntry resumen por
+    (usuario, IP) se escribe al cerrarse la ventana (ver login_failures.py).
+    """
+    recorder.record(credentials.get('username', 'N/A'), client_ip(request))
+    audit_buffer.start()
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Manual)
+@receiver([post_save, post_delete], sender=Procedure)
+@receiver([post_save, post_delete], sender=DocumentFile)
+def invalidate_catalogue_cache(sender, **kwargs):
+    """
+    Invalida las respuestas cacheadas que dependen del modelo modificado.
+    Se repite tras el commit para descartar lo que otra petición haya cacheado
+    mientras la transacción seguía abierta.
+    """
+    bump_version(sender)
+    transaction.on_commit(lambda: bump_version(sender))
 
+
+@receiver(post_save, sender=Manual)
+def sync_procedure_manual_title(sender, instance, **kwargs):
+    """Mantiene al día `Procedure.manual_title` (clave de orden de los procedimientos)."""
+    Procedure.objects.filter(manual=instance).exclude(manual_title=instance.title).update(
+        manual_title=instance.title
     )
-    print(f"AUDITLOG: Failed login attempt for username: {username}") 
\ No newline at end of file
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=DocumentFile)
+@receiver(pre_delete, sender=User)
+def touch_set_null_referrers(sender, instance, **kwargs):
+    """
+    Los SET_NULL (manual.category, file.previous_version, file.uploaded_by)
+    se hacen con un UPDATE que no toca `updated_at`: sin esto la
+    sincronización delta nunca enviaría el id que quedó en NULL.
+    """
+    for relation in sender._meta.related_objects:
+        model = relation.related_model
+        if relation.on_delete is not models.SET_NULL or model not in (Manual, Procedure, DocumentFile):
+            continue
+        if model.objects.filter(**{relation.field.name: instance}).update(updated_at=timezone.now()):
+            bump_version(model)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Manual)
+@receiver(post_delete, sender=Procedure)
+@receiver(post_delete, sender=DocumentFile)
+def record_deletion(sender, instance, **kwargs):
+    """
+    Deja una marca de borrado para la sincronización delta de los clientes móviles.
+    """
+    DeletedRecord.objects.create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_request_groups(sender, instance, action, reverse, **kwargs):
+    """
+    Descarta la copia de los grupos (roles.py) guardada en el usuario si cambian
+    durante la misma petición.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        instance.__dict__.pop(roles.REQUEST_ATTR, None)
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_token_version(sender, instance, **kwargs):
+    # La versión vigente de los tokens se cachea (authentication.py)
+    forget_token_version(instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+def schedule_avatar_renditions(sender, instance, **kwargs):
+    # Solo hace algo si el avatar cambió desde la última generación
+    avatars.schedule(instance)
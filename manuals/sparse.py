@@ -0,0 +1,130 @@
+# manuals/sparse.py
+"""
+Selección de campos en las lecturas: `?fields=id,title` y `?expand=category`.
+
+- `SparseFieldsMixin` (serializadores): con `?fields=` solo se devuelven esos
+  campos del nivel superior; con `?expand=` se sustituye el id de una
+  relación (o se añade una relación) por el objeto anidado definido en
+  `expandable_fields`.
+- `SparseQuerysetMixin` (ViewSets): aplica `.only()` con las columnas que
+  necesitan esos campos (en `filter_queryset`, sobre el queryset ya
+  completo) y expone `wants()` para que `get_queryset` solo haga los
+  prefetch de lo que se va a serializar.
+
+Sin parámetros la respuesta es la de siempre.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import BaseSerializer
+
+
+def query_list(request, name):
+    params = getattr(request, 'query_params', request.GET)
+    return [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+
+
+def _related_paths(select_related, prefix=''):
+    # {'manual': {'category': {}}} -> ['manual__category']
+    for name, children in select_related.items():
+        if children:
+            yield from _related_paths(children, f'{prefix}{name}__')
+        else:
+            yield f'{prefix}{name}'
+
+
+class SparseFieldsMixin:
+    """
+    `expandable_fields`: {campo: (serializador o ruta 'modulo.Clase', kwargs)}.
+    `sparse_sources`: columnas que necesita un campo calculado
+    (ej. {'file_url': ['file']}), para `SparseQuerysetMixin`.
+    """
+    expandable_fields = {}
+    sparse_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Solo el serializador raíz recibe el contexto; los anidados no se recortan
+        request = kwargs.get('context', {}).get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        for name in query_list(request, 'expand'):
+            if name in self.expandable_fields:
+                serializer_class, options = self.expandable_fields[name]
+                if isinstance(serializer_class, str):
+                    serializer_class = import_string(serializer_class)
+                self.fields[name] = serializer_class(read_only=True, **options)
+
+        requested = query_list(request, 'fields')
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
+class SparseQuerysetMixin:
+    """ViewSets: recorta las columnas y los prefetch según `?fields=` / `?expand=`."""
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_serializer(self):
+        if not hasattr(self, '_sparse_serializer'):
+            self._sparse_serializer = self.get_serializer()
+        return self._sparse_serializer
+
+    def wants(self, name):
+        """¿Se va a serializar el campo `name`? (para decidir prefetch)"""
+        if self.action not in self.sparse_actions:
+            return True
+        return name in self.get_sparse_serializer().fields
+
+    def filter_queryset(self, queryset):
+        return self.apply_sparse_fields(super().filter_queryset(queryset))
+
+    def apply_sparse_fields(self, queryset):
+        if self.action not in self.sparse_actions or not query_list(self.request, 'fields'):
+            return queryset
+        serializer = self.get_sparse_serializer()
+        model = queryset.model
+        columns, joined, whole = {model._meta.pk.name}, set(), set()
+
+        sources = []
+        for name, field in serializer.fields.items():
+            if name in serializer.sparse_sources:
+                sources.extend((path, False) for path in serializer.sparse_sources[name])
+            elif field.source == '*':
+                return queryset # Usa el objeto completo: no se recorta
+            else:
+                sources.append(('__'.join(field.source_attrs), isinstance(field, BaseSerializer)))
+        # Las columnas del orden las lee la paginación por cursor
+        for path in list(model._meta.ordering) + query_list(self.request, 'ordering'):
+            sources.append((path.lstrip('-'), False))
+
+        for path, nested in sources:
+            first = path.split('__')[0]
+            try:
+                model_field = model._meta.get_field(first)
+            except FieldDoesNotExist:
+                if first == 'pk':
+                    continue
+                return queryset # Propiedad u otro atributo: no se arriesga un .only()
+            if model_field.one_to_many or model_field.many_to_many:
+                continue # Se resuelve con prefetch (ver `wants`)
+            if nested or '__' in path:
+                # Objeto relacionado: se une con select_related
+                joined.add(first)
+                columns.add(first if nested else path)
+                if nested:
+                    whole.add(first)
+            else:
+                columns.add(path)
+        # Un serializador anidado necesita el objeto relacionado completo
+        columns = {c for c in columns if '__' not in c or c.split('__')[0] not in whole}
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            # Las relaciones que ya no se usan no se unen (y no chocan con .only())
+            paths = [path for path in _related_paths(select_related) if path.split('__')[0] in joined]
+            queryset = queryset.select_related(None)
+            if paths:
+                queryset = queryset.select_related(*paths)
+        return queryset.only(*columns)
@@ -0,0 +1,68 @@
+# manuals/storage.py
+"""
+Almacenamiento direccionado por contenido para los archivos adjuntos.
+
+Cada archivo se guarda como `<upload_to>/<h[:2]>/<sha256><ext>`, de modo que
+contenidos idénticos (re-subidas, el mismo anexo en varios procedimientos)
+ocupan un único blob en disco. El número de referencias de un blob es el
+número de DocumentFile que apuntan a él; ver `release_document_blob`.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+@deconstructible(path='manuals.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide `_save` a partir del hash: no hace
+        # falta buscar un nombre libre.
+        return name
+
+    @staticmethod
+    def content_hash(content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def blob_name(digest, name):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()[:10]
+        return os.path.join(directory, digest[:2], digest + extension).replace('\\', '/')
+
+    @staticmethod
+    def hash_from_name(name):
+        """Hash SHA-256 codificado en el nombre del blob ('' si no lo es)."""
+        stem = os.path.splitext(os.path.basename(name or ''))[0]
+        return stem if SHA256_RE.match(stem) else ''
+
+    def _save(self, name, content):
+        # Si quien sube el archivo ya conoce su hash (ej. subidas por partes),
+        # no se vuelve a leer.
+        digest = getattr(content, 'sha256', None) or self.content_hash(content)
+        final_name = self.blob_name(digest, name)
+        if self.exists(final_name):
+            # Contenido duplicado: no se escribe nada
+            return final_name
+
+        # Se escribe con un nombre temporal y se renombra de forma atómica,
+        # así dos subidas simultáneas del mismo contenido no se pisan.
+        temp_name = super()._save(f'{final_name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temp_name), self.path(final_name))
+        return final_name
+
+
+document_storage = ContentAddressedStorage()
@@ -0,0 +1,116 @@
+# manuals/streaming.py
+"""
+Listados completos en streaming (exportaciones).
+
+`serializer.data` de un listado sin paginar carga todas las filas y genera
+un único string con todo el JSON. Aquí las filas se leen con
+`.iterator(chunk_size=...)`, se serializan por bloques y el JSON (un array o
+NDJSON, un objeto por línea) se va enviando con `StreamingHttpResponse`: la
+memoria del worker no depende del número de filas.
+
+- `?stream=1` / `?stream=ndjson` en el listado de los ViewSets
+  (`StreamingListMixin`): todo el listado filtrado, sin paginar.
+- `GET /api/v1/export/<tipo>/`: exportación NDJSON (views.ExportView).
+
+Ambos son solo para staff.
+"""
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_serializers import FastSerializer
+
+BUFFER_SIZE = 64 * 1024
+
+
+def chunk_size():
+    return getattr(settings, 'API_STREAM_CHUNK_SIZE', 500)
+
+
+def dumps(data):
+    # Mismas opciones que el JSONRenderer de DRF
+    return json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=not api_settings.UNICODE_JSON,
+        allow_nan=not api_settings.STRICT_JSON,
+        separators=(',', ':') if api_settings.COMPACT_JSON else (', ', ': '),
+    )
+
+
+def iter_objects(queryset, serializer, size=None):
+    """
+    Serializa el queryset objeto a objeto, leyendo de la base de datos en
+    bloques de `size` filas. `serializer` es un FastSerializer o una
+    instancia de un serializador de DRF (sin datos).
+    """
+    size = size or chunk_size()
+    if isinstance(serializer, FastSerializer):
+        rows = serializer.values(queryset).iterator(chunk_size=size)
+        # serialize() hace los prefetch de cada bloque
+        while batch := list(islice(rows, size)):
+            yield from serializer.serialize(batch)
+    else:
+        # iterator(chunk_size) también resuelve los prefetch_related por bloque
+        for instance in queryset.iterator(chunk_size=size):
+            yield serializer.to_representation(instance)
+
+
+def iter_json_array(objects):
+    yield '['
+    for index, data in enumerate(objects):
+        yield ',' + dumps(data) if index else dumps(data)
+    yield ']'
+
+
+def iter_ndjson(objects):
+    for data in objects:
+        yield dumps(data) + '\n'
+
+
+def buffered(parts, size=BUFFER_SIZE):
+    """Agrupa los fragmentos para no escribir en el socket objeto a objeto."""
+    buffer, length = [], 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_response(objects, ndjson=False, filename=None):
+    if ndjson:
+        response = StreamingHttpResponse(buffered(iter_ndjson(objects)), content_type='application/x-ndjson')
+    else:
+        response = StreamingHttpResponse(buffered(iter_json_array(objects)), content_type='application/json')
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class StreamingListMixin:
+    """
+    ViewSets: `?stream=1` (array JSON) o `?stream=ndjson` en el listado
+    devuelve todo el queryset filtrado en streaming, sin paginar ni cachear.
+    """
+    stream_param = 'stream'
+
+    def get_stream_serializer(self):
+        if getattr(self, 'use_fast_serializer', lambda: False)():
+            return self.fast_serializer_class(self.request)
+        return self.get_serializer()
+
+    def list(self, request, *args, **kwargs):
+        mode = request.query_params.get(self.stream_param)
+        if not mode:
+            return super().list(request, *args, **kwargs)
+        if not request.user.is_staff:
+            raise PermissionDenied("El listado completo (?stream=) es solo para administradores.")
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(iter_objects(queryset, self.get_stream_serializer()), ndjson=mode == 'ndjson')
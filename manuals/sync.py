@@ -0,0 +1,94 @@
+# manuals/sync.py
+"""
+Sincronización delta para clientes sin conexión (/api/v1/sync/).
+
+El token que recibe el cliente es la hora del servidor al inicio de la
+sincronización, firmada. En la siguiente llamada se devuelven las filas con
+`updated_at` posterior y las marcas de borrado (DeletedRecord) posteriores.
+Se resta un margen (SYNC_OVERLAP) para no perder escrituras que se
+confirmaron tarde; los clientes deben aplicar los cambios de forma
+idempotente (upsert por id). Los tokens caducan a los
+SYNC_TOKEN_MAX_AGE_DAYS días: hay que volver a sincronizar todo, y las
+marcas de borrado más antiguas se pueden eliminar (`prune_deleted_records`).
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import Category, Manual, Procedure, DocumentFile, DeletedRecord
+from .serializers import CategorySerializer, ManualListSerializer, ProcedureListSerializer, DocumentFileSerializer
+
+TOKEN_SALT = 'manuals.sync'
+
+# Clave de la respuesta -> (modelo, serializador, select_related)
+SYNCED_MODELS = {
+    'categories': (Category, CategorySerializer, ()),
+    'manuals': (Manual, ManualListSerializer, ('category',)),
+    'procedures': (Procedure, ProcedureListSerializer, ()),
+    'files': (DocumentFile, DocumentFileSerializer, ('uploaded_by',)),
+}
+
+
+class InvalidSyncToken(Exception):
+    """Token alterado, de otra aplicación o caducado."""
+
+
+def make_token(moment):
+    return signing.dumps({'t': moment.isoformat()}, salt=TOKEN_SALT, compress=True)
+
+
+def token_max_age():
+    return timedelta(days=getattr(settings, 'SYNC_TOKEN_MAX_AGE_DAYS', 30))
+
+
+def read_token(token):
+    max_age = token_max_age()
+    try:
+        return datetime.fromisoformat(signing.loads(token, salt=TOKEN_SALT, max_age=max_age)['t'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise InvalidSyncToken
+
+
+def build_changes(since, context):
+    """
+    Cambios desde `since` (None = sincronización inicial completa).
+    Devuelve el cuerpo de la respuesta, con el token para la siguiente llamada.
+    """
+    started_at = timezone.now()
+    overlap = timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 60))
+    threshold = since - overlap if since else None
+
+    changes = {}
+    for key, (model, serializer_class, related) in SYNCED_MODELS.items():
+        queryset = model.objects.select_related(*related).order_by('pk')
+        if threshold:
+            queryset = queryset.filter(updated_at__gt=threshold)
+        changes[key] = serializer_class(queryset, many=True, context=context).data
+
+    deleted = {key: [] for key in SYNCED_MODELS}
+    if threshold:
+        names = {model._meta.model_name: key for key, (model, _, _) in SYNCED_MODELS.items()}
+        tombstones = DeletedRecord.objects.filter(deleted_at__gt=threshold).values_list('model', 'object_id')
+        for model_name, object_id in tombstones:
+            if model_name in names:
+                deleted[names[model_name]].append(object_id)
+
+    return {
+        'token': make_token(started_at),
+        'full': since is None,
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+def prune_tombstones():
+    """
+    Borra las marcas de borrado que ya no puede pedir ningún token válido
+    (más antiguas que su caducidad más el margen). Devuelve cuántas.
+    """
+    overlap = timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 60))
+    cutoff = timezone.now() - token_max_age() - overlap
+    deleted, _ = DeletedRecord.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
@@ -1,3 +1,1186 @@
-from django.test import TestCase
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.validators import UniqueTogetherValidator
+
+from . import audit, bulk_io, cache, db_routers, login_failures, roles, sync, throttling
+from .authentication import ClaimsTokenObtainPairSerializer
+from .fast_serializers import DocumentFileFastSerializer, ManualListFastSerializer, ProcedureFastSerializer
+from .middleware import AppKeyMiddleware
+from .models import Category, Manual, Procedure, DeletedRecord, DocumentBlob, DocumentFile, Profile, ThrottleCounter
+from .views import ProcedureViewSet, latest_document_files_prefetch
+
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CatalogueTestCase(TestCase):
+    """
+    Un manual con 10 procedimientos, cada uno con un anexo en dos versiones,
+    y un cliente autenticado como usuario normal.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lector', password='clave-segura-123')
+        category = Category.objects.create(name='Operaciones')
+        cls.manual = Manual.objects.create(title='Manual de Operaciones', category=category)
+        for i in range(10):
+            procedure = Procedure.objects.create(manual=cls.manual, title=f'Paso {i}', content='...')
+            previous = DocumentFile.objects.create(
+                procedure=procedure, title='Anexo', uploaded_by=cls.user,
+                file=ContentFile(b'v1', name='anexo.txt'), is_latest=False,
+            )
+            DocumentFile.objects.create(
+                procedure=procedure, title='Anexo', uploaded_by=cls.user,
+                file=ContentFile(b'v2', name='anexo.txt'), version_number=2,
+                previous_version=previous,
+            )
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+
+
+class ManualDetailQueryCountTests(CatalogueTestCase):
+    """
+    El detalle de un manual debe resolverse en un número constante de
+    consultas, sin importar cuántos procedimientos y archivos tenga.
+    """
+
+    def test_manual_detail_query_count_is_constant(self):
+        # 2 contadores de throttle (usuario y detalle de manual),
+        # manual + categoría, procedimientos, archivos vigentes + autor
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/v1/manuals/{self.manual.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['procedures']), 10)
+        for procedure in response.data['procedures']:
+            self.assertEqual([f['version_number'] for f in procedure['document_files']], [2])
+            self.assertEqual(procedure['document_files'][0]['uploaded_by']['username'], 'lector')
+
+    def test_procedures_follow_manual_title(self):
+        other = Manual.objects.create(title='Anexo general', category=self.manual.category)
+        Procedure.objects.create(manual=other, title='Paso 0', content='...')
+        self.assertEqual(Procedure.objects.first().manual, other)
+        self.manual.title = 'Altas y bajas'
+        self.manual.save()
+        self.assertFalse(Procedure.objects.filter(manual=self.manual).exclude(manual_title='Altas y bajas'))
+        self.assertEqual(Procedure.objects.first().manual, self.manual)
+
+
+class SparseFieldsetTests(CatalogueTestCase):
+    """?fields= y ?expand=."""
+
+    def test_sparse_fields_skip_columns_and_prefetches(self):
+        # Sin procedimientos no hay prefetch: throttles y manual
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/v1/manuals/{self.manual.pk}/', {'fields': 'id,title'})
+        self.assertEqual(response.data, {'id': self.manual.pk, 'title': 'Manual de Operaciones'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/procedures/', {'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        select = [q['sql'] for q in queries if 'FROM "procedimientos"' in q['sql']][-1]
+        self.assertNotIn('"content"', select)
+        self.assertFalse(any('bytefiles' in q['sql'] for q in queries))
+
+    def test_expand_nested_objects(self):
+        response = self.client.get('/api/v1/manuals/', {'fields': 'id,category,procedures',
+                                                        'expand': 'category,procedures'})
+        manual = response.data['results'][0]
+        self.assertEqual(manual['category']['name'], 'Operaciones')
+        self.assertEqual(len(manual['procedures']), 10)
+        self.assertNotIn('document_files', manual['procedures'][0])
+
+
+class FastListSerializerTests(CatalogueTestCase):
+    """Serializadores de listado sobre filas de .values()."""
+
+    def test_fast_list_serializers_match_drf(self):
+        # Sin categoría: ManualListSerializer omite category_name (SkipField)
+        orphan = Manual.objects.create(title='Sin categoría')
+        request = Request(APIRequestFactory().get('/api/v1/procedures/'))
+        cases = [
+            (ProcedureFastSerializer, Procedure.objects.prefetch_related(latest_document_files_prefetch())),
+            (ManualListFastSerializer, Manual.objects.select_related('category')),
+            (DocumentFileFastSerializer, DocumentFile.objects.select_related('uploaded_by')),
+        ]
+        for fast_class, queryset in cases:
+            fast = fast_class(request)
+            expected = fast_class.serializer_class(queryset, many=True, context={'request': request}).data
+            self.assertEqual(fast.serialize(fast.values(queryset)), expected)
+        fast = ManualListFastSerializer(request)
+        self.assertNotIn('category_name', fast.serialize(fast.values(Manual.objects.filter(pk=orphan.pk)))[0])
+
+        # El cursor funciona igual con filas de .values() (orden por manual__title)
+        response = self.client.get('/api/v1/procedures/', {'page_size': 6})
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 4)
+
+
+class StreamingListTests(CatalogueTestCase):
+    """Listados en streaming (?stream=1) y exportaciones NDJSON."""
+
+    def test_streaming_list_and_export(self):
+        self.assertEqual(self.client.get('/api/v1/procedures/', {'stream': '1'}).status_code, 403)
+
+        self.client.force_authenticate(User.objects.create_user('admin', password='clave-segura-123', is_staff=True))
+        response = self.client.get('/api/v1/procedures/', {'stream': '1', 'manual': self.manual.pk})
+        self.assertTrue(response.streaming)
+        procedures = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([p['title'] for p in procedures], [f'Paso {i}' for i in range(10)])
+        self.assertEqual(len(procedures[0]['document_files']), 1)
+
+        response = self.client.get('/api/v1/export/files/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        # Todas las versiones, en orden de id
+        self.assertEqual([json.loads(line)['version_number'] for line in lines[:2]], [1, 2])
+        self.assertEqual(len(lines), 20)
+
+
+class BatchEndpointTests(CatalogueTestCase):
+    """Multi-get (?ids=) y escrituras por lotes (/batch/)."""
+
+    def test_multi_get_by_ids(self):
+        ids = list(Procedure.objects.values_list('pk', flat=True)[:3])
+        response = self.client.get('/api/v1/procedures/', {'ids': f'{ids[2]},{ids[0]}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(p['id'] for p in response.data), sorted([ids[0], ids[2]]))
+        response = self.client.get('/api/v1/procedures/', {'ids': 'uno'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_writes(self):
+        editor = User.objects.create_user(username='editora', password='clave-segura-123', is_staff=True)
+        self.client.force_authenticate(editor)
+        first, second = Procedure.objects.order_by('pk')[:2]
+        audited = LogEntry.objects.filter(content_type__model='procedure')
+        entries = audited.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/procedures/batch/', {
+                'create': [{'manual': self.manual.pk, 'title': 'Paso nuevo', 'content': '...'}],
+                'update': [{'id': first.pk, 'content': 'Revisado'}],
+                'delete': [second.pk],
+            }, format='json')
+        audit.buffer.flush()
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['created'][0]['title'], 'Paso nuevo')
+        self.assertEqual(response.data['updated'][0]['content'], 'Revisado')
+        self.assertEqual(response.data['deleted'], [second.pk])
+        self.assertEqual(Procedure.objects.get(title='Paso nuevo').manual_title, self.manual.title)
+        self.assertFalse(Procedure.objects.filter(pk=second.pk).exists())
+        # Alta, cambio y borrado auditados
+        self.assertEqual(audited.count() - entries, 3)
+
+        # Un error en cualquier operación: no se guarda nada
+        response = self.client.post('/api/v1/procedures/batch/', {
+            'create': [{'manual': self.manual.pk, 'title': 'Otro', 'content': '...'}],
+            'update': [{'id': first.pk, 'manual': 0}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('manual', response.data['update'][0])
+        self.assertFalse(Procedure.objects.filter(title='Otro').exists())
+
+    def test_batch_validation_queries_do_not_grow(self):
+        self.client.force_authenticate(User.objects.create_user('editora', password='clave-segura-123',
+                                                                is_staff=True))
+        procedures = list(Procedure.objects.order_by('pk'))
+        other = Manual.objects.create(title='Otro manual')
+
+        def batch(size, prefix):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/v1/procedures/batch/', {
+                    'create': [{'manual': other.pk, 'title': f'{prefix} {i}', 'content': '...'} for i in range(size)],
+                    'update': [{'id': p.pk, 'title': f'{p.title} ({prefix})', 'manual': other.pk}
+                               for p in procedures[:size]],
+                }, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            return len(queries)
+
+        batch(1, 'Primero') # Consultas de una sola vez (ej. ContentType de la auditoría)
+        self.assertEqual(batch(1, 'A'), batch(5, 'B'))
+
+    def test_batch_unique_together(self):
+        self.client.force_authenticate(User.objects.create_user('editora', password='clave-segura-123',
+                                                                is_staff=True))
+        first, second = Procedure.objects.order_by('pk')[:2]
+        message = str(UniqueTogetherValidator.message).format(field_names='manual, title, version')
+
+        # Contra una fila existente, y entre dos operaciones del mismo lote
+        response = self.client.post('/api/v1/procedures/batch/', {
+            'create': [{'manual': self.manual.pk, 'title': first.title, 'content': '...'},
+                       {'manual': self.manual.pk, 'title': 'Nuevo', 'content': '...'},
+                       {'manual': self.manual.pk, 'title': 'Nuevo', 'content': '...'}],
+            'update': [{'id': second.pk, 'content': 'Sin cambio de clave'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['create'], [{'non_field_errors': [message]}] * 3)
+        self.assertNotIn('update', response.data)
+
+        # Una actualización que ocupa la clave de otra fila
+        response = self.client.post('/api/v1/procedures/batch/', {
+            'update': [{'id': second.pk, 'title': first.title}],
+        }, format='json')
+        self.assertEqual(response.data['update'], [{'non_field_errors': [message]}])
+
+        # Intercambiar títulos dentro del lote no entra en conflicto con las filas viejas
+        response = self.client.post('/api/v1/procedures/batch/', {
+            'update': [{'id': first.pk, 'title': 'Paso A'}, {'id': second.pk, 'title': first.title}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CursorPaginationTests(TestCase):
+    """El cursor guarda todas las columnas del orden: los empates no se resuelven con OFFSET."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lector', password='clave-segura-123')
+        manual = Manual.objects.create(title='Manual de Operaciones')
+        other = Manual.objects.create(title='Anexo general')
+        # Todos empatan en manual_title y varios también en el título
+        for i in range(7):
+            Procedure.objects.create(manual=manual, title=f'Paso {i % 3}', content='...', version=f'{i}.0')
+        Procedure.objects.create(manual=other, title='Paso 0', content='...')
+        procedure = Procedure.objects.first()
+        for i in range(7):
+            DocumentFile.objects.create(procedure=procedure, title=f'Anexo {i}', uploaded_by=cls.user,
+                                        file=ContentFile(b'...', name='anexo.txt'))
+        # Mismo version_number y misma fecha: solo la pk los distingue
+        DocumentFile.objects.update(uploaded_at=DocumentFile.objects.first().uploaded_at)
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, params, link='next'):
+        ids = []
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            while True:
+                self.assertEqual(response.status_code, 200)
+                ids.extend(item['id'] for item in response.data['results'])
+                if not response.data[link]:
+                    break
+                response = self.client.get(response.data[link])
+        self.assertFalse([q['sql'] for q in queries if 'OFFSET' in q['sql']])
+        return ids, response
+
+    def test_pages_through_tied_keys(self):
+        cases = [
+            ('/api/v1/procedures/', Procedure.objects.order_by('manual_title', 'title', '-version', 'pk')),
+            ('/api/v1/files/', DocumentFile.objects.order_by('-version_number', '-uploaded_at', '-pk')),
+            ('/api/v1/files/', DocumentFile.objects.order_by('uploaded_at', 'pk'), {'ordering': 'uploaded_at'}),
+        ]
+        for url, queryset, *params in cases:
+            with self.subTest(url=url, params=params):
+                expected = list(queryset.values_list('pk', flat=True))
+                ids, last = self.walk(url, {'page_size': 2, **(params[0] if params else {})})
+                self.assertEqual(ids, expected)
+
+                # Y de vuelta con `previous` desde la última página
+                back, _ = self.walk(last.data['previous'], {}, link='previous')
+                pages = [ids[i:i + 2] for i in range(0, len(ids), 2)][:-1]
+                self.assertEqual(back, [pk for page in reversed(pages) for pk in page])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/procedures/', {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class FullTextSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lector', password='clave-segura-123')
+        manual = Manual.objects.create(title='Mantenimiento', description='Revisión de equipos')
+        cls.in_title = Procedure.objects.create(manual=manual, title='Cambio de válvula', content='Cerrar el paso.')
+        cls.in_body = Procedure.objects.create(
+            manual=manual, title='Limpieza', content='<script>alert(1)</script> Revisar la válvula & el filtro.'
+        )
+        Procedure.objects.create(manual=manual, title='Pintura', content='Nada que ver.')
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+
+    def test_ranking_and_accent_folding(self):
+        response = self.client.get('/api/v1/search/', {'q': 'valvula', 'type': 'procedure'})
+        self.assertEqual(response.status_code, 200)
+        # La coincidencia en el título pesa más que en el contenido
+        self.assertEqual([hit['id'] for hit in response.data['results']], [self.in_title.pk, self.in_body.pk])
+
+        response = self.client.get('/api/v1/search/', {'q': 'REVISION'})
+        self.assertEqual([(hit['type'], hit['title']) for hit in response.data['results']],
+                         [('manual', 'Mantenimiento')])
+
+    def test_snippets_are_escaped(self):
+        response = self.client.get('/api/v1/search/', {'q': 'filtro', 'type': 'procedure'})
+        snippet = response.data['results'][0]['snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('&amp; el <mark>filtro</mark>', snippet)
+
+    def test_search_filter_uses_the_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/procedures/', {'search': 'válv'})
+        self.assertEqual(sorted(p['id'] for p in response.data['results']),
+                         sorted([self.in_title.pk, self.in_body.pk]))
+        self.assertTrue(any('procedimientos_fts MATCH' in q['sql'] for q in queries))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    """Un blob por contenido; se borra del disco cuando ya nadie lo referencia."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.procedure = Procedure.objects.create(manual=Manual.objects.create(title='Planos'), title='Paso 1')
+
+    def attach(self, content=b'mismo contenido'):
+        return DocumentFile.objects.create(procedure=self.procedure, title='Anexo',
+                                           file=ContentFile(content, name='anexo.PDF'))
+
+    def test_same_content_shares_one_blob(self):
+        first, second = self.attach(), self.attach()
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^document_files/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(first.content_hash, first.file.name.split('/')[-1][:-4])
+        self.assertEqual(first.original_name, 'anexo.PDF')
+        self.assertNotEqual(self.attach(b'otro contenido').file.name, first.file.name)
+
+    def test_blob_is_released_with_the_last_reference(self):
+        first, second = self.attach(), self.attach()
+        storage = first.file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(second.file.name))
+        self.assertFalse(DocumentBlob.objects.filter(content_hash=second.content_hash).exists())
+
+        # Si la transacción se revierte, el blob se conserva
+        third = self.attach()
+        with self.captureOnCommitCallbacks(execute=False):
+            third.delete()
+        self.assertTrue(storage.exists(third.file.name))
+
+    def test_reuse_locks_the_blob_before_checking_the_disk(self):
+        # El cerrojo se toma antes del atajo de deduplicación (storage.exists)
+        existing = self.attach()
+        exists = existing.file.storage.exists
+
+        def locked_exists(name):
+            self.assertTrue(DocumentBlob.objects.filter(content_hash=existing.content_hash).exists())
+            return exists(name)
+        with mock.patch.object(existing.file.storage, 'exists', side_effect=locked_exists) as patched:
+            self.assertEqual(self.attach().file.name, existing.file.name)
+        self.assertTrue(patched.called)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, CHUNKED_UPLOAD_DIR=f'{TEST_MEDIA_ROOT}/uploads_tmp')
+class ChunkedUploadTests(TestCase):
+    DATA = b'0123456789'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tecnico', password='clave-segura-123')
+        cls.procedure = Procedure.objects.create(manual=Manual.objects.create(title='Redes'), title='Paso 1')
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/v1/uploads/', {
+            'procedure': self.procedure.pk, 'title': 'Esquema', 'filename': 'esquema.bin', 'total_size': 10,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.url = f"/api/v1/uploads/{response.data['id']}/"
+
+    def put(self, body, content_range):
+        return self.client.put(self.url, body, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=content_range)
+
+    def test_content_range_is_validated(self):
+        self.assertEqual(self.put(b'0123', None).status_code, 400)
+        self.assertEqual(self.put(b'0123', 'bytes=0-3').status_code, 400)
+        self.assertEqual(self.put(b'0123', 'bytes 0-3/20').status_code, 416)
+        self.assertEqual(self.put(b'0123', 'bytes 3-0/10').status_code, 416)
+        self.assertEqual(self.put(b'0123456789A', 'bytes 0-10/10').status_code, 416)
+        # Cuerpo vacío: 400, sin tocar el parcial
+        self.assertEqual(self.put(b'', 'bytes 0-3/10').status_code, 400)
+
+    def test_out_of_order_short_and_resent_chunks(self):
+        self.assertEqual(self.put(b'4567', 'bytes 4-7/10').status_code, 409)
+        self.assertEqual(self.put(b'0123', 'bytes 0-3/*').data['received_bytes'], 4)
+        # Parte más corta de lo declarado: se guarda lo recibido
+        response = self.put(b'45', 'bytes 4-7/10')
+        self.assertEqual((response.status_code, response.data['received_bytes']), (400, 6))
+        # Reanudar: se consulta lo recibido y se reenvía desde ahí (o antes)
+        self.assertEqual(self.client.get(self.url).data['received_bytes'], 6)
+        self.assertEqual(self.put(b'3456', 'bytes 3-6/10').data['received_bytes'], 7)
+        self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 409)
+
+    def test_complete_creates_the_document(self):
+        self.put(self.DATA, 'bytes 0-9/10')
+        response = self.client.post(f'{self.url}complete/', {'sha256': '0' * 64})
+        self.assertEqual(response.status_code, 400)
+
+        digest = hashlib.sha256(self.DATA).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.url}complete/', {'sha256': digest})
+        self.assertEqual(response.status_code, 201, response.data)
+        document = DocumentFile.objects.get(pk=response.data['id'])
+        self.assertEqual((document.content_hash, document.original_name), (digest, 'esquema.bin'))
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+        # Reintento de un complete ya hecho: mismo documento
+        self.assertEqual(self.client.post(f'{self.url}complete/').data['id'], document.pk)
+        self.assertEqual(self.put(self.DATA, 'bytes 0-9/10').status_code, 409)
+
+    def test_complete_can_be_retried_after_a_failed_write(self):
+        self.put(self.DATA, 'bytes 0-9/10')
+        # Falla el INSERT, después de mover el archivo a su sitio
+        with mock.patch.object(DocumentFile, 'save_base', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self.client.post(f'{self.url}complete/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 201)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DocumentDownloadTests(TestCase):
+    DATA = b'contenido del anexo'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lector', password='clave-segura-123')
+        procedure = Procedure.objects.create(manual=Manual.objects.create(title='Compras'), title='Paso 1')
+        cls.document = DocumentFile.objects.create(procedure=procedure, title='Anexo',
+                                                   file=ContentFile(cls.DATA, name='anexo.txt'))
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/files/{self.document.pk}/download/'
+
+    def test_serializers_expose_the_download_url(self):
+        expected = f'http://testserver{self.url}'
+        data = self.client.get(f'/api/v1/files/{self.document.pk}/').data
+        self.assertEqual((data['file'], data['file_url']), (expected, expected))
+        self.assertEqual(self.client.get('/api/v1/files/').data['results'][0]['file'], expected)
+        history = self.client.get(f'/api/v1/files/{self.document.pk}/history/').data['results']
+        self.assertEqual(history[0]['file'], expected)
+
+    def test_full_and_partial_content(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.DATA)
+        self.assertEqual(response['ETag'], f'"{self.document.content_hash}"')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="anexo.txt"')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-8')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-8/{len(self.DATA)}')
+        self.assertEqual(b''.join(response.streaming_content), self.DATA[:9])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.DATA[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.DATA)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.DATA)}')
+        # If-Range con otro ETag: el archivo completo
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-8', HTTP_IF_RANGE='"otro"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"otro"').status_code, 200)
+
+    def test_offloaded_to_the_web_server(self):
+        with override_settings(DOCUMENT_DOWNLOAD_BACKEND='nginx', DOCUMENT_DOWNLOAD_ACCEL_PREFIX='/protegido/'):
+            response = self.client.get(self.url, {'inline': '1'})
+        self.assertEqual(response['X-Accel-Redirect'], f'/protegido/{self.document.file.name}')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="anexo.txt"')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(DOCUMENT_DOWNLOAD_BACKEND='sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.document.file.path)
+        self.assertEqual(response['ETag'], f'"{self.document.content_hash}"')
+
+
+class SeriesIdMigrationTests(TransactionTestCase):
+    """0004 agrupa en una serie cada cadena de versiones ya existente."""
+    before = [('manuals', '0003_fulltext_search')]
+    after = [('manuals', '0004_documentfile_series_id')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        apps = self.migrate(self.after)
+        apps.get_model('manuals', 'DocumentFile').objects.all().delete()
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('manuals'))
+
+    def test_chains_share_a_series(self):
+        apps = self.migrate(self.before)
+        Manual = apps.get_model('manuals', 'Manual')
+        Procedure = apps.get_model('manuals', 'Procedure')
+        DocumentFile = apps.get_model('manuals', 'DocumentFile')
+        procedure = Procedure.objects.create(manual=Manual.objects.create(title='Compras'), title='Paso 1')
+
+        def chain(length):
+            previous, pks = None, []
+            for version in range(1, length + 1):
+                previous = DocumentFile.objects.create(
+                    procedure=procedure, title='Anexo', file='anexo.txt', version_number=version,
+                    is_latest=version == length, previous_version=previous,
+                )
+                pks.append(previous.pk)
+            return pks
+
+        # Creadas en desorden: la versión 3 de la primera cadena después de la segunda
+        first, second, single = chain(2), chain(3), chain(1)
+        third_version = DocumentFile.objects.create(procedure=procedure, title='Anexo', file='anexo.txt',
+                                                    version_number=3, previous_version_id=first[-1])
+        first.append(third_version.pk)
+
+        apps = self.migrate(self.after)
+        series = dict(apps.get_model('manuals', 'DocumentFile').objects.values_list('pk', 'series_id'))
+        self.assertEqual(len({series[pk] for pk in first}), 1)
+        self.assertEqual(len({series[pk] for pk in second}), 1)
+        self.assertEqual(len({series[first[0]], series[second[0]], series[single[0]]}), 3)
+        self.assertNotIn(None, series.values())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DocumentHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lector', password='clave-segura-123')
+        procedure = Procedure.objects.create(manual=Manual.objects.create(title='Compras'), title='Paso 1')
+        previous = DocumentFile.objects.create(procedure=procedure, title='Anexo', uploaded_by=cls.user,
+                                               file=ContentFile(b'v1', name='anexo.txt'), is_latest=False)
+        for version in range(2, 6):
+            previous = DocumentFile.objects.create(
+                procedure=procedure, title='Anexo', uploaded_by=cls.user,
+                file=ContentFile(b'v%d' % version, name='anexo.txt'), version_number=version,
+                is_latest=version == 5, previous_version=previous, series_id=previous.series_id,
+            )
+        DocumentFile.objects.create(procedure=procedure, title='Otro', file=ContentFile(b'otro', name='otro.txt'))
+        cls.latest = previous
+
+    def test_history_in_one_query(self):
+        client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'/api/v1/files/{self.latest.pk}/history/')
+        self.assertEqual([v['version_number'] for v in response.data['results']], [5, 4, 3, 2, 1])
+        self.assertEqual(response.data['results'][0]['uploaded_by']['username'], 'lector')
+        # get_object() y una sola consulta para todas las versiones (autor incluido)
+        catalogue = [q['sql'] for q in queries if 'bytefiles' in q['sql'] or 'auth_user' in q['sql']]
+        self.assertEqual(len(catalogue), 2, catalogue)
+        self.assertIn('"series_id" =', catalogue[1])
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='clave-segura-123', is_staff=True)
+        cls.manual = Manual.objects.create(title='Compras')
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.admin)
+
+    def test_write_invalidates_cached_responses(self):
+        self.assertEqual(self.client.get('/api/v1/manuals/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/v1/manuals/')['X-Cache'], 'HIT')
+        versions = cache.get_versions([Manual])
+
+        response = self.client.patch(f'/api/v1/manuals/{self.manual.pk}/', {'title': 'Compras 2025'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(cache.get_versions([Manual]), versions)
+        response = self.client.get('/api/v1/manuals/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['title'], 'Compras 2025')
+
+    def test_related_model_invalidates_dependants(self):
+        # Los procedimientos muestran el título del manual
+        procedure = Procedure.objects.create(manual=self.manual, title='Paso 1')
+        self.client.get(f'/api/v1/procedures/{procedure.pk}/', {'expand': 'manual'})
+        self.manual.title = 'Ventas'
+        self.manual.save()
+        response = self.client.get(f'/api/v1/procedures/{procedure.pk}/', {'expand': 'manual'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['manual']['title'], 'Ventas')
+
+    def test_versions_are_never_reused(self):
+        before = cache.get_versions([Manual])
+        cache.get_cache().delete(cache._version_key(Manual)) # desalojada
+        after = cache.get_versions([Manual])
+        cache.bump_version(Manual)
+        self.assertEqual(len({before[0], after[0], cache.get_versions([Manual])[0]}), 3)
+
+
+@override_settings(CACHES={**settings.CACHES, 'api': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': tempfile.mkdtemp(dir=TEST_MEDIA_ROOT),
+}})
+class FileResponseCacheTests(ResponseCacheTests):
+    """Lo mismo con el backend por defecto en producción (compartido entre workers)."""
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DeltaSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lector', password='clave-segura-123')
+        cls.manual = Manual.objects.create(title='Compras')
+        cls.procedures = [Procedure.objects.create(manual=cls.manual, title=f'Paso {i}') for i in range(3)]
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+
+    def sync(self, token=None):
+        response = self.client.get('/api/v1/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def age_everything(self):
+        # Lo anterior queda fuera del margen SYNC_OVERLAP_SECONDS
+        past = timezone.now() - timedelta(hours=1)
+        Manual.objects.update(updated_at=past)
+        Procedure.objects.update(updated_at=past)
+
+    def test_delta_only_returns_changes(self):
+        first = self.sync()
+        self.assertTrue(first['full'])
+        self.assertEqual(len(first['changes']['procedures']), 3)
+
+        self.age_everything()
+        token = sync.make_token(timezone.now() - timedelta(minutes=30))
+        self.assertEqual(self.sync(token)['changes']['procedures'], [])
+
+        changed = self.procedures[1]
+        changed.content = 'Revisado'
+        changed.save()
+        delta = self.sync(token)
+        self.assertFalse(delta['full'])
+        self.assertEqual([p['id'] for p in delta['changes']['procedures']], [changed.pk])
+        self.assertEqual(delta['changes']['manuals'], [])
+        self.assertNotEqual(delta['token'], token)
+
+    def test_new_version_updates_the_previous_one(self):
+        document = DocumentFile.objects.create(procedure=self.procedures[0], title='Anexo',
+                                               file=ContentFile(b'v1', name='anexo.txt'))
+        DocumentFile.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        token = sync.make_token(timezone.now() - timedelta(minutes=30))
+        new = document.create_new_version(ContentFile(b'v2', name='anexo.txt'), uploaded_by=self.user)
+        files = {f['id']: f for f in self.sync(token)['changes']['files']}
+        self.assertEqual(set(files), {document.pk, new.pk})
+        self.assertFalse(files[document.pk]['is_latest'])
+        self.assertTrue(files[new.pk]['is_latest'])
+
+    def test_set_null_is_reported(self):
+        category = Category.objects.create(name='Operaciones')
+        Manual.objects.filter(pk=self.manual.pk).update(category=category)
+        document = DocumentFile.objects.create(procedure=self.procedures[0], title='Anexo', uploaded_by=self.user,
+                                               file=ContentFile(b'v1', name='anexo.txt'))
+        new = document.create_new_version(ContentFile(b'v2', name='anexo.txt'), uploaded_by=None)
+        self.age_everything()
+        DocumentFile.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        token = sync.make_token(timezone.now() - timedelta(minutes=30))
+
+        # SET_NULL no pasa por save(): manual.category y file.previous_version
+        category.delete()
+        document.delete()
+        delta = self.sync(token)
+        self.assertEqual([(m['id'], m['category']) for m in delta['changes']['manuals']], [(self.manual.pk, None)])
+        self.assertEqual([(f['id'], f['previous_version']) for f in delta['changes']['files']], [(new.pk, None)])
+
+    def test_deletions_are_reported(self):
+        self.age_everything()
+        token = sync.make_token(timezone.now() - timedelta(minutes=30))
+        manual_pk, procedure_pks = self.manual.pk, [p.pk for p in self.procedures]
+        self.procedures[0].delete()
+        delta = self.sync(token)
+        self.assertEqual(delta['deleted']['procedures'], procedure_pks[:1])
+        self.assertEqual(delta['deleted']['manuals'], [])
+
+        # Borrado en cascada: también los procedimientos del manual
+        self.manual.delete()
+        delta = self.sync(token)
+        self.assertEqual(delta['deleted']['manuals'], [manual_pk])
+        self.assertEqual(sorted(delta['deleted']['procedures']), procedure_pks)
+
+        # Marcas anteriores al token (menos el margen): ya se informaron
+        DeletedRecord.objects.update(deleted_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.sync(token)['deleted']['procedures'], [])
+
+    def test_prune_deleted_records(self):
+        recent, expired = self.procedures[0].pk, self.procedures[1].pk
+        self.procedures[0].delete()
+        self.procedures[1].delete()
+        old = timezone.now() - timedelta(days=31)
+        DeletedRecord.objects.filter(object_id=expired).update(deleted_at=old)
+        output = StringIO()
+        call_command('prune_deleted_records', stdout=output)
+        self.assertIn('1 marcas', output.getvalue())
+        self.assertEqual(list(DeletedRecord.objects.values_list('object_id', flat=True)), [recent])
+
+        # Lo que aún puede pedir un token válido se conserva
+        with override_settings(SYNC_TOKEN_MAX_AGE_DAYS=60):
+            DeletedRecord.objects.update(deleted_at=old)
+            self.assertEqual(sync.prune_tombstones(), 0)
+
+    def test_invalid_or_expired_token(self):
+        self.assertEqual(self.client.get('/api/v1/sync/', {'since': 'inventado'}).status_code, 400)
+
+        signed_long_ago = signing.b62_encode(int(time.time()) - 31 * 24 * 3600)
+        with mock.patch.object(signing.TimestampSigner, 'timestamp', return_value=signed_long_ago):
+            token = sync.make_token(timezone.now())
+        response = self.client.get('/api/v1/sync/', {'since': token})
+        self.assertEqual(response.status_code, 400)
+        with override_settings(SYNC_TOKEN_MAX_AGE_DAYS=60):
+            self.assertFalse(self.sync(token)['full'])
+
+
+class ConditionalRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='clave-segura-123', is_staff=True)
+        cls.category = Category.objects.create(name='Operaciones')
+        cls.manual = Manual.objects.create(title='Compras', category=cls.category)
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.admin)
+        self.detail = f'/api/v1/manuals/{self.manual.pk}/'
+
+    def test_not_modified_without_touching_the_catalogue(self):
+        response = self.client.get('/api/v1/manuals/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/manuals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Solo los contadores de throttling
+        self.assertFalse([q['sql'] for q in queries if 'manuales' in q['sql'] or 'categorias' in q['sql']])
+        response = self.client.get('/api/v1/manuals/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # Otra URL (filtros, ?fields=) tiene su propio ETag
+        response = self.client.get('/api/v1/manuals/', {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_set_null_changes_the_etag(self):
+        # Borrar la categoría no toca updated_at de los manuales (SET_NULL)
+        etags = [self.client.get(url)['ETag'] for url in ('/api/v1/manuals/', self.detail)]
+        self.category.delete()
+        for url, etag in zip(('/api/v1/manuals/', self.detail), etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['category'])
+
+    def test_precondition_failed(self):
+        etag = self.client.get(self.detail)['ETag']
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_MATCH='"otro"').status_code, 412)
+
+        # Otro cliente guarda el manual: la edición con el ETag viejo se rechaza
+        self.manual.save()
+        response = self.client.patch(self.detail, {'title': 'Pisado'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.client.delete(self.detail, HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(Manual.objects.get(pk=self.manual.pk).title, 'Compras')
+
+        etag = self.client.get(self.detail)['ETag']
+        response = self.client.patch(self.detail, {'title': 'Revisado'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Manual.objects.get(pk=self.manual.pk).title, 'Revisado')
+
+
+class CatalogueImportExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Finanzas')
+        cls.manual = Manual.objects.create(title='Gastos', category=category)
+        Procedure.objects.create(manual=cls.manual, title='Reembolsos', content='...')
+
+    def test_round_trip_creates_and_updates_by_natural_key(self):
+        output = StringIO()
+        call_command('export_catalogue', 'procedures', '--format', 'csv', stdout=output)
+        rows = list(bulk_io.read_rows(StringIO(output.getvalue()), 'csv'))
+        self.assertEqual(rows[0]['manual'], 'Gastos')
+        rows[0]['content'] = 'Actualizado'
+        rows.append({**rows[0], 'title': 'Anticipos'})
+
+        entries = LogEntry.objects.count()
+        with self.assertNumQueries(7):
+            # savepoint, mapas de claves y manuales, filas actuales, insert, update, release
+            stats = bulk_io.import_catalogue('procedures', rows)
+        self.assertEqual(stats, {'created': 1, 'updated': 1, 'unchanged': 0})
+        self.assertEqual(LogEntry.objects.count(), entries)
+        self.assertEqual(
+            list(Procedure.objects.values_list('title', 'content', 'manual_title')),
+            [('Anticipos', 'Actualizado', 'Gastos'), ('Reembolsos', 'Actualizado', 'Gastos')],
+        )
+        self.assertEqual(bulk_io.import_catalogue('procedures', rows)['unchanged'], 2)
+
+    def test_unknown_reference_rolls_back_everything(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write(json.dumps({'manual': 'Gastos', 'title': 'Nuevo', 'content': '...'}) + '\n')
+            file.write(json.dumps({'manual': 'No existe', 'title': 'Otro', 'content': '...'}) + '\n')
+        with self.assertRaisesMessage(CommandError, "Fila 2: Manual no existe: 'No existe'."):
+            call_command('import_catalogue', 'procedures', file.name, stdout=StringIO())
+        self.assertFalse(Procedure.objects.filter(title='Nuevo').exists())
+
+
+@override_settings(AUDITLOG_ASYNC=True)
+class BufferedAuditLogTests(TestCase):
+    """
+    Con la auditoría diferida (AUDITLOG_ASYNC), los cambios se registran al confirmarse la transacción y se
+    guardan al vaciar el búfer. En los tests no hay hilo: se vacía a mano, dentro de la transacción del test.
+    """
+
+    def setUp(self):
+        audit.use_buffered_receivers()
+        self.addCleanup(audit.use_buffered_receivers, enabled=False)
+        self.addCleanup(audit.buffer.flush)
+
+    def test_entries_are_written_on_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Seguridad')
+            category.name = 'Seguridad industrial'
+            category.save()
+        audit.buffer.flush()
+
+        entries = LogEntry.objects.get_for_object(category).order_by('timestamp')
+        self.assertEqual(
+            [entry.action for entry in entries],
+            [LogEntry.Action.CREATE, LogEntry.Action.UPDATE],
+        )
+        self.assertEqual(entries[1].changes_dict['name'], ['Seguridad', 'Seguridad industrial'])
+
+    def test_rolled_back_changes_are_not_audited(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            Category.objects.create(name='Descartada')
+        audit.buffer.flush()
+        self.assertFalse(LogEntry.objects.filter(object_repr='Descartada').exists())
+
+    def test_failed_batches_are_retried(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Pendiente')
+        with mock.patch.object(audit.buffer, 'retry_delay', 0), self.assertLogs('manuals.audit', 'WARNING'), \
+                mock.patch.object(LogEntry.objects, 'bulk_create', side_effect=OperationalError) as bulk_create:
+            self.assertFalse(audit.buffer.flush())
+        self.assertEqual(bulk_create.call_count, audit.buffer.retries + 1)
+        self.assertEqual(audit.buffer.pending(), 1)
+
+        # La base de datos vuelve: el lote que falló se guarda en la siguiente vuelta
+        self.assertTrue(audit.buffer.flush())
+        self.assertEqual(audit.buffer.pending(), 0)
+        self.assertTrue(LogEntry.objects.filter(object_repr='Pendiente').exists())
+
+    def test_shutdown_writes_pending_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Al salir')
+        audit.buffer.shutdown()
+        self.assertTrue(LogEntry.objects.filter(object_repr='Al salir').exists())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, AVATAR_ASYNC=False)
+class AvatarRenditionTests(TestCase):
+    """Tras subir un avatar se generan sus versiones reducidas."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='con-avatar', password='clave-segura-123')
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.client.force_authenticate(self.user)
+
+    def upload(self, size):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 128)).save(buffer, 'PNG')
+        avatar = SimpleUploadedFile('foto.png', buffer.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch('/api/v1/profile/', {'avatar': avatar}, format='multipart')
+
+    def test_renditions_are_built_and_returned(self):
+        self.assertEqual(self.upload((600, 400)).status_code, 200)
+        # Petición nueva: el usuario se vuelve a cargar (las versiones se guardan con update())
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        renditions = self.client.get('/api/v1/profile/').data['avatar_renditions']
+        self.assertEqual(set(renditions), {'48', '96', '256'})
+        profile = Profile.objects.get(user=self.user)
+        name = profile.avatar_renditions['sizes']['48']['webp']
+        with profile.avatar.storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (48, 48)))
+        self.assertTrue(renditions['48']['jpeg'].endswith('.48.jpg'))
+
+    def test_oversized_images_are_rejected(self):
+        with self.settings(AVATAR_MAX_PIXELS=100 * 100):
+            self.assertEqual(self.upload((200, 200)).status_code, 400)
+
+
+class FailedLoginTests(TestCase):
+    """
+    Los logins fallidos se agregan por (usuario, IP) en un único LogEntry
+    y no consultan la base de datos durante la petición.
+    """
+
+    def setUp(self):
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        User.objects.create_user(username='operador', password='clave-segura-123')
+        login_failures.recorder.collect(force=True)
+
+    def tearDown(self):
+        # Que no queden ventanas abiertas para el vaciado al salir
+        login_failures.recorder.collect(force=True)
+
+    def login(self, password='incorrecta'):
+        return self.client.post('/api/v1/token/', {'username': 'operador', 'password': password})
+
+    def test_attempts_are_summarised_in_one_entry(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 401)
+        entries = login_failures.recorder.collect(force=True)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].changes['attempts'], 3)
+        self.assertEqual(entries[0].object_repr, 'operador')
+        self.assertEqual(entries[0].remote_addr, '127.0.0.1')
+
+    @override_settings(LOGIN_LOCKOUT_THRESHOLD=2)
+    def test_lockout_after_threshold(self):
+        self.login()
+        self.login()
+        # Con la contraseña correcta también se rechaza mientras dure la ventana
+        self.assertEqual(self.login(password='clave-segura-123').status_code, 401)
+
+
+class GroupCacheTests(TestCase):
+    """Los grupos del usuario se consultan una vez por petición y nunca quedan obsoletos entre peticiones."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='editor', password='clave-segura-123')
+        self.editors = Group.objects.create(name='Editores')
+
+    def fresh_user(self):
+        # Simula una petición nueva: otro objeto usuario, sin la copia de la petición anterior
+        user = User(pk=self.user.pk, username=self.user.username)
+        user._state.adding = False
+        return user
+
+    def test_groups_are_loaded_once_per_request(self):
+        self.user.groups.add(self.editors)
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(roles.has_group(user, 'Editores'))
+            self.assertFalse(roles.has_group(user, 'Administradores'))
+
+    def test_changes_from_another_process_are_seen(self):
+        self.assertFalse(roles.has_group(self.fresh_user(), 'Editores'))
+        # Sin señales, como lo vería otro worker
+        User.groups.through.objects.create(user=self.user, group=self.editors)
+        self.assertTrue(roles.has_group(self.fresh_user(), 'Editores'))
+
+    def test_membership_changes_during_the_request(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(roles.has_group(user, 'Editores'))
+        user.groups.add(self.editors)
+        self.assertTrue(roles.has_group(user, 'Editores'))
+        self.editors.user_set.remove(self.user)
+        self.assertFalse(roles.has_group(self.fresh_user(), 'Editores'))
+
+
+class ReadReplicaRoutingTests(TestCase):
+    """Con réplica, los GET del catálogo leen de ella salvo justo después de escribir."""
+
+    def test_reads_go_to_replica_until_the_user_writes(self):
+        staff = User.objects.create_user(username='jefa', password='clave-segura-123', is_staff=True)
+        client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        client.force_authenticate(staff)
+        manual = Manual.objects.create(title='Calidad')
+        router = db_routers.ReadReplicaRouter()
+        seen = []
+        get_queryset = ProcedureViewSet.get_queryset
+
+        def spy(view):
+            seen.append(router.db_for_read(Procedure))
+            return get_queryset(view)
+
+        with mock.patch.object(db_routers, 'replica_enabled', return_value=True), \
+                mock.patch.object(ProcedureViewSet, 'get_queryset', spy):
+            client.get('/api/v1/procedures/')
+            response = client.post('/api/v1/procedures/', {'manual': manual.pk, 'title': 'Paso', 'content': '...',
+                                                           'last_reviewed': '2025-01-01'})
+            self.assertEqual(response.status_code, 201)
+            client.get('/api/v1/procedures/')
+        self.assertEqual(seen[0], 'replica')
+        self.assertIsNone(seen[-1])
+        # Fuera de esas peticiones el router no interviene
+        self.assertIsNone(router.db_for_read(Procedure))
+        self.assertEqual(router.db_for_write(Procedure), 'default')
+
+    def test_write_marker_is_shared_between_processes(self):
+        user = User.objects.create_user(username='jefa', password='clave-segura-123')
+        self.assertFalse(db_routers.wrote_recently(user))
+        db_routers.mark_write(user)
+        # Otro worker (otro objeto usuario, nada en memoria): la marca es una fila del primario
+        self.assertTrue(db_routers.wrote_recently(User.objects.get(pk=user.pk)))
+
+        past = timezone.now() - timedelta(seconds=settings.REPLICA_READ_YOUR_WRITES_SECONDS + 1)
+        Profile.objects.filter(user=user).update(last_write_at=past)
+        self.assertFalse(db_routers.wrote_recently(user))
+
+
+class StatelessReadAuthenticationTests(TestCase):
+    """Las lecturas del catálogo confían en los claims del token; revocar lo invalida."""
+
+    def setUp(self):
+        User.objects.create_user(username='lector', password='clave-segura-123')
+        self.client = APIClient(HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY)
+        self.tokens = self.client.post('/api/v1/token/', {'username': 'lector', 'password': 'clave-segura-123'}).data
+        self.client.credentials(
+            HTTP_X_APP_KEY=settings.REQUIRED_APP_KEY, HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}"
+        )
+
+    def test_reads_do_not_load_the_user(self):
+        self.client.get('/api/v1/categories/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries if 'auth_user' in q['sql']])
+
+    def test_revoked_token_is_rejected(self):
+        self.assertEqual(self.client.post('/api/v1/auth/revoke/').status_code, 204)
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, 401)
+
+    def revoke_elsewhere(self):
+        # Otro proceso revoca: cambia la fila, pero no la caché de este proceso
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, 200)
+        Profile.objects.filter(user__username='lector').update(token_version=F('token_version') + 1)
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, 200)
+
+    def test_refresh_checks_the_database(self):
+        self.revoke_elsewhere()
+        response = self.client.post('/api/v1/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_cached_version_expires(self):
+        self.revoke_elsewhere()
+        with mock.patch('django.core.cache.backends.locmem.time.time',
+                        return_value=time.time() + settings.TOKEN_VERSION_CACHE_SECONDS + 1):
+            self.assertEqual(self.client.get('/api/v1/categories/').status_code, 401)
+
+
+@override_settings(REQUIRED_APP_KEY='clave-actual', APP_KEYS=['clave-nueva'])
+class AppKeyMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_accepts_any_active_key_and_exempt_paths(self):
+        middleware = AppKeyMiddleware(lambda request: HttpResponse('ok'))
+        for key in ('clave-actual', 'clave-nueva'):
+            request = self.factory.get('/api/v1/categories/', HTTP_X_APP_KEY=key)
+            self.assertEqual(middleware(request).status_code, 200)
+        self.assertEqual(middleware(self.factory.get('/api/v1/categories/', HTTP_X_APP_KEY='vieja')).status_code, 401)
+        self.assertEqual(middleware(self.factory.get('/api/schema/')).status_code, 200)
+        self.assertEqual(middleware(self.factory.get('/otra/')).status_code, 200)
+
+    def test_async_chain(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        middleware = AppKeyMiddleware(get_response)
+        request = self.factory.get('/api/v1/categories/')
+        self.assertEqual(async_to_sync(middleware)(request).status_code, 401)
+
+
+class AsyncReadEndpointTests(TestCase):
+    """Las lecturas async devuelven lo mismo que los serializadores de los ViewSets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='lector', password='clave-segura-123')
+        cls.token = str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+        category = Category.objects.create(name='Operaciones')
+        cls.manual = Manual.objects.create(title='Manual de Operaciones', category=category)
+        for i in range(3):
+            Procedure.objects.create(manual=cls.manual, title=f'Paso {i}', content='...')
+
+    async def test_manual_detail_and_paginated_list(self):
+        client = AsyncClient()
+        headers = {'X-App-Key': settings.REQUIRED_APP_KEY, 'Authorization': f'Bearer {self.token}'}
+        response = await client.get(f'/api/v1/async/manuals/{self.manual.pk}/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['procedures']), 3)
+
+        response = await client.get('/api/v1/async/procedures/', {'page_size': 2}, headers=headers)
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        response = await client.get(data['next'], headers=headers)
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next'])
+
+        response = await client.get('/api/v1/async/manuals/999999/', headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+
+class SharedThrottleTests(TestCase):
+    """El contador del throttle vive en la base de datos, no en la memoria del worker."""
+
+    def test_fixed_window_counter(self):
+        self.assertEqual(throttling.hit('prueba:1', 10 ** 10), 1)
+        self.assertEqual(throttling.hit('prueba:1', 10 ** 10), 2)
+        self.assertEqual(ThrottleCounter.objects.get(key='prueba:1').count, 2)
+
+    @mock.patch.object(throttling.UserRateThrottle, 'THROTTLE_RATES', {'user': '2/day'})
+    def test_user_is_limited_across_instances(self):
+        throttle = throttling.UserRateThrottle()
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user(username='limitado', password='clave-segura-123')
+        # Cada instancia (o worker) ve el mismo contador
+        self.assertTrue(throttling.UserRateThrottle().allow_request(request, None))
+        self.assertTrue(throttling.UserRateThrottle().allow_request(request, None))
+        self.assertFalse(throttle.allow_request(request, None))
+        self.assertGreater(throttle.wait(), 0)
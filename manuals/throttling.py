@@ -0,0 +1,110 @@
+# manuals/throttling.py
+"""
+Throttles de DRF con contadores compartidos entre procesos.
+
+Los throttles de DRF guardan una lista de marcas de tiempo por usuario en la
+caché por defecto (memoria local de cada worker): con N workers de gunicorn
+cada usuario tiene N veces su cuota. Aquí el contador vive en la tabla
+`throttle_counters` de la base de datos, con ventana fija: cada comprobación
+es un único INSERT ... ON CONFLICT DO UPDATE ... RETURNING (SQLite >= 3.35 y
+PostgreSQL), sin servicios externos.
+
+Las filas de ventanas vencidas se borran de vez en cuando desde las propias
+comprobaciones (`THROTTLE_CLEANUP_PROBABILITY`).
+"""
+import random
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from rest_framework import throttling
+
+from .models import ThrottleCounter
+
+UPSERT_SQL = (
+    'INSERT INTO throttle_counters (key, count, expires_at) VALUES (%s, 1, %s) '
+    'ON CONFLICT (key) DO UPDATE SET count = throttle_counters.count + 1 '
+    'RETURNING count'
+)
+
+
+def hit(key, expires_at):
+    """Suma una petición al contador `key` y devuelve el total de la ventana."""
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL, [key, expires_at])
+            return cursor.fetchone()[0]
+    # Otros motores: dos consultas dentro de una transacción
+    with transaction.atomic():
+        counter, created = ThrottleCounter.objects.select_for_update().get_or_create(
+            key=key, defaults={'count': 1, 'expires_at': expires_at},
+        )
+        if created:
+            return 1
+        ThrottleCounter.objects.filter(key=key).update(count=F('count') + 1)
+        return counter.count + 1
+
+
+def cleanup(now=None):
+    return ThrottleCounter.objects.filter(expires_at__lt=now or time.time()).delete()[0]
+
+
+class SharedStoreMixin:
+    """Sustituye el historial en caché de SimpleRateThrottle por un contador de ventana fija."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        expires_at = (window + 1) * self.duration
+        count = hit(f'{self.key}:{window}', expires_at)
+        if random.random() < getattr(settings, 'THROTTLE_CLEANUP_PROBABILITY', 0.001):
+            cleanup(now)
+
+        if count > self.num_requests:
+            self.wait_seconds = expires_at - now
+            return False
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class AnonRateThrottle(SharedStoreMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SharedStoreMixin, throttling.UserRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(SharedStoreMixin, throttling.ScopedRateThrottle):
+
+    def get_scope(self, view):
+        return getattr(view, self.scope_attr, None)
+
+    def allow_request(self, request, view):
+        # Igual que en DRF, pero con el contador compartido
+        self.scope = self.get_scope(view)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+class ActionScopedRateThrottle(ScopedRateThrottle):
+    """
+    El scope depende de la acción del ViewSet:
+    `throttle_scopes = {'retrieve': 'manual_detail'}`. Las acciones sin scope
+    no se limitan (aparte de los throttles generales).
+    """
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
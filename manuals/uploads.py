@@ -0,0 +1,128 @@
+# manuals/uploads.py
+"""
+Utilidades para las subidas por partes (reanudables) de archivos adjuntos.
+
+Cada sesión escribe sus partes en un archivo parcial dentro de
+`CHUNKED_UPLOAD_DIR` (por defecto `uploads_tmp/` junto a MEDIA_ROOT, fuera de
+la carpeta pública). Como está en el mismo sistema de archivos que
+MEDIA_ROOT, al completarse se enlaza (enlace duro) a su destino final sin
+copiar bytes; el parcial se borra cuando se confirma la transacción.
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+
+# Tamaño de bloque usado al leer del request y al calcular la suma SHA-256
+BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadError(Exception):
+    """Error en una parte de la subida; `status` es el código HTTP a devolver."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def upload_dir():
+    default = os.path.join(os.path.dirname(os.path.normpath(settings.MEDIA_ROOT)), 'uploads_tmp')
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR', None) or default
+
+
+def partial_path(session):
+    return os.path.join(upload_dir(), f'{session.pk}.part')
+
+
+def create_partial_file(session):
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+
+
+def delete_partial_file(session):
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def parse_content_range(header, total_size):
+    """
+    Interpreta `Content-Range: bytes <inicio>-<fin>/<total>` y devuelve
+    (offset, longitud).
+    """
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError("Encabezado Content-Range ausente o inválido.")
+    start, end, total = match.groups()
+    start, end = int(start), int(end)
+    if end < start or (total != '*' and int(total) != total_size) or end >= total_size:
+        raise UploadError("El rango de la parte no coincide con el tamaño declarado.", status=416)
+    return start, end - start + 1
+
+
+def write_chunk(session, stream, offset, length):
+    """
+    Escribe hasta `length` bytes leídos de `stream` en la posición `offset`
+    del archivo parcial, en bloques de BLOCK_SIZE (nunca la parte entera en
+    memoria). Reenviar una parte ya recibida la sobrescribe; saltarse bytes
+    no está permitido. Devuelve cuántos bytes se escribieron.
+    """
+    if stream is None:
+        # Cuerpo vacío: DRF no crea el stream
+        raise UploadError("La parte no tiene contenido.")
+    if offset > session.received_bytes:
+        raise UploadError(
+            f"Parte fuera de orden: se esperaba el byte {session.received_bytes}.", status=409
+        )
+    written = 0
+    with open(partial_path(session), 'r+b') as partial:
+        partial.seek(offset)
+        partial.truncate(offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            partial.write(block)
+            written += len(block)
+    return written
+
+
+def file_sha256(path):
+    """Suma SHA-256 de un archivo leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PartialFile(File):
+    """
+    Archivo parcial ya completo. Expone `temporary_file_path()` para que
+    FileSystemStorage lo mueva a su destino en lugar de copiarlo.
+    """
+
+    def __init__(self, session, sha256=None):
+        self._path = partial_path(session)
+        # Hash ya calculado: el almacenamiento no necesita volver a leerlo
+        self.sha256 = sha256
+        super().__init__(open(self._path, 'rb'), name=session.filename)
+
+    def temporary_file_path(self):
+        # Lo que se mueve es un enlace duro: si después falla la transacción, el
+        # parcial sigue ahí y `complete` se puede reintentar.
+        link = f'{self._path}.{uuid.uuid4().hex}.link'
+        try:
+            os.link(self._path, link)
+        except OSError:
+            # Sistema de archivos sin enlaces duros
+            shutil.copyfile(self._path, link)
+        return link
@@ -2,17 +2,32 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, ManualViewSet, ProcedureViewSet, DocumentFileViewSet, UserRegisterView, UserProfileView
+from . import async_views
+from .views import CategoryViewSet, ManualViewSet, ProcedureViewSet, DocumentFileViewSet, UserRegisterView, UserProfileView, SearchView, UploadSessionViewSet, CacheStatsView, ExportView, LoginFailureStatsView, SyncView, TokenRevokeView
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet)
 router.register(r'manuals', ManualViewSet)
 router.register(r'procedures', ProcedureViewSet)
 router.register(r'files', DocumentFileViewSet)
+router.register(r'uploads', UploadSessionViewSet)
 
 
 urlpatterns = [
         path('', include(router.urls)),
         path('register/', UserRegisterView.as_view(), name='register'),
         path('profile/', UserProfileView.as_view(), name='user-profile'),
+        path('search/', SearchView.as_view(), name='search'),
+        path('sync/', SyncView.as_view(), name='sync'),
+        path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+        path('export/<str:kind>/', ExportView.as_view(), name='export'),
+        # Lecturas async (ASGI) del catálogo
+        path('async/categories/', async_views.category_list, name='async-category-list'),
+        path('async/categories/<int:pk>/', async_views.category_detail, name='async-category-detail'),
+        path('async/manuals/', async_views.manual_list, name='async-manual-list'),
+        path('async/manuals/<int:pk>/', async_views.manual_detail, name='async-manual-detail'),
+        path('async/procedures/', async_views.procedure_list, name='async-procedure-list'),
+        path('async/procedures/<int:pk>/', async_views.procedure_detail, name='async-procedure-detail'),
+        path('auth/revoke/', TokenRevokeView.as_view(), name='token-revoke'),
+        path('auth/failed-logins/', LoginFailureStatsView.as_view(), name='failed-login-stats'),
 ]
\ No newline at end of file
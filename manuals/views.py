@@ -1,32 +1,67 @@
 # manuals/views.py
-from rest_framework.throttling import UserRateThrottle
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated, AllowAny # Importa IsAuthenticated y AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser # Importa IsAuthenticated y AllowAny
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, Manual, Procedure, DocumentFile
+from .models import Category, Manual, Procedure, DocumentFile, UploadSession
 from .permissions import IsAdminOrReadOnly, IsEditor, IsViewer # Importa tus permisos personalizados
 from rest_framework import viewsets, generics, status
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .serializers import CategorySerializer, ManualSerializer,ManualListSerializer, UserProfileSerializer,ProcedureSerializer, DocumentFileSerializer, UserRegisterSerializer # Importa tu nuevo serializador
+from .serializers import CategorySerializer, ManualSerializer,ManualListSerializer, UserProfileSerializer,ProcedureSerializer, DocumentFileSerializer, DocumentFileHistorySerializer, UploadSessionSerializer, UserRegisterSerializer # Importa tu nuevo serializador
 
 from rest_framework.parsers import MultiPartParser, FormParser # Para manejar subida de archivos
 from rest_framework.decorators import action
 
-from rest_framework import filters
-
-
-class CategoryViewSet(viewsets.ModelViewSet):
+from rest_framework import filters, mixins
+from rest_framework.views import APIView
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from . import downloads, login_failures, uploads
+from .batch import BatchMixin
+from .db_routers import ReplicaReadMixin
+from .authentication import STATELESS_READ_AUTHENTICATION_CLASSES, ClaimsTokenObtainPairSerializer, revoke_tokens
+from .cache import CachedResponseMixin, get_stats
+from .conditional import ConditionalGetMixin
+from .fast_serializers import (CategoryFastSerializer, DocumentFileFastSerializer, FastListMixin,
+                               ManualListFastSerializer, ProcedureFastSerializer)
+from .streaming import StreamingListMixin, iter_objects, streaming_response
+from .sparse import SparseQuerysetMixin, query_list
+from .throttling import ActionScopedRateThrottle, AnonRateThrottle, ScopedRateThrottle, UserRateThrottle
+from . import sync
+from .search import FullTextSearchFilter, INDEXED_MODELS, search
+
+
+def latest_document_files_prefetch(lookup='document_files'):
+    """
+    Prefetch de los archivos vigentes (is_latest=True) con su autor ya unido,
+    para que los serializadores anidados no disparen una consulta por archivo.
+    """
+    return Prefetch(
+        lookup,
+        queryset=DocumentFile.objects.filter(is_latest=True).select_related('uploaded_by'),
+    )
+
+
+class CategoryViewSet(ReplicaReadMixin, StreamingListMixin, CachedResponseMixin, ConditionalGetMixin,
+                      SparseQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    fast_serializer_class = CategoryFastSerializer
+    cache_dependencies = (Category,)
     queryset = Category.objects.all()   
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly] # Solo admins pueden crear/editar, otros solo leer
+    authentication_classes = STATELESS_READ_AUTHENTICATION_CLASSES # Lecturas sin cargar el usuario
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['name']
     ordering_fields = ['name', 'created_at']
 
-class ManualViewSet(viewsets.ModelViewSet):
-    throttle_classes = [UserRateThrottle]
+class ManualViewSet(ReplicaReadMixin, BatchMixin, StreamingListMixin, CachedResponseMixin,
+                    ConditionalGetMixin, SparseQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    fast_serializer_class = ManualListFastSerializer
+    throttle_classes = [UserRateThrottle, ActionScopedRateThrottle]
+    throttle_scopes = {'retrieve': 'manual_detail'} # El detalle anida procedimientos y archivos
+    cache_dependencies = (Category, Manual, Procedure, DocumentFile)
    # queryset = Manual.objects.all()
     queryset = Manual.objects.all().select_related('category')
     def get_serializer_class(self):
@@ -35,24 +70,72 @@ class ManualViewSet(viewsets.ModelViewSet):
         return ManualSerializer
     serializer_class = ManualSerializer
     permission_classes = [IsAdminOrReadOnly] # Solo admins pueden crear/editar, otros solo leer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    authentication_classes = STATELESS_READ_AUTHENTICATION_CLASSES # Lecturas sin cargar el usuario
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_fields = ['category']
     search_fields = ['title', 'description']
     ordering_fields = ['title', 'created_at']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.wants('procedures'):
+            # ManualListSerializer no anida procedimientos (salvo ?expand=procedures)
+            # y el detalle puede excluirlos con ?fields=
+            return queryset
+        procedures = Prefetch('procedures', queryset=Procedure.objects.order_by('title', '-version'))
+        if self.action == 'list':
+            return queryset.prefetch_related(procedures)
+        # ManualSerializer anida procedimientos -> archivos -> autor:
+        # se resuelve todo en un número constante de consultas.
+        return queryset.prefetch_related(
+            procedures,
+            latest_document_files_prefetch('procedures__document_files'),
+        )
+
+    def perform_batch_update(self, instances, fields):
+        super().perform_batch_update(instances, fields)
+        if 'title' in fields:
+            # Lo que hace la señal sync_procedure_manual_title con cada save()
+            Procedure.objects.filter(manual__in=instances).update(
+                manual_title=Subquery(Manual.objects.filter(pk=OuterRef('manual_id')).values('title')[:1])
+            )
    
 
-class ProcedureViewSet(viewsets.ModelViewSet):
+class ProcedureViewSet(ReplicaReadMixin, BatchMixin, StreamingListMixin, CachedResponseMixin,
+                       ConditionalGetMixin, SparseQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    fast_serializer_class = ProcedureFastSerializer
+    cache_dependencies = (Category, Manual, Procedure, DocumentFile)
     # queryset = Procedure.objects.all()
-    queryset = Procedure.objects.all().select_related('manual').prefetch_related('document_files')
+    queryset = Procedure.objects.all().select_related('manual')
     serializer_class = ProcedureSerializer
     # Solo editores pueden crear/editar/eliminar, admins también, visualizadores solo leer.
     # El orden importa: se evalúan en orden. Si IsEditor falla, IsAdminOrReadOnly se evalúa.
     permission_classes = [IsEditor | IsAdminOrReadOnly] # O IsAdminUser para simplificar el admin
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    authentication_classes = STATELESS_READ_AUTHENTICATION_CLASSES # Lecturas sin cargar el usuario
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_fields = ['manual', 'version', 'last_reviewed']
     search_fields = ['title', 'content']
     ordering_fields = ['title', 'version', 'last_reviewed', 'created_at']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'manual' in query_list(self.request, 'expand'):
+            # ManualListSerializer muestra el nombre de la categoría
+            queryset = queryset.select_related('manual__category')
+        if self.wants('document_files'):
+            queryset = queryset.prefetch_related(latest_document_files_prefetch())
+        return queryset
+
+    def perform_batch_create(self, instances):
+        for instance in instances:
+            instance.manual_title = instance.manual.title # Lo que haría save()
+        super().perform_batch_create(instances)
+
+    def perform_batch_update(self, instances, fields):
+        for instance in instances:
+            instance.manual_title = instance.manual.title
+        super().perform_batch_update(instances, [*fields, 'manual_title'])
+
 # class DocumentFileViewSet(viewsets.ModelViewSet):
 #     queryset = DocumentFile.objects.all()
 #     serializer_class = DocumentFileSerializer
@@ -69,11 +152,17 @@ class ProcedureViewSet(viewsets.ModelViewSet):
 
 
 
-class DocumentFileViewSet(viewsets.ModelViewSet):
+class DocumentFileViewSet(ReplicaReadMixin, StreamingListMixin, CachedResponseMixin, ConditionalGetMixin,
+                          SparseQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    fast_serializer_class = DocumentFileFastSerializer
+    cache_dependencies = (Procedure, DocumentFile)
     queryset = DocumentFile.objects.all()
     serializer_class = DocumentFileSerializer
     parser_classes = (MultiPartParser, FormParser) # Para recibir archivos
     permission_classes = [IsAuthenticated] # Ajusta permisos según tu lógica
+    authentication_classes = STATELESS_READ_AUTHENTICATION_CLASSES # Lecturas sin cargar el usuario
+    throttle_classes = [AnonRateThrottle, UserRateThrottle, ActionScopedRateThrottle]
+    throttle_scopes = {'create': 'files_upload', 'update': 'files_upload', 'partial_update': 'files_upload'}
 
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['procedure']
@@ -81,8 +170,13 @@ class DocumentFileViewSet(viewsets.ModelViewSet):
     ordering_fields = ['uploaded_at', 'version_number']
 
     def get_queryset(self):
+        if self.action == 'download':
+            # Cualquier versión del historial se puede descargar
+            return super().get_queryset()
         # Por defecto, solo mostrar la última versión de cada documento
         queryset = super().get_queryset().filter(is_latest=True).select_related('uploaded_by')
+        if 'procedure' in query_list(self.request, 'expand'):
+            queryset = queryset.select_related('procedure')
         # Puedes añadir más filtros aquí, ej. por `procedure_id` si el ViewSet no es anidado
         return queryset
 
@@ -98,31 +192,15 @@ class DocumentFileViewSet(viewsets.ModelViewSet):
         new_file = self.request.FILES.get('file')
         
         if new_file:
-            # Si se ha subido un NUEVO archivo:
-            # 1. Marcar la versión actual como NO la más reciente
-            instance.is_latest = False
-            instance.save(update_fields=['is_latest']) # Guardar solo este campo
-
-            # 2. Crear una NUEVA instancia de DocumentFile para la nueva versión
+            # Si se ha subido un NUEVO archivo se crea una nueva versión
+            # (la actual deja de ser la más reciente).
             new_version_data = serializer.validated_data # Datos validados del request
-            
-            # Aseguramos que los campos 'file' no estén en validated_data para evitar conflicto
-            # ya que lo vamos a pasar directamente a la nueva_version.file
-            if 'file' in new_version_data:
-                new_version_data.pop('file')
-
-            # Copiar datos relevantes de la versión anterior a la nueva
-            new_version_instance = DocumentFile(
-                procedure=instance.procedure,
-                title=new_version_data.get('title', instance.title), # Usa nuevo título o el anterior
-                description=new_version_data.get('description', instance.description), # Nueva descripción o anterior
+            new_version_instance = instance.create_new_version(
                 file=new_file, # El nuevo archivo subido
                 uploaded_by=self.request.user,
-                version_number=instance.version_number + 1, # Incrementa la versión
-                is_latest=True, # Esta es la nueva última versión
-                previous_version=instance # Enlaza a la versión anterior (la que era "latest")
+                title=new_version_data.get('title'), # Usa nuevo título o el anterior
+                description=new_version_data.get('description'), # Nueva descripción o anterior
             )
-            new_version_instance.save()
             serializer.instance = new_version_instance # Actualiza la instancia del serializador para la respuesta
         else:
             # Si NO se sube un nuevo archivo, solo se actualizan los metadatos de la versión actual
@@ -130,25 +208,31 @@ class DocumentFileViewSet(viewsets.ModelViewSet):
             # Si se permite actualizar metadatos y el archivo, la lógica sería más compleja
             super().perform_update(serializer) # Actualiza la instancia actual (metadata)
 
+    # --- Descarga protegida, con soporte de Range y ETag ---
+    @action(detail=True, methods=['get'], url_path='download')
+    def download(self, request, pk=None):
+        document_file = self.get_object()
+        if not document_file.file:
+            return Response({"detail": "Este documento no tiene archivo."}, status=status.HTTP_404_NOT_FOUND)
+        as_attachment = request.query_params.get('inline') not in ('1', 'true')
+        return downloads.serve_document(request, document_file, as_attachment=as_attachment)
+
     # --- Acción personalizada para obtener el historial de un documento ---
     @action(detail=True, methods=['get'], url_path='history')
     def history(self, request, pk=None):
         document_file = self.get_object() # Obtiene la versión actual (is_latest=True)
 
-        # Recopila todas las versiones anteriores de esta "serie" de documentos
-        versions = [document_file]
-        current_version = document_file.previous_version
-        while current_version:
-            versions.append(current_version)
-            current_version = current_version.previous_version
-        
-        # Ordena las versiones de la más reciente a la más antigua para el historial
-        versions.sort(key=lambda x: x.version_number, reverse=True)
+        # Todas las versiones de la serie en una sola consulta indexada
+        # (series_id, -version_number), con el autor ya unido.
+        versions = DocumentFile.objects.filter(
+            series_id=document_file.series_id
+        ).select_related('uploaded_by')
 
-        # Opcional: Podrías querer incluir la siguiente versión para visualización en el historial también
-        # if document_file.next_version: # Si existe una 'next_version'
-        #     # Manejar lógica si 'next_version' es parte de la cadena o para mostrar futuros cambios
-        #     pass
+        # Los historiales muy largos se paginan igual que los listados
+        page = self.paginate_queryset(versions)
+        if page is not None:
+            serializer = DocumentFileHistorySerializer(page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
 
         serializer = DocumentFileHistorySerializer(versions, many=True, context={'request': request})
         return Response(serializer.data)
@@ -180,6 +264,217 @@ class DocumentFileViewSet(viewsets.ModelViewSet):
 
 
 
+
+
+# --- Subidas por partes (reanudables) de archivos adjuntos ---
+class UploadSessionViewSet(ReplicaReadMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.ListModelMixin, mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    1. POST   /uploads/                  -> crea la sesión (procedure o document, filename, total_size)
+    2. PUT    /uploads/{id}/             -> envía una parte (cuerpo binario + Content-Range)
+    3. GET    /uploads/{id}/             -> consulta `received_bytes` para reanudar
+    4. POST   /uploads/{id}/complete/    -> verifica la suma SHA-256 y crea el DocumentFile
+    DELETE /uploads/{id}/ cancela la subida y borra el archivo parcial.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    # Una subida grande son muchas peticiones: tiene su propia cuota
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'uploads'
+
+    def get_queryset(self):
+        # Cada usuario solo ve sus propias sesiones
+        return super().get_queryset().filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        session = serializer.save(user=self.request.user)
+        uploads.create_partial_file(session)
+
+    def perform_destroy(self, instance):
+        uploads.delete_partial_file(instance)
+        instance.delete()
+
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.is_complete:
+            return Response({"detail": "La subida ya fue completada."}, status=status.HTTP_409_CONFLICT)
+        try:
+            offset, length = uploads.parse_content_range(request.headers.get('Content-Range'), session.total_size)
+            max_chunk = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+            if length > max_chunk:
+                raise uploads.UploadError(f"Cada parte puede tener como máximo {max_chunk} bytes.", status=413)
+            # Se lee directamente del stream del request, sin pasar por los parsers
+            written = uploads.write_chunk(session, request.stream, offset, length)
+        except uploads.UploadError as exc:
+            return Response({"detail": exc.message}, status=exc.status)
+
+        session.received_bytes = offset + written
+        session.save(update_fields=['received_bytes', 'updated_at'])
+        if written < length:
+            return Response(
+                {"detail": "La parte recibida es más corta de lo indicado en Content-Range.",
+                 "received_bytes": session.received_bytes},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        if session.is_complete:
+            # Reintento de un "complete" ya procesado
+            return Response(DocumentFileSerializer(session.result, context={'request': request}).data)
+        if session.received_bytes != session.total_size:
+            return Response(
+                {"detail": f"Faltan datos: recibidos {session.received_bytes} de {session.total_size} bytes."},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        digest = uploads.file_sha256(uploads.partial_path(session))
+        expected = request.data.get('sha256')
+        if expected and expected.lower() != digest:
+            return Response(
+                {"detail": "La suma SHA-256 no coincide con el archivo recibido.", "sha256": digest},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            partial = uploads.PartialFile(session, sha256=digest)
+            try:
+                if session.document:
+                    current = DocumentFile.objects.select_for_update().get(pk=session.document_id)
+                    if not current.is_latest:
+                        return Response(
+                            {"detail": "El documento tiene una versión más reciente."},
+                            status=status.HTTP_409_CONFLICT
+                        )
+                    document = current.create_new_version(
+                        file=partial,
+                        uploaded_by=request.user,
+                        title=session.title or None,
+                        description=session.description,
+                    )
+                else:
+                    document = DocumentFile.objects.create(
+                        procedure=session.procedure,
+                        title=session.title,
+                        description=session.description,
+                        file=partial,
+                        uploaded_by=request.user,
+                        version_number=1,
+                        is_latest=True,
+                    )
+            finally:
+                partial.close()
+            session.sha256 = digest
+            session.result = document
+            session.save(update_fields=['sha256', 'result', 'updated_at'])
+            # Hasta el commit se conserva: si algo falla, el reintento lo necesita
+            transaction.on_commit(lambda: uploads.delete_partial_file(session))
+
+        return Response(
+            DocumentFileSerializer(document, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+# --- Métricas de la caché de respuestas ---
+class CacheStatsView(APIView):
+    """
+    GET /api/v1/cache/stats/ -> aciertos y fallos de la caché por endpoint (solo staff).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats(['category', 'manual', 'procedure', 'documentfile']))
+
+
+class LoginFailureStatsView(APIView):
+    """
+    GET /api/v1/auth/failed-logins/ -> contadores de logins fallidos de este proceso (solo staff).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(login_failures.recorder.stats())
+
+
+# --- Exportación completa (NDJSON en streaming) ---
+class ExportView(APIView):
+    """
+    GET /api/v1/export/<tipo>/ -> todas las filas de categories, manuals,
+    procedures o files (todas las versiones), un objeto JSON por línea (solo staff).
+    """
+    permission_classes = [IsAdminUser]
+    exports = {
+        'categories': (Category.objects.all(), CategoryFastSerializer),
+        'manuals': (Manual.objects.all(), ManualListFastSerializer),
+        'procedures': (Procedure.objects.all(), ProcedureFastSerializer),
+        'files': (DocumentFile.objects.all(), DocumentFileFastSerializer),
+    }
+
+    def get(self, request, kind):
+        if kind not in self.exports:
+            return Response({"detail": f"Tipo de exportación inválido: {kind}."}, status=status.HTTP_404_NOT_FOUND)
+        queryset, serializer_class = self.exports[kind]
+        objects = iter_objects(queryset.order_by('pk'), serializer_class(request))
+        return streaming_response(objects, ndjson=True, filename=f'{kind}.ndjson')
+
+
+# --- Sincronización delta para la app móvil ---
+class SyncView(APIView):
+    """
+    GET /api/v1/sync/[?since=<token>]
+
+    Sin `since` devuelve el catálogo completo; con el token de la respuesta
+    anterior, solo lo creado, modificado o borrado desde entonces.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = STATELESS_READ_AUTHENTICATION_CLASSES
+
+    def get(self, request):
+        token = request.query_params.get('since')
+        since = None
+        if token:
+            try:
+                since = sync.read_token(token)
+            except sync.InvalidSyncToken:
+                return Response(
+                    {"detail": "Token de sincronización inválido. Realice una sincronización completa."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return Response(sync.build_changes(since, {'request': request}))
+
+
+# --- Búsqueda de texto completo ---
+class SearchView(APIView):
+    """
+    GET /api/v1/search/?q=<texto>[&type=manual,procedure][&limit=20]
+
+    Busca en manuales y procedimientos usando el índice de texto completo y
+    devuelve los resultados ordenados por relevancia con fragmentos resaltados.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = STATELESS_READ_AUTHENTICATION_CLASSES
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        unknown = [kind for kind in kinds if kind not in INDEXED_MODELS]
+        if unknown:
+            return Response(
+                {"detail": f"Tipo de búsqueda inválido: {', '.join(unknown)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        limit = max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+        return Response({"query": query, "results": search(query, kinds, limit)})
 
 
 # --- Nueva Vista de Registro de Usuario ---
@@ -199,8 +494,7 @@ class UserRegisterView(generics.CreateAPIView):
         # Por ahora, solo devolveremos un mensaje de éxito.
 
         # Si quieres auto-login y devolver tokens:
-        from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-        token_serializer = TokenObtainPairSerializer(data={
+        token_serializer = ClaimsTokenObtainPairSerializer(data={
             'username': user.username,
             'password': request.data['password'] # Usa la contraseña directamente
         })
@@ -228,4 +522,15 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         # Esta función asegura que el usuario solo pueda ver/editar su propio perfil
-        return self.request.user
\ No newline at end of file
+        return self.request.user
+
+class TokenRevokeView(APIView):
+    """
+    POST /api/v1/auth/revoke/ -> invalida todos los tokens del usuario
+    (cerrar sesión en todos los dispositivos).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        revoke_tokens(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)